@@ -0,0 +1,136 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# bench_columns:
+#
+# rows per second formatting N decoded changes for the default columns:
+# with the per cell if/elif chain that used to format them, first from
+# the decoded JSON and then from Change records, and with the compiled
+# plan.
+#
+#     python benchmarks/bench_columns.py [N]
+#
+
+import os
+import random
+import sys
+import time
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_root, 'gerrit_cli'))
+
+import gerrit_query  # noqa
+
+
+def _reviews(n):
+    r = random.Random(0)
+    now = int(time.time())
+    return [{'number': str(i),
+             'project': 'project-%d' % r.randint(0, 199),
+             'owner': {'name': 'User %d' % r.randint(0, 499)},
+             'subject': 'change %d\tof many ' % i * r.randint(1, 8),
+             'lastUpdated': now - r.randint(0, 86400 * 30),
+             'branch': 'master'} for i in range(n)]
+
+
+def _per_cell(now, column, review):
+    # a cell as it was formatted before the compiled plan
+    field = column.get('name')
+    length = column.get('length')
+
+    if field == 'number':
+        return int(review.get(field))
+
+    if field == 'age':
+        data = gerrit_query._format_age(now - int(review.get('lastUpdated')))
+    elif field == 'subject':
+        data = review.get('subject').replace('\t', '   ')
+    elif field == 'owner':
+        o = review.get('owner')
+        data = o.get('name', o.get('username', o.get('email')))
+    else:
+        data = review.get(field)
+
+    if length > 0 and len(data) > length:
+        data = data[0:length - 3] + "..."
+
+    return data
+
+
+def _per_cell_change(now, column, change):
+    # a cell as it was formatted from a Change before the compiled plan
+    field = column.get('name')
+    length = column.get('length')
+
+    if field == 'number':
+        return change.number
+
+    if field == 'age':
+        data = gerrit_query._format_age(now - change.last_updated)
+    elif field == 'subject':
+        data = change.subject
+    elif field == 'owner':
+        data = change.owner
+    else:
+        data = change.fields.get(field)
+
+    if length > 0 and len(data) > length:
+        data = data[0:length - 3] + "..."
+
+    return data
+
+
+def _before(reviews, show, now):
+    return [[_per_cell(now, column, review) for column in show]
+            for review in reviews]
+
+
+def _before_change(reviews, show, now):
+    names = [column.get('name') for column in show]
+    return [[_per_cell_change(now, column, change) for column in show]
+            for change in (gerrit_query.Change(review, names)
+                           for review in reviews)]
+
+
+def _after(reviews, show, now):
+    names = [column.get('name') for column in show]
+    plan = gerrit_query.compile_show(show)
+    return [[cell(now, change) for cell in plan]
+            for change in (gerrit_query.Change(review, names)
+                           for review in reviews)]
+
+
+def main(argv):
+    n = int(argv[0]) if len(argv) > 0 else 100000
+    reviews = _reviews(n)
+    show = gerrit_query.construct_show(
+        ['number:r', 'project:l', 'owner:l', 'subject:l:80', 'age:r',
+         'branch:c'], None)
+    now = time.time()
+
+    rows = {}
+    for label, fn in [('json', _before), ('change', _before_change),
+                      ('plan', _after)]:
+        start = time.time()
+        rows[label] = fn(reviews, show, now)
+        elapsed = time.time() - start
+        print("%-8s %6.2fs  %8.0f rows/s" % (label, elapsed, n / elapsed))
+
+    assert rows['json'] == rows['change'] == rows['plan']
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
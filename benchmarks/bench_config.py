@@ -0,0 +1,89 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# bench_config:
+#
+# time loading a configuration file with N commented aliases: parsed and
+# expanded from scratch, and from its compiled copy.
+#
+#     python benchmarks/bench_config.py [N]
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_root, 'gerrit_cli'))
+
+import gerrit  # noqa
+import gerrit_query  # noqa
+
+
+def _write(path, n):
+    # n aliases, each built on one of a few filter aliases like the
+    # trove-filter in the sample configuration.
+    with open(path, 'w') as f:
+        f.write('{\n    "host": "review.example.com",\n    "port": 29418,\n')
+        f.write('    "queries": {\n')
+        for i in range(20):
+            f.write('        "filter-%d": ["(%s)"],\n' % (i, ' OR '.join(
+                'project:openstack/project-%d-%d' % (i, j) for j in range(5))))
+        for i in range(n):
+            f.write('        # alias %d, open changes in filter %d\n' %
+                    (i, i % 20))
+            f.write('        "q%d": ["filter-%d", "status:open", '
+                    '"NOT label:Code-Review>=-2,self"],\n' % (i, i % 20))
+        f.write('        "all": [%s]\n    }\n}\n' %
+                ', '.join('"q%d"' % i for i in range(0, n, 50)))
+
+
+def _time(fn, repeat=20):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        fn()
+        times.append(time.time() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main(argv):
+    n = int(argv[0]) if len(argv) > 0 else 1000
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'gerrit-cli.json')
+    cache = os.path.join(tmpdir, 'compiled')
+
+    def parse():
+        config = gerrit.load_configuration(path)
+        config['aliases'] = gerrit_query.alias_tables(config)
+
+    try:
+        _write(path, n)
+        gerrit.load_compiled_configuration(path, cache)
+
+        print("%d aliases, %.0fKB" % (n, os.path.getsize(path) / 1024.0))
+        print("parsed    median %7.2fms" % (_time(parse) * 1000))
+        print("compiled  median %7.2fms" % (_time(
+            lambda: gerrit.load_compiled_configuration(path, cache)) * 1000))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
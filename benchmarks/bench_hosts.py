@@ -0,0 +1,71 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# bench_hosts:
+#
+# the same query run against H hosts served by tests/fake_ssh.py, one
+# host after another and fanned out to all of them at once.
+#
+#     python benchmarks/bench_hosts.py [H] [handshake-seconds]
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_root, 'gerrit_cli'))
+
+import gerrit_hosts  # noqa
+import gerrit_ssh  # noqa
+
+FAKE_SSH = os.path.join(_root, 'tests', 'fake_ssh.py')
+
+
+def _fetch(config):
+    return gerrit_ssh.GerritSSH(config).query_stream(['status:open'])
+
+
+def main(argv):
+    n = int(argv[0]) if len(argv) > 0 else 4
+    os.environ['FAKE_SSH_HANDSHAKE'] = argv[1] if len(argv) > 1 else '0.2'
+
+    tmpdir = tempfile.mkdtemp()
+    config = {'port': 29418, 'ssh-command': FAKE_SSH,
+              'ssh-control-dir': tmpdir, 'ssh-multiplex': False,
+              'hosts': dict(('host-%d' % i, {'host': 'h%d.example.com' % i})
+                            for i in range(n))}
+    hosts = gerrit_hosts.host_configs(config)
+
+    print("%d hosts, %ss simulated handshake" %
+          (n, os.environ['FAKE_SSH_HANDSHAKE']))
+    try:
+        start = time.time()
+        for name, c in hosts:
+            list(_fetch(c))
+        print("one at a time %.2fs" % (time.time() - start))
+
+        start = time.time()
+        list(gerrit_hosts.fan_out(hosts, _fetch))
+        print("fanned out    %.2fs" % (time.time() - start))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
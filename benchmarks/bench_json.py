@@ -0,0 +1,122 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# bench_json:
+#
+# decode a synthetic N change result, as returned for --patch-sets
+# --all-approvals, with each installed JSON backend, eagerly and lazily.
+#
+#     python benchmarks/bench_json.py [N]
+#
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_root, 'gerrit_cli'))
+
+import gerrit_json  # noqa
+import gerrit_query  # noqa
+
+
+def _approval(r, now):
+    return {'type': r.choice(['Code-Review', 'Verified', 'Workflow']),
+            'description': 'Code-Review',
+            'value': str(r.randint(-1, 1)),
+            'grantedOn': now - r.randint(0, 86400),
+            'by': {'name': 'User %d' % r.randint(0, 499),
+                   'email': 'user@example.com',
+                   'username': 'user-%d' % r.randint(0, 499)}}
+
+
+def _patchset(r, now, n):
+    return {'number': str(n),
+            'revision': '%040x' % r.getrandbits(160),
+            'parents': ['%040x' % r.getrandbits(160)],
+            'ref': 'refs/changes/00/0/%d' % n,
+            'uploader': {'name': 'User', 'username': 'user'},
+            'createdOn': now - r.randint(0, 86400),
+            'author': {'name': 'User', 'username': 'user'},
+            'isDraft': False,
+            'kind': 'REWORK',
+            'approvals': [_approval(r, now) for i in range(r.randint(0, 6))],
+            'sizeInsertions': r.randint(0, 500),
+            'sizeDeletions': -r.randint(0, 500)}
+
+
+def _write(path, n):
+    r = random.Random(0)
+    now = int(time.time())
+    with open(path, 'w') as f:
+        for i in range(1, n + 1):
+            patchsets = [_patchset(r, now, p)
+                         for p in range(1, r.randint(1, 5) + 1)]
+            f.write(json.dumps({
+                'project': 'project-%d' % r.randint(0, 199),
+                'branch': 'master',
+                'id': 'I%040x' % r.getrandbits(160),
+                'number': str(i),
+                'subject': 'change %d' % i,
+                'owner': {'name': 'User', 'username': 'user'},
+                'url': 'https://review.example.com/%d' % i,
+                'createdOn': now - r.randint(0, 86400 * 30),
+                'lastUpdated': now - r.randint(0, 86400),
+                'open': True,
+                'status': 'NEW',
+                'patchSets': patchsets,
+                'currentPatchSet': patchsets[-1]}) + '\n')
+        f.write(json.dumps({'type': 'stats', 'rowCount': n}) + '\n')
+
+
+def _time(path, fn):
+    with open(path) as f:
+        start = time.time()
+        rows = fn(f)
+        return rows, time.time() - start
+
+
+def main(argv):
+    n = int(argv[0]) if len(argv) > 0 else 50000
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'changes.json')
+    show = gerrit_query.construct_show(['number:r', 'subject:l', 'age:r'],
+                                       None)
+
+    try:
+        _write(path, n)
+        print("%d changes, %.1fMB" % (n, os.path.getsize(path) / 1048576.0))
+
+        for name in gerrit_json.available():
+            gerrit_json.use(name)
+            rows, eager = _time(path, lambda f: sum(1 for r in (
+                gerrit_query.iter_results(f))))
+            rows, lazy = _time(path, lambda f: sum(1 for r in (
+                gerrit_query.iter_results(f, lazy=True))))
+            rows, output = _time(path, lambda f: sum(1 for r in (
+                gerrit_query.iter_output(f, show))))
+            print("%-10s decode %6.2fs  lazy %6.2fs  format %6.2fs  "
+                  "(%d rows)" % (name, eager, lazy, output, rows))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
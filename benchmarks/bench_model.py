@@ -0,0 +1,75 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# bench_model:
+#
+# the memory held by a synthetic N change result kept as decoded JSON
+# (process_results) and as Change records for the default columns.
+#
+#     python benchmarks/bench_model.py [N]
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_root, 'gerrit_cli'))
+sys.path.insert(0, os.path.join(_root, 'benchmarks'))
+
+import bench_json  # noqa
+import gerrit_query  # noqa
+
+
+def _measure(path, fn):
+    with open(path) as f:
+        tracemalloc.start()
+        start = time.time()
+        held = fn(f)
+        elapsed = time.time() - start
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return len(held), size, peak, elapsed
+
+
+def main(argv):
+    n = int(argv[0]) if len(argv) > 0 else 50000
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'changes.json')
+    show = gerrit_query.construct_show(
+        ['number:r', 'project:l', 'owner:l', 'subject:l:80', 'state',
+         'age:r'], None)
+
+    try:
+        bench_json._write(path, n)
+        for label, fn in [
+                ('dicts', lambda f: list(gerrit_query.iter_results(f))),
+                ('changes', lambda f: list(gerrit_query.iter_changes(
+                    f, show)))]:
+            rows, size, peak, elapsed = _measure(path, fn)
+            print("%-8s %6d rows  held %7.1fMB  peak %7.1fMB  %6.2fs" %
+                  (label, rows, size / 1048576.0, peak / 1048576.0,
+                   elapsed))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
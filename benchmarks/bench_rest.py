@@ -0,0 +1,74 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# bench_rest:
+#
+# N queries, and N reviews, over the REST transport against
+# tests/fake_gerrit_http.py, with a new connection for every request and
+# with connections kept alive and reused.
+#
+#     python benchmarks/bench_rest.py [N] [handshake-seconds]
+#
+
+import os
+import sys
+import time
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_root, 'gerrit_cli'))
+sys.path.insert(0, os.path.join(_root, 'tests'))
+
+from fake_gerrit_http import change  # noqa
+from fake_gerrit_http import FakeGerrit  # noqa
+import gerrit_rest  # noqa
+
+
+def _run(fake, url, n):
+    config = {'rest-url': url}
+    start = time.time()
+    for i in range(n):
+        list(gerrit_rest.GerritREST(config).query_stream(['status:open']))
+    gerrit_rest.GerritREST(config).review(
+        ['%d,1' % (i % 50 + 1) for i in range(n)], ['LGTM'], '+1', None)
+    return time.time() - start
+
+
+def main(argv):
+    n = int(argv[0]) if len(argv) > 0 else 50
+    fake = FakeGerrit([change(i) for i in range(1, 51)], page_size=100)
+    fake.handshake = float(argv[1]) if len(argv) > 1 else 0.02
+    url = fake.start()
+
+    print("%d queries and %d reviews, %ss simulated handshake" %
+          (n, n, fake.handshake))
+    try:
+        size = gerrit_rest._POOL_SIZE
+        gerrit_rest._POOL_SIZE = 0
+        elapsed = _run(fake, url, n)
+        print("new connections %.2fs (%d connections)" %
+              (elapsed, fake.connections))
+
+        gerrit_rest._POOL_SIZE = size
+        fake.connections = 0
+        elapsed = _run(fake, url, n)
+        print("kept alive      %.2fs (%d connections)" %
+              (elapsed, fake.connections))
+    finally:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
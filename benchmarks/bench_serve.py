@@ -0,0 +1,111 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# bench_serve:
+#
+# latency of R runs of 'gerrit-cli ls' listing N changes from
+# tests/fake_ssh.py, run cold by each command and forwarded to a running
+# 'gerrit-cli serve'.
+#
+#     python benchmarks/bench_serve.py [R] [N] [handshake-seconds]
+#
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GERRIT = os.path.join(_root, 'gerrit_cli', 'gerrit.py')
+FAKE_SSH = os.path.join(_root, 'tests', 'fake_ssh.py')
+
+
+def _write_output(path, n):
+    now = int(time.time())
+    with open(path, 'w') as f:
+        for i in range(n):
+            f.write(json.dumps({
+                'number': str(1000 + i), 'project': 'project-%d' % (i % 20),
+                'owner': {'name': 'User %d' % (i % 50)},
+                'subject': 'change %d' % i, 'lastUpdated': now - i * 60,
+                'currentPatchSet': {'approvals': [
+                    {'type': 'Code-Review', 'value': str(i % 5 - 2)}]}}))
+            f.write('\n')
+        f.write('{"type":"stats","rowCount":%d}\n' % n)
+
+
+def _time(argv, env, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([sys.executable, GERRIT] + argv,
+                                  stdout=devnull, env=env)
+        times.append(time.time() - start)
+
+    times.sort()
+    return times[len(times) // 2], times[0]
+
+
+def main(argv):
+    repeat = int(argv[0]) if len(argv) > 0 else 20
+    n = int(argv[1]) if len(argv) > 1 else 100
+
+    tmpdir = tempfile.mkdtemp()
+    config = os.path.join(tmpdir, 'gerrit-cli.json')
+    output = os.path.join(tmpdir, 'output')
+    socket = os.path.join(tmpdir, 'serve.sock')
+
+    with open(config, 'w') as f:
+        json.dump({'host': 'review.example.com', 'port': 29418,
+                   'ssh-command': FAKE_SSH, 'ssh-control-dir': tmpdir}, f)
+    _write_output(output, n)
+
+    env = dict(os.environ)
+    env.update({'HOME': tmpdir, 'GERRIT_CLI_SOCKET': socket,
+                'FAKE_SSH_OUTPUT': output,
+                'FAKE_SSH_HANDSHAKE': argv[2] if len(argv) > 2 else '0.05'})
+    ls = ['--config-file', config, 'ls', '--no-cache',
+          '--output-format', 'CSV', 'status:open']
+
+    print("%d runs of ls listing %d changes, %ss simulated handshake" %
+          (repeat, n, env['FAKE_SSH_HANDSHAKE']))
+
+    server = None
+    try:
+        print("cold      median=%.1fms best=%.1fms" %
+              tuple(1000 * t for t in _time(ls, env, repeat)))
+
+        server = subprocess.Popen([sys.executable, GERRIT, '--config-file',
+                                   config, 'serve'],
+                                  stdout=subprocess.PIPE, env=env)
+        server.stdout.readline()
+
+        print("forwarded median=%.1fms best=%.1fms" %
+              tuple(1000 * t for t in _time(ls, env, repeat)))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,78 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# bench_ssh_multiplex:
+#
+# one query followed by N reviews (what an abandon of N changes does) run
+# against tests/fake_ssh.py, with and without a shared control master.
+#
+#     python benchmarks/bench_ssh_multiplex.py [N] [handshake-seconds]
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_root, 'gerrit_cli'))
+
+import gerrit_ssh  # noqa
+
+FAKE_SSH = os.path.join(_root, 'tests', 'fake_ssh.py')
+
+
+def _run(n, multiplex):
+    tmpdir = tempfile.mkdtemp()
+    log = os.path.join(tmpdir, 'log')
+    os.environ['FAKE_SSH_LOG'] = log
+
+    config = {'host': 'review.example.com', 'port': 29418,
+              'ssh-command': FAKE_SSH, 'ssh-control-dir': tmpdir,
+              'ssh-multiplex': multiplex}
+
+    try:
+        start = time.time()
+        session = gerrit_ssh.GerritSSH(config)
+        session.query(['status:open'])
+        for i in range(n):
+            session.abandon('%040x' % i, ['abandoned'], None, None)
+        gerrit_ssh._close_masters()
+        elapsed = time.time() - start
+
+        with open(log) as f:
+            handshakes = len([e for e in f if e.startswith('handshake')])
+    finally:
+        shutil.rmtree(tmpdir)
+
+    return handshakes, elapsed
+
+
+def main(argv):
+    n = int(argv[0]) if len(argv) > 0 else 100
+    os.environ['FAKE_SSH_HANDSHAKE'] = argv[1] if len(argv) > 1 else '0.05'
+
+    print("%d commands, %ss simulated handshake" %
+          (n + 1, os.environ['FAKE_SSH_HANDSHAKE']))
+    for multiplex in (False, True):
+        handshakes, elapsed = _run(n, multiplex)
+        print("multiplex=%-5s handshakes=%4d wall=%.2fs" %
+              (multiplex, handshakes, elapsed))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,82 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# bench_state:
+#
+# format the state column of N synthetic changes with the per change loop
+# that used to format it, and in batches with and without NumPy.
+#
+#     python benchmarks/bench_state.py [N]
+#
+
+import os
+import random
+import sys
+import time
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_root, 'gerrit_cli'))
+
+import gerrit_tally  # noqa
+
+
+def _votes(n):
+    r = random.Random(0)
+    return [[{'type': r.choice(['Code-Review', 'Verified', 'Workflow']),
+              'value': str(r.randint(-1, 1))}
+             for j in range(r.randint(0, 8))] for i in range(n)]
+
+
+def _per_change(approvals):
+    # the state column as it was formatted before gerrit_tally
+    _code_review = [0, 0, 0, 0, 0]
+    _verified = [0, 0, 0, 0, 0]
+    _workflow = [0, 0, 0]
+
+    for approval in approvals:
+        if approval.get('type') == 'Code-Review':
+            _code_review[int(approval.get('value')) + 2] += 1
+        elif approval.get('type') == 'Workflow':
+            _workflow[int(approval.get('value')) + 1] += 1
+        elif approval.get('type') == 'Verified':
+            _verified[int(approval.get('value')) + 2] += 1
+
+    return "R:%s W:%s V:%s" % (str(_code_review).replace(' ', ''),
+                               str(_workflow).replace(' ', ''),
+                               str(_verified).replace(' ', ''))
+
+
+def main(argv):
+    n = int(argv[0]) if len(argv) > 0 else 50000
+    votes = _votes(n)
+
+    for label, fn in [
+            ('per change', lambda: [_per_change(v) for v in votes]),
+            ('batched, array', lambda: gerrit_tally.format_states(
+                votes, use_numpy=False)),
+            ('batched, numpy', lambda: gerrit_tally.format_states(
+                votes, use_numpy=True))]:
+        if label.endswith('numpy') and gerrit_tally.numpy is None:
+            continue
+        start = time.time()
+        fn()
+        elapsed = time.time() - start
+        print("%-16s %6.2fs  %8.0f changes/s" %
+              (label, elapsed, n / elapsed))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,93 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# bench_store:
+#
+# load N synthetic changes into a ChangeStore and time lookups of common
+# ls queries against it.
+#
+#     python benchmarks/bench_store.py [N]
+#
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_root, 'gerrit_cli'))
+
+import gerrit_store  # noqa
+
+QUERIES = [
+    ['project:project-17'],
+    ['owner:user-42'],
+    ['project:project-3', 'owner:user-7'],
+    ['(project:project-1 OR project:project-2)', 'branch:stable'],
+    ['project:project-5', '-age:1d'],
+    ['project:project-9', 'label:Code-Review+2'],
+    ['project:project-11', 'NOT label:Code-Review>=-2,user-3'],
+]
+
+
+def _changes(n):
+    r = random.Random(0)
+    now = int(time.time())
+    for i in range(1, n + 1):
+        yield {'number': str(i),
+               'project': 'project-%d' % r.randint(0, 199),
+               'branch': r.choice(['master', 'stable']),
+               'status': 'NEW',
+               'owner': {'username': 'user-%d' % r.randint(0, 499)},
+               'lastUpdated': now - r.randint(0, 365 * 86400),
+               'currentPatchSet': {'approvals': [
+                   {'type': 'Code-Review', 'value': str(r.randint(-2, 2)),
+                    'by': {'username': 'user-%d' % r.randint(0, 499)}}
+                   for j in range(r.randint(0, 3))]}}
+
+
+def main(argv):
+    n = int(argv[0]) if len(argv) > 0 else 100000
+    tmpdir = tempfile.mkdtemp()
+    config = {'host': 'review.example.com', 'port': 29418,
+              'store': os.path.join(tmpdir, 'changes.db')}
+    scope = ['status:open']
+
+    try:
+        store = gerrit_store.ChangeStore(config)
+        start = time.time()
+        store.update(scope, _changes(n), replace=True)
+        print("loaded %d changes in %.1fs" % (n, time.time() - start))
+
+        for query in QUERIES:
+            times = []
+            for i in range(20):
+                start = time.time()
+                reviews = store.select(scope + query, scope)
+                times.append(time.time() - start)
+            times.sort()
+            print("%-55s %5d rows  median %6.2fms" %
+                  (' '.join(query), len(reviews),
+                   times[len(times) // 2] * 1000))
+        store.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
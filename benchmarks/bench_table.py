@@ -0,0 +1,97 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# bench_table:
+#
+# N rows of the default columns drawn as a table by PrettyTable, and by
+# gerrit_table sorted and unsorted, with the time taken, the time to the
+# first row and the most memory allocated while drawing. Memory is traced
+# throughout, which makes every time several times longer.
+#
+#     python benchmarks/bench_table.py [N]
+#
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_root, 'gerrit_cli'))
+
+import gerrit_query  # noqa
+import gerrit_table  # noqa
+
+
+class _Out(object):
+    # discards what is written, noting when the first row was
+    def __init__(self):
+        self.lines = 0
+        self.first = None
+
+    def write(self, s):
+        self.lines += s.count('\n')
+        if self.first is None and self.lines > 3:
+            self.first = time.time()
+
+
+def _rows(n):
+    random.seed(n)
+    for i in range(n):
+        yield [random.randint(1, 10 ** 6), 'openstack/project-%d' % (i % 40),
+               'Owner %d' % (i % 300), 'subject ' * random.randint(1, 9),
+               '%dd' % random.randint(0, 400)]
+
+
+def _prettytable(out, show, rows):
+    from prettytable import PrettyTable
+
+    table = PrettyTable([f.get('colname') for f in show],
+                        sortby=show[0].get('colname'))
+    for f in show:
+        table.align[f.get('colname')] = f.get('align')
+    for row in rows:
+        table.add_row(row)
+    out.write(str(table) + '\n')
+
+
+def _measure(name, draw, show, n):
+    out = _Out()
+    tracemalloc.start()
+    start = time.time()
+    draw(out, show, _rows(n))
+    elapsed = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print("%-12s %6.2fs  first row %6.2fs  peak %7.1fMB" %
+          (name, elapsed, out.first - start, peak / 1e6))
+
+
+def main(argv):
+    n = int(argv[0]) if argv else 20000
+    show = gerrit_query.construct_show(None, None)
+
+    print("%d rows" % n)
+    _measure('prettytable', _prettytable, show, n)
+    _measure('sorted', lambda o, s, r: gerrit_table.render_table(o, s, r, 0),
+             show, n)
+    _measure('unsorted', gerrit_table.render_table, show, n)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
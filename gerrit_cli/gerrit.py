@@ -13,55 +13,27 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+#
+# gerrit:
+#
+# the command line entry point. It is run often, from shell loops and
+# scripts, so it imports only what the subcommand being run needs, when
+# it runs it, and adds a subcommand's arguments to the parser only when
+# that subcommand is the one being parsed. While 'gerrit-cli serve' is
+# running, commands are forwarded to it instead (see gerrit_serve).
+#
+
 import argparse
-import json
+import hashlib
+import marshal
 import os
 import re
 import sys
 
-from gerrit_list import gerrit_list
-from gerrit_list import gerrit_show
-from gerrit_update import gerrit_abandon
-from gerrit_update import gerrit_recheck
-from gerrit_update import gerrit_restore
-from gerrit_update import gerrit_update
+from gerrit_errors import SSHError
 
 
-def parse_arguments(argv):
-    # top level parser
-    parser = argparse.ArgumentParser(
-        prog='gerrit',
-        description='A simple gerrit command line interface')
-
-    # top level arguments
-
-    parser.add_argument('--host', action='store',
-                        help='The gerrit host. Default: review.openstack.org')
-    parser.add_argument('--port', action='store',
-                        default=29418,
-                        help='The gerrit port. Default: 29418')
-    parser.add_argument('--dry-run', action='store_true',
-                        help=('Whether or not to actually execute commands '
-                              'that modify a review.'))
-    parser.add_argument('--config-file', action='store',
-                        help=('The path to the gerrit-cli configuration file '
-                              'to use for this session. '
-                              '(Default: ~/.gerrit-cli/gerrit-cli.json'),
-                        default='~/.gerrit-cli/gerrit-cli.json')
-
-    parser.add_argument('-v', '--verbose', action='count',
-                        help=('Provide additional (verbose) debug output.'))
-
-    # subparsers
-    subparsers = parser.add_subparsers(dest='subparser_name')
-    lsparser = subparsers.add_parser('ls', help='list reviews')
-    showparser = subparsers.add_parser('show', help='show review(s)')
-    updateparser = subparsers.add_parser('update', help='update review(s)')
-    abandonparser = subparsers.add_parser('abandon', help='abandon review(s)')
-    restoreparser = subparsers.add_parser('restore', help='restore review(s)')
-    recheckparser = subparsers.add_parser('recheck', help='abandon review(s)')
-
-    # subparser definitions
+def _ls_arguments(lsparser):
     lsparser.add_argument('query', nargs='*',
                           help=('provide a complete gerrit query to execute, '
                                 'or a query defined in the configuration '
@@ -69,118 +41,235 @@ def parse_arguments(argv):
 
     lsparser.add_argument('--show', nargs='*',
                           help='provide a list of columns to display.')
-    _output_formats = ['JSON', 'CSV', 'TABLE']
+    _output_formats = ['JSON', 'NDJSON', 'CSV', 'TABLE', 'ARROW', 'PARQUET']
     lsparser.add_argument('--output-format', action='store', default='TABLE',
                           choices=_output_formats,
                           help=('Select an output format, valid choices are '
                                 '%s. Default: TABLE' % _output_formats))
-
-    # show parser
+    lsparser.add_argument('--output', action='store',
+                          help=('Write the output to this file rather than '
+                                'to stdout.'))
+    lsparser.add_argument('--sort', action='store',
+                          help=('The column to sort by, descending with '
+                                '--reverse or when prefixed with - (as '
+                                '--sort=-number). Sorting by age lists '
+                                'the most recently updated first, as '
+                                'gerrit does. Default: the first column '
+                                'for TABLE, otherwise as gerrit returns '
+                                'them'))
+    lsparser.add_argument('--reverse', action='store_true',
+                          help=('Sort in descending rather than ascending '
+                                'order.'))
+    lsparser.add_argument('--limit', action='store', type=int,
+                          help=('The number of reviews to list, the first '
+                                'ones in the order they are sorted in.'))
+    lsparser.add_argument('--max-results', action='store', type=int,
+                          help=('The maximum number of reviews to list. '
+                                'Default: all of them, fetched a page at '
+                                'a time'))
+    lsparser.add_argument('--prefetch', action='store_true',
+                          help=('Request the next page of results while '
+                                'the current one is being output.'))
+    lsparser.add_argument('--no-cache', action='store_true',
+                          help=('Always query the server, neither reading '
+                                'nor updating the result cache.'))
+    lsparser.add_argument('--refresh', action='store_true',
+                          help=('Query the server in full and replace any '
+                                'cached result.'))
+    lsparser.add_argument('--any', action='store_true',
+                          help=('List the reviews matching any of the '
+                                'queries given, rather than all of them.'))
+
+
+def _show_arguments(showparser):
     showparser.add_argument('query', nargs='+',
                             help=('provide a complete gerrit query to '
                                   'execute, or a query defined in the '
                                   'configuration file'))
 
-    # update parser
-    updateparser.add_argument('query', nargs='+',
+
+def _review_arguments(reviewparser, comment=True):
+    # update, abandon, restore and recheck, of which only recheck doesn't
+    # take a comment.
+    reviewparser.add_argument('query', nargs='+',
                               help=('provide a complete gerrit query to '
                                     'execute, or a query defined in the '
                                     'configuration file'))
 
-    updateparser.add_argument('--comment', nargs='*',
-                              required=True, action='store',
-                              help='the comment to add with this update')
+    if comment:
+        reviewparser.add_argument('--comment', nargs='*',
+                                  required=True, action='store',
+                                  help='the comment to add with this update')
 
-    updateparser.add_argument('--review',
+    reviewparser.add_argument('--review',
                               choices=['-2', '-1', '0', '+1', '+2'],
                               required=False, action='store',
                               help='The review score to assign')
 
-    updateparser.add_argument('--workflow',
+    reviewparser.add_argument('--workflow',
                               choices=['-1', '0', '+1'],
                               required=False, action='store',
                               help='The workflow score to assign')
 
-    # abandon parser
-    abandonparser.add_argument('query', nargs='+',
-                               help=('provide a complete gerrit query to '
-                                     'execute, or a query defined in the '
-                                     'configuration file'))
-
-    abandonparser.add_argument('--comment', nargs='*',
-                               required=True, action='store',
-                               help='the comment to add with this update')
-
-    abandonparser.add_argument('--review',
-                               choices=['-2', '-1', '0', '+1', '+2'],
-                               required=False, action='store',
-                               help='The review score to assign')
-
-    abandonparser.add_argument('--workflow', choices=['-1', '0', '+1'],
-                               required=False, action='store',
-                               help='The workflow score to assign')
-
-    # restore parser
-    restoreparser.add_argument('query', nargs='+',
-                               help=('provide a complete gerrit query to '
-                                     'execute, or a query defined in the '
-                                     'configuration file'))
-
-    restoreparser.add_argument('--comment', nargs='*',
-                               required=True, action='store',
-                               help='the comment to add with this update')
-
-    restoreparser.add_argument('--review',
-                               choices=['-2', '-1', '0', '+1', '+2'],
-                               required=False, action='store',
-                               help='The review score to assign')
-
-    restoreparser.add_argument('--workflow', choices=['-1', '0', '+1'],
-                               required=False, action='store',
-                               help='The workflow score to assign')
-
-    # recheck parser
-    recheckparser.add_argument('query', nargs='+',
-                               help=('provide a complete gerrit query to '
-                                     'execute, or a query defined in the '
-                                     'configuration file'))
-
-    recheckparser.add_argument('--review',
-                               choices=['-2', '-1', '0', '+1', '+2'],
-                               required=False, action='store',
-                               help='The review score to assign')
-
-    recheckparser.add_argument('--workflow', choices=['-1', '0', '+1'],
-                               required=False, action='store',
-                               help='The workflow score to assign')
+    reviewparser.add_argument('--parallel', type=int, default=1,
+                              required=False, action='store',
+                              help=('The number of reviews to act on '
+                                    'concurrently. Default: 1'))
+
+    reviewparser.add_argument('--chunk-size', type=int,
+                              required=False, action='store',
+                              help=('The number of reviews to act on '
+                                    'with each gerrit review command. '
+                                    'Default: 25'))
+
+
+def _recheck_arguments(recheckparser):
+    _review_arguments(recheckparser, comment=False)
+
+
+def _sync_arguments(syncparser):
+    syncparser.add_argument('query', nargs='*',
+                            help=('provide a complete gerrit query to '
+                                  'mirror, or a query defined in the '
+                                  'configuration file'))
+
+    syncparser.add_argument('--once', action='store_true',
+                            help=('Stop when the event stream ends rather '
+                                  'than reconnecting.'))
+
+
+# each subcommand: its name, help, and the function adding its arguments,
+# if it has any
+SUBCOMMANDS = [
+    ('ls', 'list reviews', _ls_arguments),
+    ('show', 'show review(s)', _show_arguments),
+    ('update', 'update review(s)', _review_arguments),
+    ('abandon', 'abandon review(s)', _review_arguments),
+    ('restore', 'restore review(s)', _review_arguments),
+    ('recheck', 'abandon review(s)', _recheck_arguments),
+    ('sync', 'mirror review(s) locally from the event stream',
+     _sync_arguments),
+    ('serve', 'run commands for other invocations from a local socket',
+     None),
+]
+
+
+# the subcommands that run until they are stopped, which are always run
+# here rather than forwarded to 'gerrit-cli serve': it runs one command at
+# a time, and would run nothing else.
+_LOCAL = ['sync', 'serve']
+
+
+class _LazySubParsersAction(argparse._SubParsersAction):
+    # adds the arguments of the subcommand being parsed to its parser just
+    # before it is used, rather than those of every subcommand up front.
+    def __call__(self, parser, namespace, values, option_string=None):
+        for name, _description, add_arguments in SUBCOMMANDS:
+            if name == values[0] and add_arguments is not None:
+                add_arguments(self._name_parser_map[name])
+
+        super(_LazySubParsersAction, self).__call__(
+            parser, namespace, values, option_string)
+
+
+def parse_arguments(argv):
+    # top level parser
+    parser = argparse.ArgumentParser(
+        prog='gerrit',
+        description='A simple gerrit command line interface')
+    parser.register('action', 'lazy_parsers', _LazySubParsersAction)
+
+    # top level arguments
+
+    parser.add_argument('--host', action='store',
+                        help='The gerrit host. Default: review.openstack.org')
+    parser.add_argument('--port', action='store',
+                        default=29418,
+                        help='The gerrit port. Default: 29418')
+    parser.add_argument('--dry-run', action='store_true',
+                        help=('Whether or not to actually execute commands '
+                              'that modify a review.'))
+    parser.add_argument('--config-file', action='store',
+                        help=('The path to the gerrit-cli configuration file '
+                              'to use for this session. '
+                              '(Default: ~/.gerrit-cli/gerrit-cli.json'),
+                        default='~/.gerrit-cli/gerrit-cli.json')
+
+    parser.add_argument('-v', '--verbose', action='count',
+                        help=('Provide additional (verbose) debug output.'))
+
+    # subparsers, whose arguments are added as they are used
+    subparsers = parser.add_subparsers(dest='subparser_name',
+                                       action='lazy_parsers')
+    for name, description, _add_arguments in SUBCOMMANDS:
+        subparsers.add_parser(name, help=description)
 
     args = parser.parse_args(argv)
     return args
 
 
 def load_configuration(path):
+    # json is only needed when the compiled configuration is out of date
+    import json
+
     with open(os.path.expandvars(os.path.expanduser(path))) as config_file:
-        c = ''
-        comment = re.compile('^\s*#.*')
-        for line in config_file:
-            if not comment.match(line):
-                c = c + line
+        comment = re.compile(r'^\s*#.*')
 
-        return json.loads(c)
+        return json.loads(''.join(line for line in config_file
+                                  if not comment.match(line)))
 
 
-def main():
-    args = parse_arguments(sys.argv[1:])
+def load_compiled_configuration(path, cache_dir='~/.gerrit-cli/compiled'):
+    # the configuration file at path, parsed and with its aliases
+    # expanded, from a compiled copy under cache_dir for as long as the
+    # file is unchanged. The copy is marshalled, which is specific to the
+    # version of python, so that is part of what is checked.
+    path = os.path.realpath(os.path.expandvars(os.path.expanduser(path)))
+    cache_dir = os.path.expandvars(os.path.expanduser(cache_dir))
+    cache = os.path.join(cache_dir, hashlib.sha1(
+        path.encode('utf-8')).hexdigest())
+
+    st = os.stat(path)
+    stamp = (st.st_mtime, st.st_size, sys.hexversion)
 
-    if args.verbose > 0:
-        print('arguments are ' + args)
+    try:
+        with open(cache, 'rb') as f:
+            cached_stamp, config = marshal.loads(f.read())
+        if cached_stamp == stamp:
+            return config
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        pass
 
-    config = load_configuration(args.config_file)
-    #print(config['host'])
+    # only needed to compile the configuration again
+    import tempfile
+    from gerrit_query import alias_tables
+
+    config = load_configuration(path)
+    config['aliases'] = alias_tables(config)
+
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            marshal.dump((stamp, config), f)
+        os.rename(tmp, cache)
+    except (IOError, OSError, ValueError):
+        pass
+
+    return config
+
+
+def run(args, config):
+    if args.verbose:
+        print('arguments are ' + str(args))
 
     if args.dry_run:
         config['dry-run'] = True
 
+    if args.verbose:
+        config['verbose'] = args.verbose
+
     #print("wes args " + str(args))
     if args.host:
         config['host'] = args.host
@@ -188,18 +277,73 @@ def main():
     if args.port:
         config['port'] = args.port
 
+    if config.get('json-backend'):
+        import gerrit_json
+        gerrit_json.use(config.get('json-backend'))
+
+    # only the module for the subcommand being run is imported
     if args.subparser_name == 'ls':
+        from gerrit_list import gerrit_list
         gerrit_list(args, config)
     elif args.subparser_name == 'show':
+        from gerrit_list import gerrit_show
         gerrit_show(args, config)
     elif args.subparser_name == 'update':
+        from gerrit_update import gerrit_update
         gerrit_update(args, config)
     elif args.subparser_name == 'abandon':
+        from gerrit_update import gerrit_abandon
         gerrit_abandon(args, config)
     elif args.subparser_name == 'restore':
+        from gerrit_update import gerrit_restore
         gerrit_restore(args, config)
     elif args.subparser_name == 'recheck':
+        from gerrit_update import gerrit_recheck
         gerrit_recheck(args, config)
+    elif args.subparser_name == 'sync':
+        from gerrit_sync import gerrit_sync
+        gerrit_sync(args, config)
+    elif args.subparser_name == 'serve':
+        from gerrit_serve import gerrit_serve
+        gerrit_serve(args, config, run_forwarded)
+
+
+def _run(args, config):
+    # run, with an ssh command that failed reported as such rather than
+    # as a traceback.
+    try:
+        run(args, config)
+    except SSHError as e:
+        sys.stderr.write("%s\n" % e)
+        sys.exit(1)
+
+
+def run_forwarded(argv, cwd):
+    # a command forwarded to 'gerrit-cli serve', run as it would have been
+    # in the directory cwd.
+    args = parse_arguments(argv)
+    config_file = os.path.join(cwd, os.path.expandvars(
+        os.path.expanduser(args.config_file)))
+    if getattr(args, 'output', None):
+        args.output = os.path.join(cwd, os.path.expanduser(args.output))
+
+    _run(args, load_compiled_configuration(config_file))
+
+
+def main():
+    argv = sys.argv[1:]
+    args = parse_arguments(argv)
+
+    if args.subparser_name not in _LOCAL:
+        # a running 'gerrit-cli serve' runs the command instead, if there
+        # is one
+        from gerrit_serve import forward
+        status = forward(argv)
+        if status is not None:
+            sys.exit(status)
+
+    _run(args, load_compiled_configuration(args.config_file))
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,296 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# gerrit_async:
+#
+# AsyncGerritSSH runs the same ssh commands as GerritSSH as asyncio
+# subprocesses, so that many of them can be in flight at once on a single
+# event loop rather than on a thread each. It is the 'ssh-async'
+# transport, and needs Python 3.
+#
+# The coroutines (aquery, astream, aquery_stream, areview) take a timeout,
+# ssh-timeout by default: the most seconds a command may run for, or for
+# a stream, wait between lines. A command that times out, or whose
+# coroutine is cancelled, is killed and reaped before SSHTimeout (or
+# CancelledError) is raised. Streams are read a line at a time, and ssh
+# is left blocked on a full pipe while the reader is busy elsewhere.
+# Transient failures are tried again, and errors raised, as GerritSSH
+# does.
+#
+# The GerritSSH methods (query, query_stream, review, ...) are thin
+# wrappers running the coroutines on the session's own event loop, and
+# run_all runs many of them at once, at most a given number at a time.
+#
+
+import asyncio
+
+from gerrit_ssh import _attribute
+from gerrit_ssh import _Backoff
+from gerrit_ssh import _classify
+from gerrit_ssh import _Pages
+from gerrit_ssh import _prefetch
+from gerrit_ssh import GerritSSH
+from gerrit_ssh import SSHError
+from gerrit_ssh import SSHTimeout
+
+
+# the longest line (a change, in JSON) read from ssh
+_LINE_LIMIT = 1 << 24
+
+
+async def _reap(p):
+    # kill and wait for a command given up on. Only those: signalling one
+    # that has exited may reap it from under the event loop's child watcher
+    # (Popen polls first), which then reports it as having exited with 255.
+    if p.returncode is None:
+        try:
+            p.kill()
+        except ProcessLookupError:
+            pass
+    await p.wait()
+
+
+class AsyncGerritSSH(GerritSSH):
+    def __init__(self, config):
+        super(AsyncGerritSSH, self).__init__(config)
+        self.loop = None
+
+    async def _spawn(self, cmd):
+        # the control master is set up, when it needs to be, with blocking
+        # ssh commands; they are run off the loop.
+        loop = asyncio.get_running_loop()
+        cmd = await loop.run_in_executor(None, self._multiplexed, cmd)
+
+        return await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE, limit=_LINE_LIMIT)
+
+    async def _aexecute(self, cmd, timeout=None):
+        timeout = self._timeout(timeout)
+        p = await self._spawn(cmd)
+        try:
+            stdout, stderr = await asyncio.wait_for(p.communicate(), timeout)
+        except asyncio.TimeoutError:
+            await _reap(p)
+            raise SSHTimeout(cmd, timeout)
+        except BaseException:
+            await _reap(p)
+            raise
+
+        return (p.returncode, stdout.decode('utf-8', 'replace'),
+                stderr.decode('utf-8', 'replace'))
+
+    async def _acall(self, cmd, read_only, timeout=None):
+        # GerritSSH's _call
+        backoff = _Backoff(self.config)
+        while True:
+            self.breaker.check(cmd)
+            try:
+                returncode, stdout, stderr = await self._aexecute(cmd,
+                                                                  timeout)
+                kind = _classify(returncode, stderr)
+                if kind is None:
+                    self.breaker.success()
+                    return returncode, stdout, stderr
+                error = SSHError(cmd, returncode, stderr, kind)
+            except SSHTimeout as e:
+                error = e
+
+            self.breaker.failure()
+            await asyncio.sleep(backoff.delay(error, read_only))
+
+    async def astream(self, cmd, timeout=None):
+        # the lines ssh writes to stdout, as it writes them. stderr is
+        # read alongside, so that a chatty server can't block, and is in
+        # the SSHError raised if ssh fails.
+        timeout = self._timeout(timeout)
+        p = await self._spawn(cmd)
+        stderr = asyncio.ensure_future(p.stderr.read())
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(p.stdout.readline(),
+                                                  timeout)
+                except asyncio.TimeoutError:
+                    raise SSHTimeout(cmd, timeout)
+                if not line:
+                    break
+                yield line.decode('utf-8', 'replace')
+        except BaseException:
+            # a timeout, cancellation, or the reader going away early
+            stderr.cancel()
+            await _reap(p)
+            raise
+
+        await p.wait()
+        s = (await stderr).decode('utf-8', 'replace')
+        if p.returncode != 0:
+            raise SSHError(cmd, p.returncode, s, _classify(p.returncode, s))
+
+    async def _apage(self, cmd, timeout):
+        # GerritSSH's _page
+        backoff = _Backoff(self.config)
+        while True:
+            self.breaker.check(cmd)
+            read = False
+            lines = self.astream(cmd, timeout)
+            try:
+                async for line in lines:
+                    read = True
+                    yield line
+                self.breaker.success()
+                return
+            except SSHError as e:
+                if e.kind is None:
+                    self.breaker.success()
+                    raise
+                self.breaker.failure()
+                if read:
+                    raise
+                delay = backoff.delay(e, True)
+            finally:
+                # an async generator left part read is only closed when
+                # the loop gets round to it, ssh and all
+                await lines.aclose()
+
+            await asyncio.sleep(delay)
+
+    async def aquery(self, query, timeout=None, **kwargs):
+        # GerritSSH's query
+        if self.config.get('dry-run'):
+            print(' '.join(self._query_command(query, **kwargs)))
+            return "", ""
+
+        lines = [line async for line in self.aquery_stream(
+            query, timeout=timeout, **kwargs)]
+        return ''.join(lines), ""
+
+    async def aquery_stream(self, query, max_results=None, timeout=None,
+                            **kwargs):
+        # the JSON lines of the result, page by page as GerritSSH's
+        # query_stream gives them.
+        kwargs.pop('prefetch', None)
+        if self.config.get('dry-run'):
+            print(' '.join(self._query_command(query, **kwargs)))
+            return
+
+        pages = _Pages(self, query, max_results, kwargs)
+        cmd = pages.command()
+        while cmd is not None:
+            lines = self._apage(cmd, timeout)
+            try:
+                async for line in lines:
+                    if pages.read(line):
+                        yield line
+            finally:
+                await lines.aclose()
+            cmd = pages.command()
+
+        yield pages.stats()
+
+    async def areview(self, targets, message, review, workflow, extra=None,
+                      keys=None, timeout=None):
+        cmd = self._review_command(targets, message, review, workflow,
+                                   extra)
+
+        if self.config.get('dry-run'):
+            return [(0, ' '.join(cmd), "")] + [(0, "", "")] * (
+                len(targets) - 1)
+
+        returncode, stdout, stderr = await self._acall(cmd, False, timeout)
+        return _attribute(targets, keys or [[t] for t in targets],
+                          returncode, stdout, stderr)
+
+    # the GerritSSH interface, run on the session's own loop
+
+    def _run(self, coroutine):
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(coroutine)
+
+    def close(self):
+        if self.loop is not None:
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+            self.loop = None
+
+    def _execute(self, cmd, timeout=None):
+        return self._run(self._aexecute(cmd, timeout))
+
+    def _stream(self, cmd, timeout=None):
+        lines = self.astream(cmd, timeout)
+        try:
+            while True:
+                try:
+                    yield self._run(lines.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._run(lines.aclose())
+
+    def query(self, query, **kwargs):
+        return self._run(self.aquery(query, **kwargs))
+
+    def query_stream(self, query, max_results=None, prefetch=False,
+                     **kwargs):
+        if not prefetch:
+            return GerritSSH.query_stream(self, query, max_results,
+                                          **kwargs)
+
+        # the loop is driven from the prefetching thread, and only from
+        # there, through a session of its own
+        session = AsyncGerritSSH(self.config)
+        return _prefetch(GerritSSH.query_stream(session, query, max_results,
+                                                **kwargs),
+                         self.config.get('query-prefetch', 1000))
+
+    def review(self, targets, message, review, workflow, extra=None,
+               keys=None):
+        return self._run(self.areview(targets, message, review, workflow,
+                                      extra, keys))
+
+    def run_all(self, coroutines, parallel):
+        # the result of each of coroutines, in order, as soon as it and
+        # those before it are done, running at most parallel of them at a
+        # time. An exception raised by one is its result. Those not yet
+        # done when the caller stops are cancelled.
+        async def bound():
+            # made on the loop: before Python 3.10, a Semaphore belongs to
+            # the loop current when it is made
+            return asyncio.Semaphore(max(1, parallel))
+
+        semaphore = self._run(bound())
+
+        async def bounded(coroutine):
+            async with semaphore:
+                try:
+                    return await coroutine
+                except Exception as e:
+                    return e
+
+        coroutines = list(coroutines)
+        tasks = [self.loop.create_task(bounded(c)) for c in coroutines]
+        try:
+            for task in tasks:
+                yield self._run(task)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                self._run(asyncio.gather(*tasks, return_exceptions=True))
+            for c in coroutines:
+                # those cancelled before they were started
+                c.close()
@@ -0,0 +1,254 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# gerrit_cache:
+#
+# an on-disk cache of query results, kept under ~/.gerrit-cli/cache. Each
+# entry is a file of JSON lines: a header recording when the query was
+# run, the changes, and the stats line. Entries younger than the TTL are
+# served as is; older ones are brought up to date by asking the server only
+# for changes updated since the entry was written (-age:). The cache is
+# bounded in size, least recently used entries are evicted first.
+#
+
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+import gerrit_json
+
+
+# allowance for clock skew between us and the server when asking for the
+# changes updated since an entry was written.
+_AGE_SLACK = 60
+
+# the number of change: terms put in a single query when checking whether
+# cached changes still match.
+_CHANGE_CHUNK = 100
+
+# operators relative to now: changes come to match, or stop matching, a
+# query with one of them without being updated, which an incremental
+# refresh would miss.
+_RELATIVE = re.compile(r'\b(age|before|until|after|since):')
+
+
+def _normalize(query):
+    return ' '.join(' '.join(query).split())
+
+
+def _last_updated(line):
+    return int(gerrit_json.loads(line).get('lastUpdated', 0))
+
+
+class QueryCache(object):
+    def __init__(self, config):
+        self.config = config
+        self.path = os.path.expandvars(os.path.expanduser(
+            config.get('cache-dir', '~/.gerrit-cli/cache')))
+        self.ttl = config.get('cache-ttl', 60)
+        self.max_size = config.get('cache-size', 64 * 1024 * 1024)
+        self.incremental = config.get('cache-incremental', True)
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def key(self, query, kwargs):
+        # prefetching changes how a result is read, not what it is
+        flags = sorted((k, v) for k, v in kwargs.items() if k != 'prefetch')
+        k = json.dumps([self.config.get('host'), str(self.config.get('port')),
+                        _normalize(query), flags])
+
+        return hashlib.sha1(k.encode('utf-8')).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key)
+
+    def _header(self, key):
+        try:
+            with open(self._file(key)) as f:
+                return json.loads(f.readline())
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _lines(self, key):
+        with open(self._file(key)) as f:
+            f.readline()
+            for line in f:
+                yield line
+
+    def _writer(self, key, created):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix='.tmp-')
+        f = os.fdopen(fd, 'w')
+        f.write(json.dumps({'created': created}) + '\n')
+
+        return f, tmp
+
+    def _commit(self, key, f, tmp, ok):
+        f.close()
+        if ok:
+            os.rename(tmp, self._file(key))
+            self._evict()
+        else:
+            os.unlink(tmp)
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.path):
+            if name.startswith('.tmp-'):
+                continue
+            try:
+                s = os.stat(os.path.join(self.path, name))
+            except OSError:
+                # evicted by another query meanwhile
+                continue
+            entries.append((s.st_mtime, s.st_size, name))
+            total += s.st_size
+
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(os.path.join(self.path, name))
+            except OSError:
+                pass
+            total -= size
+
+    def rows(self, query, **kwargs):
+        # the number of changes in the cached result for query, however
+        # old it is, or None if there isn't one.
+        try:
+            with open(self._file(self.key(query, kwargs)), 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - 1024))
+                last = f.read().splitlines()[-1]
+            return int(json.loads(last.decode('utf-8')).get('rowCount'))
+        except (IOError, OSError, IndexError, ValueError, TypeError):
+            return None
+
+    def _fetch(self, session, key, query, kwargs):
+        # stream the result through to the caller, spooling it to the
+        # cache as it goes. It is only kept if the row count checks out.
+        created = time.time()
+        f, tmp = self._writer(key, created)
+        rows = 0
+        rowcount = -1
+
+        try:
+            for line in session.query_stream(query, **kwargs):
+                if '"rowCount"' in line:
+                    rowcount = int(json.loads(line).get('rowCount'))
+                elif line.strip() != "":
+                    rows += 1
+                f.write(line if line.endswith('\n') else line + '\n')
+                yield line
+        finally:
+            self._commit(key, f, tmp, rows == rowcount)
+
+    def _refresh(self, session, key, header, query, kwargs):
+        # ask only for the changes updated since the entry was written,
+        # and separately which of the cached changes were updated but no
+        # longer match the query.
+        created = time.time()
+        age = '-age:%ds' % int(created - header.get('created') + _AGE_SLACK)
+
+        changes = {}
+        for line in self._lines(key):
+            review = gerrit_json.loads(line)
+            if review.get('number') is not None:
+                changes[str(review.get('number'))] = line
+
+        updated = {}
+        for line in session.query_stream(query + [age], **kwargs):
+            review = gerrit_json.loads(line)
+            if review.get('number') is not None:
+                updated[str(review.get('number'))] = line
+            elif review.get('rowCount') is not None:
+                if int(review.get('rowCount')) != len(updated):
+                    raise Exception("mismatch between expected and found "
+                                    "rows.")
+
+        numbers = sorted(changes.keys())
+        for i in range(0, len(numbers), _CHANGE_CHUNK):
+            terms = ' OR '.join('change:%s' % n
+                                for n in numbers[i:i + _CHANGE_CHUNK])
+            for line in session.query_stream(['(%s)' % terms, age],
+                                             all_patch_sets=False,
+                                             all_approvals=False):
+                review = gerrit_json.loads(line)
+                n = review.get('number')
+                if n is not None and str(n) not in updated:
+                    changes.pop(str(n), None)
+
+        changes.update(updated)
+        # most recently updated first, the order gerrit returns them in
+        ordered = sorted(changes.values(), key=_last_updated, reverse=True)
+
+        f, tmp = self._writer(key, created)
+        for line in ordered:
+            f.write(line if line.endswith('\n') else line + '\n')
+        f.write(json.dumps({'type': 'stats', 'rowCount': len(ordered),
+                            'moreChanges': False}) + '\n')
+        self._commit(key, f, tmp, True)
+
+    def query_stream(self, session, query, refresh=False, **kwargs):
+        # a drop in replacement for session.query_stream() that answers
+        # from the cache when it can.
+        key = self.key(query, kwargs)
+        header = None if refresh else self._header(key)
+
+        if header is None:
+            self.misses += 1
+            for line in self._fetch(session, key, query, kwargs):
+                yield line
+            self._report()
+            return
+
+        if time.time() - header.get('created') >= self.ttl:
+            if (self.incremental and
+                    kwargs.get('max_results') is None and
+                    kwargs.get('limit', -1) == -1 and
+                    not [q for q in query if q.startswith('limit:') or
+                         _RELATIVE.search(q)]):
+                self.refreshes += 1
+                self._refresh(session, key, header, query, kwargs)
+            else:
+                self.misses += 1
+                for line in self._fetch(session, key, query, kwargs):
+                    yield line
+                self._report()
+                return
+        else:
+            self.hits += 1
+            os.utime(self._file(key), None)
+
+        for line in self._lines(key):
+            yield line
+
+        self._report()
+
+    def _report(self):
+        if self.config.get('verbose'):
+            sys.stderr.write("cache: %d hit(s), %d miss(es), %d "
+                             "refresh(es)\n" % (self.hits, self.misses,
+                                                self.refreshes))
@@ -0,0 +1,50 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# gerrit_errors:
+#
+# errors the entry point reports without a traceback. They are kept apart
+# from the modules that raise them, which are only imported by the
+# subcommands that need them, so that gerrit can catch them without
+# importing those.
+#
+
+
+class SSHError(Exception):
+    # an ssh command that failed. kind says why, and so whether trying it
+    # again may help:
+    #
+    #   unavailable   the server could not be reached, or turned it away;
+    #                 it did not run
+    #   interrupted   the connection was lost while it ran
+    #   timeout       it ran for longer than it was allowed to
+    #   circuit-open  it was not run, as too many commands before it failed
+    #   None          it ran, and failed; it would fail again
+    def __init__(self, cmd, returncode, stderr, kind=None, message=None):
+        if message is None:
+            message = "ssh exited with status %s: %s: %s" % (
+                returncode, ' '.join(cmd), stderr.strip())
+        super(SSHError, self).__init__(message)
+        self.cmd = cmd
+        self.returncode = returncode
+        self.stderr = stderr
+        self.kind = kind
+
+    def retriable(self, read_only):
+        # a command that may have taken effect is only tried again if it
+        # only reads
+        return self.kind == 'unavailable' or (
+            read_only and self.kind in ('interrupted', 'timeout'))
@@ -0,0 +1,126 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# gerrit_hosts:
+#
+# queries run against several gerrit servers at once. The configuration
+# names the servers under 'hosts', each with the options (host, port,
+# username, ...) that differ from the top level ones:
+#
+#     "hosts": {
+#         "upstream": {"host": "review.openstack.org"},
+#         "internal": {"host": "gerrit.example.com", "port": 2222}
+#     }
+#
+# fan_out runs the same work for every host on a thread of its own, and
+# yields what each produces, tagged with the host's name, as it arrives;
+# so the time taken is that of the slowest host rather than the sum of
+# them all. How long each host took is reported on stderr once it is
+# done.
+#
+
+from six.moves import queue
+import sys
+import threading
+import time
+
+
+# the most items from any one host waiting to be yielded
+_QUEUE_SIZE = 1024
+
+_DONE = object()
+_FAILED = object()
+
+
+def host_configs(config, host=None):
+    # [(name, config)] for each of the named hosts in config, or None if
+    # there are none, or a single host was given (by --host).
+    hosts = config.get('hosts')
+    if not hosts or host:
+        return None
+
+    configs = []
+    for name in hosts:
+        c = dict(config)
+        del c['hosts']
+        c.update(hosts[name])
+        configs.append((name, c))
+
+    return configs
+
+
+def _put(items, stop, entry):
+    # put entry on items, unless the consumer stops first
+    while not stop.is_set():
+        try:
+            items.put(entry, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _produce(name, config, fetch, items, stop):
+    start = time.time()
+    count = 0
+    fetched = None
+    try:
+        fetched = fetch(config)
+        for item in fetched:
+            if not _put(items, stop, (name, item, None)):
+                return
+            count += 1
+    except Exception as e:
+        _put(items, stop, (name, _FAILED, (e, time.time() - start)))
+    else:
+        _put(items, stop, (name, _DONE, (count, time.time() - start)))
+    finally:
+        if hasattr(fetched, 'close'):
+            fetched.close()
+
+
+def fan_out(hosts, fetch, report=True):
+    # run fetch(config) for each (name, config) in hosts concurrently, and
+    # yield (name, item) for each item any of them produces. A host that
+    # fails is reported, and the others carry on; with report, so is the
+    # time each one took.
+    items = queue.Queue(_QUEUE_SIZE)
+    # set when the caller stops early, so that the hosts still producing
+    # don't block on a full queue forever
+    stop = threading.Event()
+    for name, config in hosts:
+        t = threading.Thread(target=_produce,
+                             args=(name, config, fetch, items, stop))
+        t.daemon = True
+        t.start()
+
+    running = len(hosts)
+    try:
+        while running:
+            name, item, result = items.get()
+            if item is _DONE:
+                running -= 1
+                if report:
+                    sys.stderr.write("%s: %d in %.2fs\n" %
+                                     (name, result[0], result[1]))
+            elif item is _FAILED:
+                running -= 1
+                sys.stderr.write("%s: failed after %.2fs: %s\n" %
+                                 (name, result[1], result[0]))
+            else:
+                yield name, item
+    finally:
+        stop.set()
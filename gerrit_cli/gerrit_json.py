@@ -0,0 +1,116 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# gerrit_json:
+#
+# the JSON decoder used for query results. Decoding dominates the time
+# spent on large results, so the fastest of orjson, ujson and simdjson
+# that is installed is used, falling back to the standard library. The
+# 'json-backend' configuration option picks one explicitly.
+#
+# LazyReview defers decoding a change until one of its fields is first
+# used, so changes that are counted or passed through but never looked at
+# are not decoded at all.
+#
+
+import importlib
+
+
+# in order of preference
+BACKENDS = ['orjson', 'ujson', 'simdjson', 'json']
+
+
+def _import(name):
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def available():
+    return [name for name in BACKENDS if _import(name) is not None]
+
+
+def _preferred():
+    # the first backend that imports; the ones after it aren't tried, as
+    # importing each costs time every command pays.
+    for name in BACKENDS:
+        if _import(name) is not None:
+            return name
+
+
+def backend(name=None):
+    # the loads function of the named backend, or of the preferred one
+    # that is installed if name is None or 'auto'.
+    if name is None or name == 'auto':
+        name = _preferred()
+
+    if name not in BACKENDS:
+        raise Exception("unknown json backend %s, choose from %s" %
+                        (name, ', '.join(BACKENDS)))
+
+    module = _import(name)
+    if module is None:
+        raise Exception("json backend %s is not installed" % name)
+
+    return module.loads
+
+
+name = _preferred()
+loads = backend(name)
+
+
+def use(backend_name):
+    # select the backend used by loads() for the rest of the process.
+    global loads, name
+
+    if backend_name in (None, 'auto'):
+        backend_name = _preferred()
+
+    loads = backend(backend_name)
+    name = backend_name
+
+
+class LazyReview(object):
+    # a change from a query result, decoded the first time it is used.
+    __slots__ = ('line', '_review')
+
+    def __init__(self, line):
+        self.line = line
+        self._review = None
+
+    def review(self):
+        if self._review is None:
+            self._review = loads(self.line)
+        return self._review
+
+    def decoded(self):
+        return self._review is not None
+
+    def get(self, key, default=None):
+        return self.review().get(key, default)
+
+    def __getitem__(self, key):
+        return self.review()[key]
+
+    def __contains__(self, key):
+        return key in self.review()
+
+    def keys(self):
+        return self.review().keys()
+
+    def items(self):
+        return self.review().items()
@@ -14,62 +14,147 @@
 #    under the License.
 
 import json
-from prettytable import PrettyTable
+import sys
 
+from gerrit_cache import QueryCache
+from gerrit_hosts import fan_out
+from gerrit_hosts import host_configs
+from gerrit_output import write_output
+from gerrit_query import construct_queries
 from gerrit_query import construct_query
 from gerrit_query import construct_show
-from gerrit_query import generate_output
-from gerrit_query import process_results
-from gerrit_ssh import GerritSSH
+from gerrit_query import iter_output
+from gerrit_query import iter_results
+from gerrit_query import query_flags
+from gerrit_query import sort_key
+from gerrit_ssh import open_session
+from gerrit_store import store_lines
+from gerrit_sync import mirror_lines
+from gerrit_union import union_lines
+
+
+# the column added to the output of queries run against several hosts
+_HOST_COLUMN = {'name': 'host', 'colname': 'Host', 'align': 'l', 'length': 0}
+
+
+def _list_lines(args, config, query, kwargs):
+    # the JSON lines answering query on the host in config, from the store,
+    # a mirror, the result cache or the server itself.
+    session = open_session(config)
+    cached = not (args.no_cache or config.get('dry-run'))
+
+    lines = None
+    if cached and not (args.max_results or args.refresh):
+        lines = store_lines(config, query) or mirror_lines(config, query)
+
+    if lines is None:
+        if cached and config.get('cache', True):
+            lines = QueryCache(config).query_stream(session, query,
+                                                    refresh=args.refresh,
+                                                    **kwargs)
+        else:
+            lines = session.query_stream(query, **kwargs)
+
+    return lines
+
+
+def _order(args, show, ordered):
+    # how the rows are to be sorted: None when they are to be written in
+    # the order they come in, or the (index, reverse, key) of the column
+    # they are sorted by. ordered is whether they come in most recently
+    # updated first, as from a single server, store or mirror.
+    if args.sort is None:
+        if args.output_format != 'TABLE':
+            if args.reverse:
+                raise Exception("--reverse needs a column to --sort by")
+            return None
+        return 0, args.reverse, sort_key(show[0])
+
+    if args.sort == 'age' and ordered and not args.reverse:
+        # the order gerrit returns changes in, whether or not age is shown
+        return None
+
+    reverse = args.sort.startswith('-') != args.reverse
+    name = args.sort.lstrip('-')
+    names = [f.get('name') for f in show]
+    if name not in names:
+        raise Exception("cannot sort by %s, choose from the columns shown, "
+                        "%s" % (name, ', '.join(names)))
+
+    index = names.index(name)
+    return index, reverse, sort_key(show[index])
 
 
 def _generate_list(args, config):
-    query = construct_query(args.query, config)
     show = construct_show(args.show, config)
-    print("ls config " + str(config))
+    if config.get('verbose'):
+        sys.stderr.write("ls config %s\n" % config)
 
-    session = GerritSSH(config)
-    out, err = session.query(query, current_patch_set=True)
+    hosts = host_configs(config, args.host)
+    order = _order(args, show if hosts is None else show + [_HOST_COLUMN],
+                   hosts is None and not args.any)
 
-    return generate_output(out, show)
+    max_results = args.max_results
+    if order is None and args.limit is not None:
+        # rows are written as they come, so no more than limit are needed
+        # from the server
+        max_results = min(args.limit, max_results or args.limit)
 
+    kwargs = query_flags(show)
+    kwargs.update({'max_results': max_results,
+                   'prefetch': args.prefetch})
 
-def gerrit_list(args, config):
-    output, show = _generate_list(args, config)
+    if args.any:
+        queries = construct_queries(args.query, config)
+
+        def query_lines(c, query):
+            return _list_lines(args, c, query, kwargs)
+
+        def fetch_lines(c):
+            return union_lines(c, queries, kwargs, query_lines)
+    else:
+        query = construct_query(args.query, config)
+
+        def fetch_lines(c):
+            return _list_lines(args, c, query, kwargs)
 
-    if args.output_format == 'TABLE':
-        table = PrettyTable(
-            [f.get('colname') for f in show],
-            sortby=show[0].get('colname'))
+    if hosts is None:
+        return iter_output(fetch_lines(config), show), show, order
 
-        for f in show:
-            table.align[f.get('colname')] = f.get('align')
+    def fetch(host_config):
+        return iter_output(fetch_lines(host_config), show)
 
-        for row in output:
-            table.add_row(row)
+    return ((row + [name] for name, row in fan_out(hosts, fetch)),
+            show + [_HOST_COLUMN], order)
 
-        print(table)
-    elif args.output_format == 'CSV':
-        print(','.join(f.get('colname') for f in show))
-        for row in output:
-            print(','.join(('"%s"' % str(c).replace('"', '"""')) for c in row))
-    elif args.output_format == 'JSON':
-        o = []
-        for row in output:
-            e = {}
-            for colix in range(0, len(show)):
-                e[show[colix].get('name')] = row[colix]
-            o.append(e)
 
-        print(o)
+def gerrit_list(args, config):
+    output, show, order = _generate_list(args, config)
+    write_output(args.output_format, show, output, args.output, order,
+                 args.limit)
+
+
+def _show_lines(config, query):
+    lines = None if config.get('dry-run') else mirror_lines(config, query)
+    if lines is None:
+        lines = open_session(config).query_stream(query,
+                                                  current_patch_set=True)
+
+    return lines
 
 
 def gerrit_show(args, config):
     query = construct_query(args.query, config)
-    session = GerritSSH(config)
 
-    out, err = session.query(query, current_patch_set=True)
-    reviews = process_results(out)
+    hosts = host_configs(config, args.host)
+    if hosts is None:
+        for row in iter_results(_show_lines(config, query)):
+            print(json.dumps(row, indent=2))
+        return
+
+    def fetch(host_config):
+        return iter_results(_show_lines(host_config, query))
 
-    for row in reviews:
+    for name, row in fan_out(hosts, fetch):
+        row['host'] = name
         print(json.dumps(row, indent=2))
@@ -0,0 +1,176 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# gerrit_model:
+#
+# compact records for the changes in a query result. A Change is built
+# once from the decoded JSON of a change, keeping only what the columns
+# being shown need, with the values they are formatted from (the latest
+# patch set, the owner's display name, the votes) worked out up front.
+# The decoded JSON can then be dropped. The state column is tallied from
+# the votes for a batch of changes at a time, by gerrit_tally.
+#
+# Columns other than the ones Change has a slot for are kept in fields,
+# either as the top level field of the same name, or as computed by the
+# function registered for them in EXTRACTORS.
+#
+
+import time
+
+
+class PatchSet(object):
+    __slots__ = ('number', 'revision')
+
+    def __init__(self, patchset):
+        self.number = patchset.get('number')
+        self.revision = patchset.get('revision')
+
+
+def _name(account):
+    return account.get('name', account.get('username', account.get('email')))
+
+
+def _owner(review):
+    return _name(review.get('owner'))
+
+
+def _latest_json(review):
+    cps = review.get('currentPatchSet')
+    if cps is not None:
+        return cps
+
+    return review.get('patchSets')[-1]
+
+
+def _latest(review):
+    return PatchSet(_latest_json(review))
+
+
+def _topic(review):
+    return review.get('topic', '')
+
+
+def _updated(review):
+    return time.strftime('%Y-%m-%d %H:%M',
+                         time.localtime(int(review.get('lastUpdated'))))
+
+
+def _insertions(review):
+    return _latest_json(review).get('sizeInsertions')
+
+
+def _deletions(review):
+    deletions = _latest_json(review).get('sizeDeletions')
+    return None if deletions is None else abs(int(deletions))
+
+
+def _reviewers(review):
+    return ', '.join(_name(a) for a in review.get('allReviewers', []))
+
+
+# columns computed from the decoded JSON of a change
+EXTRACTORS = {
+    'topic': _topic,
+    'updated': _updated,
+    'insertions': _insertions,
+    'deletions': _deletions,
+    'reviewers': _reviewers,
+}
+
+
+def _set_number(change, review):
+    change.number = int(review.get('number'))
+
+
+def _set_subject(change, review):
+    change.subject = review.get('subject').replace('\t', '   ')
+
+
+def _set_owner(change, review):
+    change.owner = _owner(review)
+
+
+def _set_age(change, review):
+    change.last_updated = int(review.get('lastUpdated'))
+
+
+def _set_state(change, review):
+    # kept as gerrit returns them until they are tallied
+    cps = review.get('currentPatchSet')
+    if cps is not None:
+        change.votes = cps.get('approvals')
+
+
+def _set_latest(change, review):
+    if change.latest is None:
+        change.latest = _latest(review)
+
+
+_SETTERS = {
+    'number': _set_number,
+    'subject': _set_subject,
+    'owner': _set_owner,
+    'age': _set_age,
+    'state': _set_state,
+    'commitid': _set_latest,
+    'patchset': _set_latest,
+}
+
+
+def _set_field(name):
+    def set_field(change, review):
+        if change.fields is None:
+            change.fields = {}
+
+        extract = EXTRACTORS.get(name)
+        change.fields[name] = (review.get(name) if extract is None
+                               else extract(review))
+
+    return set_field
+
+
+# the setters for each list of column names seen so far
+_plans = {}
+
+
+def _plan(names):
+    key = tuple(names)
+    plan = _plans.get(key)
+    if plan is None:
+        plan = _plans[key] = [_SETTERS.get(name) or _set_field(name)
+                              for name in names]
+
+    return plan
+
+
+class Change(object):
+    __slots__ = ('number', 'subject', 'owner', 'last_updated', 'latest',
+                 'votes', 'state', 'fields')
+
+    def __init__(self, review, names):
+        # review is the decoded JSON of a change, names the columns that
+        # will be shown.
+        self.number = None
+        self.subject = None
+        self.owner = None
+        self.last_updated = None
+        self.latest = None
+        self.votes = None
+        self.state = None
+        self.fields = None
+
+        for setter in _plan(names):
+            setter(self, review)
@@ -0,0 +1,280 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# gerrit_output:
+#
+# the writers for what 'ls' lists, one per --output-format, each given the
+# columns shown and an iterable of rows:
+#
+#   TABLE     a table (see gerrit_table).
+#   CSV       a header line, and a line per row, as they arrive.
+#   JSON      an array of objects, an element at a time as rows arrive.
+#   NDJSON    an object per line, as rows arrive.
+#   ARROW     an Arrow IPC file, and
+#   PARQUET   a Parquet file, both of a record batch (a row group) per
+#             _BATCH_ROWS rows, with the type of each column taken from
+#             the first batch. Both need pyarrow.
+#
+# Rows are written in the order they come in, or sorted by a column, which
+# reads every row first; with a limit, only that many are kept, in a heap.
+#
+# Output goes to stdout, or with --output, a file. Text is collected and
+# written _BUFFER_SIZE bytes at a time rather than a row at a time, other
+# than to a terminal.
+#
+
+import csv
+import io
+import itertools
+import json
+import six
+import sys
+
+from gerrit_table import render_table
+from gerrit_table import sort_rows
+
+
+FORMATS = ['TABLE', 'CSV', 'JSON', 'NDJSON', 'ARROW', 'PARQUET']
+
+# the bytes of text collected before they are written out
+_BUFFER_SIZE = 1 << 16
+
+# the rows in each record batch or row group of ARROW and PARQUET output
+_BATCH_ROWS = 1 << 16
+
+
+class _Buffered(object):
+    # a file like object collecting what is written to it, and writing it
+    # to out _BUFFER_SIZE characters at a time.
+    def __init__(self, out):
+        self.out = out
+        self.pending = []
+        self.size = 0
+
+    def write(self, s):
+        self.pending.append(s)
+        self.size += len(s)
+        if self.size >= _BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.out.write(''.join(self.pending))
+            self.pending = []
+            self.size = 0
+        self.out.flush()
+
+
+class _Encoded(object):
+    # a file like object for a file opened in binary mode on Python 2,
+    # where the writers produce str, or unicode where a value is, writing
+    # either as UTF-8.
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, s):
+        if isinstance(s, six.text_type):
+            s = s.encode('utf-8')
+        self.out.write(s)
+
+    def flush(self):
+        self.out.flush()
+
+
+def write_table(out, show, rows, order=None, limit=None):
+    if order is None:
+        render_table(out, show, rows, limit=limit)
+        return
+
+    index, reverse, key = order
+    render_table(out, show, rows, index, reverse, limit, key)
+
+
+def write_csv(out, show, rows):
+    # the header as is, and every value quoted
+    csv.writer(out, lineterminator='\n').writerow(
+        [f.get('colname') for f in show])
+
+    writer = csv.writer(out, lineterminator='\n', quoting=csv.QUOTE_ALL)
+    for row in rows:
+        if six.PY2:
+            # Python 2's csv only writes str
+            row = [v.encode('utf-8') if isinstance(v, six.text_type) else v
+                   for v in row]
+        writer.writerow(row)
+
+
+def write_json(out, show, rows):
+    names = [f.get('name') for f in show]
+
+    sep = '['
+    for row in rows:
+        out.write(sep + json.dumps(dict(zip(names, row))))
+        sep = ',\n'
+
+    out.write(']\n' if sep != '[' else '[]\n')
+
+
+def write_ndjson(out, show, rows):
+    names = [f.get('name') for f in show]
+
+    for row in rows:
+        out.write(json.dumps(dict(zip(names, row))) + '\n')
+
+
+def _load_pyarrow(output_format):
+    try:
+        import pyarrow
+    except ImportError:
+        raise Exception("%s output needs pyarrow, which is not installed" %
+                        output_format)
+
+    return pyarrow
+
+
+def _batches(pa, names, rows):
+    # record batches of up to _BATCH_ROWS rows
+    schema = None
+    columns = [[] for n in names]
+    count = 0
+
+    for row in rows:
+        for column, value in zip(columns, row):
+            column.append(value)
+        count += 1
+
+        if count == _BATCH_ROWS:
+            batch = _batch(pa, names, columns, schema)
+            schema = batch.schema
+            yield batch
+            columns = [[] for n in names]
+            count = 0
+
+    if count or schema is None:
+        yield _batch(pa, names, columns, schema)
+
+
+def _batch(pa, names, columns, schema):
+    if schema is not None:
+        return pa.RecordBatch.from_arrays(
+            [pa.array(c, type=f.type) for c, f in zip(columns, schema)],
+            schema=schema)
+
+    # a column of nothing but nulls is taken to be one of strings
+    arrays = []
+    for c in columns:
+        a = pa.array(c)
+        arrays.append(a.cast(pa.string()) if pa.types.is_null(a.type)
+                      else a)
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+def _write_columnar(out, show, rows, output_format):
+    pa = _load_pyarrow(output_format)
+    writer = None
+    try:
+        for batch in _batches(pa, [f.get('name') for f in show], rows):
+            if writer is None:
+                if output_format == 'PARQUET':
+                    import pyarrow.parquet
+                    writer = pyarrow.parquet.ParquetWriter(out, batch.schema)
+                else:
+                    import pyarrow.ipc
+                    writer = pyarrow.ipc.new_file(out, batch.schema)
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_arrow(out, show, rows):
+    _write_columnar(out, show, rows, 'ARROW')
+
+
+def write_parquet(out, show, rows):
+    _write_columnar(out, show, rows, 'PARQUET')
+
+
+WRITERS = {'TABLE': write_table,
+           'CSV': write_csv,
+           'JSON': write_json,
+           'NDJSON': write_ndjson,
+           'ARROW': write_arrow,
+           'PARQUET': write_parquet}
+
+_BINARY = ['ARROW', 'PARQUET']
+
+
+def _ordered(rows, order, limit):
+    if order is not None:
+        index, reverse, key = order
+        return sort_rows(rows, index, reverse, limit, key)
+
+    if limit is not None:
+        return itertools.islice(rows, limit)
+
+    return rows
+
+
+def write_output(output_format, show, rows, path=None, order=None,
+                 limit=None):
+    # rows, with the columns in show, in output_format to path or stdout.
+    # order is None for rows written as they come, or the (index, reverse,
+    # key) of the column they are sorted by; with limit, only the first
+    # limit rows are written.
+    if output_format == 'TABLE':
+        # drawn as they come, where they can be
+        def writer(out, show, rows):
+            write_table(out, show, rows, order, limit)
+    else:
+        writer = WRITERS[output_format]
+        rows = _ordered(rows, order, limit)
+    binary = output_format in _BINARY
+
+    if path is not None:
+        if binary:
+            with io.open(path, 'wb', buffering=_BUFFER_SIZE) as f:
+                writer(f, show, rows)
+        elif six.PY2:
+            with io.open(path, 'wb', buffering=_BUFFER_SIZE) as f:
+                writer(_Encoded(f), show, rows)
+        else:
+            with io.open(path, 'w', buffering=_BUFFER_SIZE,
+                         encoding='utf-8', newline='') as f:
+                writer(f, show, rows)
+        return
+
+    if binary:
+        out = getattr(sys.stdout, 'buffer', None)
+        if out is None:
+            # stdout isn't a real file, as when the command is run by
+            # serve, and pyarrow needs one; spool the output and write it
+            # out once done.
+            spool = io.BytesIO()
+            writer(spool, show, rows)
+            out = sys.stdout
+            out.write(spool.getvalue())
+        else:
+            writer(out, show, rows)
+        out.flush()
+        return
+
+    # a terminal sees rows as they are written
+    out = sys.stdout if sys.stdout.isatty() else _Buffered(sys.stdout)
+    try:
+        writer(out, show, rows)
+    finally:
+        out.flush()
@@ -22,10 +22,19 @@
 # given a show list (columns to show), expand the list based on user defined
 # show lists in the configuration.
 #
+# the show list is compiled into a plan, a function per column that gives
+# the column's cell for a change. Columns beyond the built in ones are
+# added with register_column.
+#
 
-import json
+import six
 import time
 
+import gerrit_json
+from gerrit_model import Change
+from gerrit_model import EXTRACTORS
+from gerrit_tally import format_states
+
 
 def _get_item(item, configdict):
     # print("_get_item(%s), %s" % (item, type(item)))
@@ -52,34 +61,51 @@ def _get_default(configdict, default):
         raise Exception("no default provided for expansion")
 
 
-def _expand_list(inlist, configdict, default):
-    # print("_expand_list(%s)" % inlist)
+def _resolve(item, configdict, default, table, stack):
+    # the expansion of a single item, memoized in table. stack is the
+    # chain of aliases being expanded, to catch an alias that is defined
+    # in terms of itself.
+    expansion = table.get(item)
+    if expansion is not None:
+        return expansion
+
+    if item == "default":
+        _e = _get_default(configdict, default)
+    else:
+        _e = _get_item(item, configdict)
+
+    if _e == [item]:
+        expansion = _e
+    elif item in stack:
+        raise Exception("the item %s is defined in terms of itself: %s" %
+                        (item, ' -> '.join(stack[stack.index(item):] +
+                                           [item])))
+    else:
+        stack.append(item)
+        expansion = []
+        for e in _e:
+            expansion.extend(_resolve(e, configdict, default, table, stack))
+        stack.pop()
+
+    table[item] = expansion
+    return expansion
+
+
+def _expand_list(inlist, configdict, default, table=None):
     # given an input list (inlist), expand each item in the list
-    # and generate a list of strings constituting a query
+    # and generate a list of strings constituting a query. Expanded
+    # aliases are kept in table, if one is given, for later expansions.
     if len(inlist) == 0:
         _o = _get_default(configdict, default)
 
         return _o
 
-    _o = inlist
-    inlist = None
-
-    while _o != inlist:
-        # print(">_o = %s, inlist = %s" % (_o, inlist))
-        inlist = _o
-        _o = []
-
-        for element in inlist:
-            if element == "default":
-                _e = _get_default(configdict, default)
-            else:
-                _e = _get_item(element, configdict)
-
-            # print("_e = %s" % _e)
-            for e in _e:
-                _o.append(e)
+    if table is None:
+        table = {}
 
-        # print("<_o = %s, inlist = %s" % (_o, inlist))
+    _o = []
+    for element in inlist:
+        _o.extend(_resolve(element, configdict, default, table, []))
 
     return _o
 
@@ -89,27 +115,7 @@ def _format_state(cps):
     if approvals is None:
         return "None"
 
-    _code_review = [0, 0, 0, 0, 0]
-    _verified = [0, 0, 0, 0, 0]
-    _workflow = [0, 0, 0]
-
-    for approval in approvals:
-        if approval.get('type') == 'Code-Review':
-            _code_review[int(approval.get('value')) + 2] += 1
-        elif approval.get('type') == 'Workflow':
-            _workflow[int(approval.get('value')) + 1] += 1
-        elif approval.get('type') == 'Verified':
-            _verified[int(approval.get('value')) + 2] += 1
-        elif approval.get('type') == 'Rollcall-Vote':
-            pass
-        else:
-            raise Exception("Unknown approval type %s" % approval.get('type'))
-
-    _cr = str(_code_review).replace(' ', '')
-    _wf = str(_workflow).replace(' ', '')
-    _ve = str(_verified).replace(' ', '')
-
-    return "R:%s W:%s V:%s" % (_cr, _wf, _ve)
+    return format_states([approvals])[0]
 
 
 def _format_age(age_s):
@@ -141,68 +147,251 @@ def _format_age(age_s):
     return age
 
 
-def _format_column(now, column, review):
-    field = column.get('name')
+_AGE_UNITS = {'y': 3600 * 24 * 365, 'w': 3600 * 24 * 7, 'd': 3600 * 24,
+              'h': 3600, 'm': 60, 's': 1}
+
+
+def _age_key(value):
+    # the seconds in an age as _format_age writes it, '?' being 0
+    if value is None or value == '?':
+        return (0, 0)
+
+    return (1, sum(int(c[:-1]) * _AGE_UNITS[c[-1]] for c in value.split()))
+
+
+def _value_key(value):
+    # rows without a value sort first
+    return (0, '') if value is None else (1, value)
+
+
+def sort_key(column):
+    # a function of a cell in column (an element of the show list) giving
+    # what it sorts by.
+    return _age_key if column.get('name') == 'age' else _value_key
+
+
+def _cell_number(now, change):
+    return change.number
+
+
+def _cell_age(now, change):
+    return _format_age(now - change.last_updated)
+
+
+def _cell_state(now, change):
+    if change.state is None:
+        change.state = format_states([change.votes])[0]
+    return change.state
+
+
+def _cell_subject(now, change):
+    return change.subject
+
+
+def _cell_owner(now, change):
+    return change.owner
+
+
+def _cell_commitid(now, change):
+    return change.latest.revision
+
+
+def _cell_patchset(now, change):
+    return change.latest.number
+
+
+# columns formatted from a Change's own slots; any other column is
+# formatted from its entry in the Change's fields.
+_CELLS = {
+    'number': _cell_number,
+    'age': _cell_age,
+    'state': _cell_state,
+    'subject': _cell_subject,
+    'owner': _cell_owner,
+    'commitid': _cell_commitid,
+    'patchset': _cell_patchset,
+}
+
+
+def _cell_field(name):
+    def cell(now, change):
+        return change.fields.get(name)
+
+    return cell
+
+
+def _truncated(cell, length):
+    def truncated(now, change):
+        data = cell(now, change)
+        if isinstance(data, six.string_types) and len(data) > length:
+            data = data[0:length - 3] + "..."
+        return data
+
+    return truncated
+
+
+def _compile_column(column):
+    name = column.get('name')
     length = column.get('length')
 
-    if field == 'number':
-        return int(review.get(field))
-
-    if field == 'age':
-        data = _format_age(now - int(review.get('lastUpdated')))
-    elif field == 'state':
-        data = _format_state(review.get('currentPatchSet'))
-    elif field == 'subject':
-        data = review.get('subject').replace('\t', '   ')
-    elif field == 'owner':
-        o = review.get('owner')
-        data = o.get('name', o.get('username', o.get('email')))
-    elif field == 'commitid':
-        data = review.get('patchSets')[-1].get('revision')
-    elif field == 'patchset':
-        data = review.get('patchSets')[-1].get('number')
-    else:
-        data = review.get(field)
+    cell = _CELLS.get(name) or _cell_field(name)
+    if name == 'number' or not length > 0:
+        return cell
 
-    if length > 0 and len(data) > length:
-        data = data[0:length - 3] + "..."
+    return _truncated(cell, length)
 
-    return data
 
+def compile_show(show):
+    # the show list (as returned by construct_show) as a plan: for each
+    # column, a function of (now, change) giving its cell.
+    return [_compile_column(column) for column in show]
 
-def process_results(o):
-    output = []
+
+def _format_column(now, column, review):
+    if not isinstance(review, Change):
+        review = Change(review, [column.get('name')])
+
+    return _compile_column(column)(now, review)
+
+
+def iter_results(lines, lazy=False):
+    # generator over the reviews in an iterable of JSON lines (as returned
+    # by GerritSSH.query_stream), one review at a time. The rowCount in
+    # the trailing stats line is checked once the input is exhausted.
+    #
+    # with lazy, reviews are LazyReview objects which are only decoded
+    # when a field is first used; only lines that may be the stats line
+    # are decoded up front.
     rows = 0
     rowcount = 0
 
-    for line in o.split("\n"):
-        if line != "":
-            review = json.loads(line)
-            if review.get('number', None) is not None:
-                rows += 1
-                output.append(review)
-            elif review.get('rowCount') is not None:
-                rowcount = int(review.get('rowCount'))
+    for line in lines:
+        line = line.strip()
+        if line == "":
+            continue
+
+        if lazy and '"rowCount"' not in line:
+            rows += 1
+            yield gerrit_json.LazyReview(line)
+            continue
+
+        review = gerrit_json.loads(line)
+        if review.get('number', None) is not None:
+            rows += 1
+            yield review
+        elif review.get('rowCount') is not None:
+            rowcount = int(review.get('rowCount'))
 
     if rows != rowcount:
         raise Exception("mismatch between expected and found rows.")
 
-    return output
+
+def process_results(o):
+    return list(iter_results(o.split("\n")))
+
+
+# what 'default' expands to when the configuration doesn't say
+_DEFAULT_QUERY = ['owner:self', 'status:open']
+_DEFAULT_SHOW = ["number:r", "project:l", "owner:l", "subject:l:80", "age:r"]
+
+
+def _alias_table(config, section):
+    # the expanded aliases of a section of the configuration, shared by
+    # every expansion with config. They may have been loaded with it.
+    if not config:
+        return None
+
+    return config.setdefault('aliases', {}).setdefault(section, {})
+
+
+def alias_tables(config):
+    # every alias in the queries and results sections of config, expanded.
+    # Aliases that can't be expanded are left out, to fail when used.
+    tables = {}
+    for section, default in (('queries', _DEFAULT_QUERY),
+                             ('results', _DEFAULT_SHOW)):
+        configdict = config.get(section) or {}
+        table = {}
+        for name in configdict:
+            try:
+                _resolve(name, configdict, default, table, [])
+            except Exception:
+                pass
+        tables[section] = table
+
+    return tables
 
 
 def construct_query(inlist, config):
     _i = ['default'] if inlist is None or len(inlist) == 0 else inlist
 
     return _expand_list(_i, config.get('queries') if config else None,
-                        ['owner:self', 'status:open'])
+                        _DEFAULT_QUERY, _alias_table(config, 'queries'))
+
+
+def construct_queries(inlist, config):
+    # each item of inlist expanded as a query of its own, for listing the
+    # changes that match any of them.
+    if inlist is None or len(inlist) == 0:
+        return [construct_query(inlist, config)]
+
+    return [construct_query([item], config) for item in inlist]
+
+
+def or_query(queries):
+    # a single query matching what any of queries does
+    if len(queries) == 1:
+        return queries[0]
+
+    return ['(%s)' % ' OR '.join('(%s)' % ' '.join(q) for q in queries)]
+
+
+# the query flags each column needs, beyond the top level change fields
+# which are always returned.
+_COLUMN_FLAGS = {
+    'state': ['current_patch_set'],
+    'commitid': ['current_patch_set'],
+    'patchset': ['current_patch_set'],
+    'currentPatchSet': ['current_patch_set'],
+    'patchSets': ['all_patch_sets'],
+    'comments': ['show_comments'],
+    'commitMessage': ['show_commit_message'],
+    'dependsOn': ['show_dependencies'],
+    'neededBy': ['show_dependencies'],
+    'allReviewers': ['show_all_reviewers'],
+    'insertions': ['current_patch_set'],
+    'deletions': ['current_patch_set'],
+    'reviewers': ['show_all_reviewers'],
+}
+
+
+def register_column(name, extract, flags=None):
+    # add a column, computed by extract from the decoded JSON of a change
+    # which is queried with flags (a list of GerritSSH.query flags).
+    EXTRACTORS[name] = extract
+    _COLUMN_FLAGS[name] = list(flags or [])
+
+
+def query_flags(show):
+    # the smallest set of GerritSSH.query flags that returns every field
+    # the columns in show (as returned by construct_show) are built from.
+    flags = {'current_patch_set': False,
+             'all_patch_sets': False,
+             'all_approvals': False}
+
+    for column in show:
+        for flag in _COLUMN_FLAGS.get(column.get('name'), []):
+            flags[flag] = True
+
+    return flags
 
 
 def construct_show(inlist, config):
     _i = ['default'] if inlist is None or len(inlist) == 0 else inlist
 
     expanded_list = _expand_list(_i, config.get('results') if config else None,
-                                 ["number:r", "project:l", "owner:l",
-                                  "subject:l:80", "age:r"])
+                                 _DEFAULT_SHOW,
+                                 _alias_table(config, 'results'))
     show_list = []
     for element in expanded_list:
         pieces = element.split(':')
@@ -216,18 +405,50 @@ def construct_show(inlist, config):
     return show_list
 
 
-def generate_output(o, show):
-    reviews = process_results(o)
-    now = time.time()
+def iter_changes(lines, show):
+    # generator over the changes in an iterable of JSON lines, as Change
+    # records holding what the columns in show need.
+    names = [column.get('name') for column in show]
+
+    for review in iter_results(lines):
+        yield Change(review, names)
+
 
-    data = []
+def _tally_states(batch):
+    for change, state in zip(batch, format_states([c.votes for c in batch])):
+        change.state = state
+        change.votes = None
 
-    for review in reviews:
-        row = []
+    return batch
 
-        for column in show:
-            row.append(_format_column(now, column, review))
 
-        data.append(row)
+def _with_states(changes, size):
+    # fill in the state of each change, tallying votes a batch of size
+    # changes at a time.
+    batch = []
+    for change in changes:
+        batch.append(change)
+        if len(batch) == size:
+            for change in _tally_states(batch):
+                yield change
+            batch = []
 
-    return data, show
+    for change in _tally_states(batch):
+        yield change
+
+
+def iter_output(lines, show, batch=1024):
+    # generator over the formatted rows for an iterable of JSON lines.
+    now = time.time()
+
+    changes = iter_changes(lines, show)
+    if 'state' in [column.get('name') for column in show]:
+        changes = _with_states(changes, batch)
+
+    plan = compile_show(show)
+    for change in changes:
+        yield [cell(now, change) for cell in plan]
+
+
+def generate_output(o, show):
+    return list(iter_output(o.split("\n"), show)), show
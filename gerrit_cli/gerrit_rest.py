@@ -0,0 +1,444 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# gerrit_rest:
+#
+# GerritREST talks to gerrit's REST API over HTTP(S), for servers that
+# only expose that, with the same interface as GerritSSH. Query results
+# are translated into the JSON lines 'gerrit query' writes, so everything
+# downstream (the cache, mirrors, the store, the columns) works the same
+# with either. The 'transport' option picks one ("ssh", the default, or
+# "rest").
+#
+# HTTP connections are kept alive and pooled per server for the life of
+# the process, shared by all sessions and threads, and responses are
+# gzipped.
+#
+# stream-events has no REST counterpart, so sync needs ssh.
+#
+
+import base64
+import calendar
+import json
+from six.moves import http_client
+from six.moves.urllib.parse import quote
+from six.moves.urllib.parse import urlencode
+from six.moves.urllib.parse import urlsplit
+import threading
+import time
+import zlib
+
+from gerrit_ssh import _prefetch
+
+
+# the most idle connections kept for any one server
+_POOL_SIZE = 8
+
+# gerrit prefixes JSON responses with this, against XSSI
+_MAGIC = b")]}'"
+
+# the REST options needed for what each GerritSSH.query flag returns
+_FLAG_OPTIONS = {
+    'current_patch_set': ['CURRENT_REVISION', 'DETAILED_LABELS'],
+    'all_patch_sets': ['ALL_REVISIONS'],
+    'all_approvals': ['DETAILED_LABELS'],
+    'show_files': ['CURRENT_REVISION', 'CURRENT_FILES'],
+    'show_comments': ['MESSAGES'],
+    'show_commit_message': ['CURRENT_REVISION', 'CURRENT_COMMIT'],
+    'show_dependencies': [],
+    'show_all_reviewers': ['DETAILED_LABELS'],
+}
+
+
+class HTTPPool(object):
+    # idle keep-alive connections to one server, taken for a request and
+    # given back once its response has been read.
+    def __init__(self, scheme, netloc, timeout=None):
+        self.scheme = scheme
+        self.netloc = netloc
+        self.timeout = timeout
+        self.idle = []
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    def get(self):
+        # a connection, and whether it has been used before
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+            self.opened += 1
+
+        if self.scheme == 'https':
+            return http_client.HTTPSConnection(self.netloc,
+                                               timeout=self.timeout), False
+        return http_client.HTTPConnection(self.netloc,
+                                          timeout=self.timeout), False
+
+    def put(self, conn):
+        with self.lock:
+            if len(self.idle) < _POOL_SIZE:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            for conn in self.idle:
+                conn.close()
+            self.idle = []
+
+
+# pools shared by all GerritREST sessions in this process, keyed by
+# (scheme, netloc).
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(scheme, netloc, timeout):
+    with _pools_lock:
+        pool = _pools.get((scheme, netloc))
+        if pool is None:
+            pool = _pools[(scheme, netloc)] = HTTPPool(scheme, netloc,
+                                                       timeout)
+    return pool
+
+
+class RESTError(Exception):
+    def __init__(self, status, reason, body):
+        super(RESTError, self).__init__("%s %s: %s" % (status, reason,
+                                                       body.strip()))
+        self.status = status
+        self.body = body
+
+
+def _epoch(timestamp):
+    # gerrit's REST timestamps are UTC, with nanoseconds
+    if not timestamp:
+        return None
+    return calendar.timegm(time.strptime(timestamp[:19], '%Y-%m-%d %H:%M:%S'))
+
+
+def _account(account):
+    if account is None:
+        return None
+    return dict((k, account[k]) for k in ('name', 'email', 'username')
+                if k in account)
+
+
+def _approvals(labels):
+    approvals = []
+    for label in sorted(labels or {}):
+        for vote in labels[label].get('all', []):
+            if not vote.get('value'):
+                continue
+            approvals.append({'type': label, 'description': label,
+                              'value': str(vote.get('value')),
+                              'grantedOn': _epoch(vote.get('date')),
+                              'by': _account(vote)})
+    return approvals
+
+
+def _patchset(revision, info):
+    return {'number': info.get('_number'), 'revision': revision,
+            'ref': info.get('ref'),
+            'uploader': _account(info.get('uploader')),
+            'createdOn': _epoch(info.get('created'))}
+
+
+def to_ssh(change, url):
+    # a ChangeInfo from the REST API as the JSON 'gerrit query' writes
+    # for the same change; url is the server's.
+    review = {'project': change.get('project'),
+              'branch': change.get('branch'),
+              'id': change.get('change_id'),
+              'number': change.get('_number'),
+              'subject': change.get('subject'),
+              'owner': _account(change.get('owner')),
+              'url': '%s/%s' % (url, change.get('_number')),
+              'createdOn': _epoch(change.get('created')),
+              'lastUpdated': _epoch(change.get('updated')),
+              'open': change.get('status') == 'NEW',
+              'status': change.get('status')}
+
+    if change.get('topic'):
+        review['topic'] = change.get('topic')
+
+    revisions = change.get('revisions') or {}
+    current = change.get('current_revision')
+    if current in revisions:
+        info = revisions[current]
+        cps = _patchset(current, info)
+        cps['approvals'] = _approvals(change.get('labels'))
+        cps['sizeInsertions'] = change.get('insertions')
+        cps['sizeDeletions'] = -change.get('deletions', 0)
+        if info.get('files'):
+            cps['files'] = [{'file': f, 'type': d.get('status', 'MODIFIED'),
+                             'insertions': d.get('lines_inserted', 0),
+                             'deletions': -d.get('lines_deleted', 0)}
+                            for f, d in sorted(info.get('files').items())]
+        review['currentPatchSet'] = cps
+
+        if info.get('commit', {}).get('message'):
+            review['commitMessage'] = info.get('commit').get('message')
+
+    if revisions:
+        review['patchSets'] = sorted(
+            [_patchset(r, i) for r, i in revisions.items()],
+            key=lambda ps: ps.get('number'))
+
+    reviewers = (change.get('reviewers') or {}).get('REVIEWER')
+    if reviewers is not None:
+        review['allReviewers'] = [_account(a) for a in reviewers]
+
+    if change.get('messages') is not None:
+        review['comments'] = [{'timestamp': _epoch(m.get('date')),
+                               'reviewer': _account(m.get('author')),
+                               'message': m.get('message')}
+                              for m in change.get('messages')]
+
+    return review
+
+
+class GerritREST(object):
+    def __init__(self, config):
+        self.config = config
+
+        url = config.get('rest-url') or 'https://%s' % config.get('host')
+        self.url = url.rstrip('/')
+        parts = urlsplit(self.url)
+        self.pool = _get_pool(parts.scheme, parts.netloc,
+                              config.get('rest-timeout', 60))
+        self.origin = '%s://%s' % (parts.scheme, parts.netloc)
+        self.path = parts.path
+
+        self.headers = {'Accept': 'application/json',
+                        'Accept-Encoding': 'gzip'}
+        username = config.get('http-username')
+        if username:
+            # authenticated requests go to /a/...
+            self.path += '/a'
+            credentials = '%s:%s' % (username,
+                                     config.get('http-password', ''))
+            self.headers['Authorization'] = 'Basic %s' % base64.b64encode(
+                credentials.encode('utf-8')).decode('ascii')
+
+    def _request(self, method, path, body=None):
+        # (status, reason, body) of a request, over a pooled connection. A
+        # connection the server closed while it was idle is replaced, and
+        # the request retried, for GETs.
+        headers = dict(self.headers)
+        if body is not None:
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json; charset=UTF-8'
+
+        while True:
+            conn, reused = self.pool.get()
+            try:
+                conn.request(method, self.path + path, body, headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http_client.HTTPException, IOError):
+                conn.close()
+                if reused and method == 'GET':
+                    continue
+                raise
+
+            if response.getheader('Content-Encoding') == 'gzip':
+                data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+            if response.will_close:
+                conn.close()
+            else:
+                self.pool.put(conn)
+
+            return response.status, response.reason, data
+
+    def _json(self, method, path, body=None):
+        status, reason, data = self._request(method, path, body)
+        if status >= 300:
+            raise RESTError(status, reason, data.decode('utf-8', 'replace'))
+
+        if data.startswith(_MAGIC):
+            data = data[len(_MAGIC):]
+        return json.loads(data.decode('utf-8')) if data.strip() else None
+
+    def _query_path(self, query, limit=-1, start=None,
+                    current_patch_set=False,
+                    all_patch_sets=True,
+                    all_approvals=True,
+                    show_files=False,
+                    show_comments=False,
+                    show_commit_message=False,
+                    show_dependencies=False,
+                    show_all_reviewers=False):
+        flags = {'current_patch_set': current_patch_set,
+                 'all_patch_sets': all_patch_sets,
+                 'all_approvals': all_approvals,
+                 'show_files': show_files,
+                 'show_comments': show_comments,
+                 'show_commit_message': show_commit_message,
+                 'show_dependencies': show_dependencies,
+                 'show_all_reviewers': show_all_reviewers}
+
+        options = ['DETAILED_ACCOUNTS']
+        for flag in sorted(flags):
+            if flags[flag]:
+                options.extend(o for o in _FLAG_OPTIONS[flag]
+                               if o not in options)
+
+        params = [('q', ' '.join(query))] + [('o', o) for o in options]
+        if limit != -1:
+            params.append(('n', limit))
+        if start:
+            params.append(('S', start))
+
+        return '/changes/?' + urlencode(params)
+
+    def _query_pages(self, query, max_results, kwargs):
+        # the server caps the number of changes a request returns, and
+        # marks the last one with _more_changes when it did. Follow it with
+        # S= offsets, up to max_results changes.
+        paginate = not [q for q in query if q.startswith('limit:')]
+
+        limit = kwargs.pop('limit', -1)
+        if max_results is not None and (limit == -1 or max_results < limit):
+            limit = max_results
+
+        rows = 0
+        more = False
+        while True:
+            page_limit = limit - rows if limit != -1 else -1
+            changes = self._json('GET', self._query_path(
+                query, limit=page_limit, start=rows, **kwargs))
+
+            for change in changes:
+                yield json.dumps(to_ssh(change, self.url)) + '\n'
+
+            rows += len(changes)
+            more = bool(changes) and changes[-1].get('_more_changes', False)
+
+            if (not more or not paginate or
+                    (limit != -1 and rows >= limit)):
+                break
+
+        yield json.dumps({'type': 'stats', 'rowCount': rows,
+                          'moreChanges': more}) + '\n'
+
+    def query(self, query, **kwargs):
+        if self.config.get('dry-run'):
+            kwargs.pop('max_results', None)
+            print('GET %s%s%s' % (self.origin, self.path,
+                                  self._query_path(query, **kwargs)))
+            return "", ""
+
+        max_results = kwargs.pop('max_results', None)
+        return ''.join(self._query_pages(query, max_results, kwargs)), ""
+
+    def query_stream(self, query, max_results=None, prefetch=False,
+                     **kwargs):
+        if not self.config.get('dry-run'):
+            lines = self._query_pages(query, max_results, kwargs)
+            if prefetch:
+                lines = _prefetch(lines,
+                                  self.config.get('query-prefetch', 1000))
+
+            for line in lines:
+                yield line
+        else:
+            self.query(query, **kwargs)
+
+    def stream_events(self):
+        raise Exception("stream-events needs the ssh transport")
+
+    def _changes(self, targets):
+        # (change number, revision) for each target, a commit id or
+        # change,patchset. Commit ids are looked up with a single query.
+        commits = [t for t in targets if ',' not in t]
+        found = {}
+        if commits:
+            query = ['(%s)' % ' OR '.join('commit:%s' % c for c in commits)]
+            for change in self._json('GET', self._query_path(
+                    query, all_patch_sets=True, all_approvals=False)):
+                for revision in change.get('revisions', {}):
+                    found[revision] = (change.get('_number'), revision)
+
+        changes = []
+        for t in targets:
+            if ',' in t:
+                changes.append(tuple(t.split(',', 1)))
+            else:
+                match = [found[r] for r in found if r.startswith(t)]
+                changes.append(match[0] if match else (None, t))
+        return changes
+
+    def _review_one(self, change, revision, message, labels, extra):
+        if change is None:
+            return 1, "", "no change with commit %s" % revision
+
+        m = ' '.join(message)
+        try:
+            if extra in ('--abandon', '--restore'):
+                if labels:
+                    self._json('POST', '/changes/%s/revisions/%s/review' %
+                               (change, quote(str(revision))),
+                               {'labels': labels})
+                self._json('POST', '/changes/%s/%s' % (change, extra[2:]),
+                           {'message': m})
+            else:
+                body = {'message': m}
+                if labels:
+                    body['labels'] = labels
+                self._json('POST', '/changes/%s/revisions/%s/review' %
+                           (change, quote(str(revision))), body)
+        except RESTError as e:
+            return 1, "", str(e)
+
+        return 0, "", ""
+
+    def review(self, targets, message, review, workflow, extra=None,
+               keys=None):
+        # review each of targets, returning a (returncode, stdout,
+        # stderr) per target as GerritSSH.review does. keys are not needed
+        # as each change is reviewed with a request of its own.
+        labels = {}
+        if review:
+            labels['Code-Review'] = int(review)
+        if workflow:
+            labels['Workflow'] = int(workflow)
+
+        if self.config.get('dry-run'):
+            return [(0, 'POST %s %s %s %s' % (t, ' '.join(message), labels,
+                                              extra or ''), "")
+                    for t in targets]
+
+        try:
+            changes = self._changes(targets)
+        except (RESTError, http_client.HTTPException, IOError) as e:
+            return [(1, "", str(e))] * len(targets)
+
+        return [self._review_one(change, revision, message, labels, extra)
+                for change, revision in changes]
+
+    def update(self, commitid, message, review, workflow):
+        return self.review([commitid], message, review, workflow)[0]
+
+    def abandon(self, commitid, message, review, workflow):
+        return self.review([commitid], message, review, workflow,
+                           '--abandon')[0]
+
+    def restore(self, commitid, message, review, workflow):
+        return self.review([commitid], message, review, workflow,
+                           '--restore')[0]
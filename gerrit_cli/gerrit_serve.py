@@ -0,0 +1,287 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# gerrit_serve:
+#
+# 'gerrit-cli serve' runs a long lived server listening on a Unix socket,
+# and any other gerrit-cli command finding it there forwards its arguments
+# to it rather than running them itself, copying the output the server
+# streams back. The server has the subcommand modules imported already,
+# and keeps its ssh control masters (see gerrit_ssh) open between
+# commands, so a forwarded command skips both the imports and the ssh
+# handshake.
+#
+# Commands are run one at a time, in the order they arrive, with the
+# server's stdout and stderr sent back to the command that forwarded them.
+#
+# Both ends exchange frames: a kind byte, a 4 byte length and the data.
+# The command sends an 'r' frame with its working directory and arguments,
+# separated by NULs. The server replies with 'o' (stdout) and 'e' (stderr)
+# frames as output is produced, and finally an 'x' frame with the exit
+# status.
+#
+# The socket is at $GERRIT_CLI_SOCKET, or ~/.gerrit-cli/serve.sock, and
+# only the user running the server may connect to it.
+#
+# Every command calls forward(), so modules only the server needs are
+# imported where the server uses them.
+#
+
+import os
+import struct
+import sys
+
+
+SOCKET = '~/.gerrit-cli/serve.sock'
+
+_HEADER = struct.Struct('!cI')
+
+# output is sent back once this much has been written, or when flushed
+_FLUSH_SIZE = 16384
+
+
+def socket_path():
+    return os.path.expandvars(os.path.expanduser(
+        os.environ.get('GERRIT_CLI_SOCKET', SOCKET)))
+
+
+def _send(sock, kind, data):
+    sock.sendall(_HEADER.pack(kind, len(data)) + data)
+
+
+def _receive(f):
+    # the next (kind, data) frame read from the file f, or (None, None)
+    # at the end of the stream.
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None, None
+
+    kind, length = _HEADER.unpack(header)
+    data = f.read(length)
+    if len(data) < length:
+        return None, None
+
+    return kind, data
+
+
+def _connect(path):
+    # socket is slow to import, and every command checks for a server, so
+    # it is only imported once there is a socket to connect to.
+    import socket
+
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+    except socket.error:
+        s.close()
+        return None
+
+    return s
+
+
+def forward(argv, cwd=None, path=None):
+    # run argv in the server listening at path, copying what it writes to
+    # our stdout and stderr. Returns its exit status, or None if there is
+    # no server, in which case the caller runs argv itself.
+    path = path or socket_path()
+    if not os.path.exists(path):
+        return None
+
+    s = _connect(path)
+    if s is None:
+        return None
+
+    try:
+        request = [cwd or os.getcwd()] + list(argv)
+        _send(s, b'r', b'\0'.join(a.encode('utf-8') for a in request))
+
+        streams = {b'o': sys.stdout, b'e': sys.stderr}
+        f = s.makefile('rb')
+        while True:
+            kind, data = _receive(f)
+            if kind is None:
+                raise Exception("the gerrit-cli server at %s closed the "
+                                "connection" % path)
+
+            if kind == b'x':
+                return int(data)
+
+            stream = streams[kind]
+            getattr(stream, 'buffer', stream).write(data)
+            stream.flush()
+    finally:
+        s.close()
+
+
+class _Channel(object):
+    # a file like object for sys.stdout or sys.stderr while a command is
+    # run, sending what is written to it as frames of kind.
+    def __init__(self, sock, kind, lock):
+        self.sock = sock
+        self.kind = kind
+        self.lock = lock
+        self.pending = []
+        self.size = 0
+
+    def write(self, s):
+        if not isinstance(s, bytes):
+            s = s.encode('utf-8')
+
+        with self.lock:
+            self.pending.append(s)
+            self.size += len(s)
+            if self.size >= _FLUSH_SIZE:
+                self._flush()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def _flush(self):
+        if self.pending:
+            _send(self.sock, self.kind, b''.join(self.pending))
+            self.pending = []
+            self.size = 0
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def isatty(self):
+        return False
+
+
+def _exit_status(code):
+    # the exit status python gives sys.exit(code)
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+
+    sys.stderr.write("%s\n" % code)
+    return 1
+
+
+class Server(object):
+    # execute(argv, cwd) runs a forwarded command.
+    def __init__(self, execute, path=None):
+        self.execute = execute
+        self.path = path or socket_path()
+        self.sock = None
+
+    def listen(self):
+        import socket
+
+        if os.path.exists(self.path):
+            s = _connect(self.path)
+            if s is not None:
+                s.close()
+                raise Exception("a gerrit-cli server is already listening "
+                                "on %s" % self.path)
+            os.unlink(self.path)
+
+        d = os.path.dirname(self.path)
+        if d and not os.path.isdir(d):
+            os.makedirs(d)
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o077)
+        try:
+            self.sock.bind(self.path)
+        finally:
+            os.umask(umask)
+        self.sock.listen(16)
+
+    def handle(self, conn):
+        import threading
+        import traceback
+
+        kind, data = _receive(conn.makefile('rb'))
+        if kind != b'r':
+            return
+
+        request = [a.decode('utf-8') for a in data.split(b'\0')]
+        cwd, argv = request[0], request[1:]
+
+        lock = threading.Lock()
+        stdout = _Channel(conn, b'o', lock)
+        stderr = _Channel(conn, b'e', lock)
+        saved = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = stdout, stderr
+        try:
+            try:
+                self.execute(argv, cwd)
+                status = 0
+            except SystemExit as e:
+                status = _exit_status(e.code)
+            except Exception:
+                traceback.print_exc()
+                status = 1
+        finally:
+            sys.stdout, sys.stderr = saved
+
+        stdout.flush()
+        stderr.flush()
+        _send(conn, b'x', str(status).encode('utf-8'))
+
+    def serve_forever(self):
+        import traceback
+
+        if self.sock is None:
+            self.listen()
+
+        try:
+            while True:
+                conn, _addr = self.sock.accept()
+                try:
+                    self.handle(conn)
+                except Exception:
+                    # the command went away, say, while output was being
+                    # sent to it
+                    traceback.print_exc()
+                finally:
+                    conn.close()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def gerrit_serve(args, config, execute):
+    import signal
+
+    server = Server(execute)
+    server.listen()
+
+    # so that the socket is removed when the server is killed
+    signal.signal(signal.SIGTERM, _interrupt)
+
+    print("gerrit-cli serving on %s" % server.path)
+    sys.stdout.flush()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
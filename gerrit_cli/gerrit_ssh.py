@@ -13,27 +13,577 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import atexit
+import json
+import os
+import random
+import re
+from six.moves import queue
 from subprocess import PIPE
 from subprocess import Popen
+import sys
+import tempfile
+import threading
+import time
+
+from gerrit_errors import SSHError
+
+
+# an established control master is only re-checked (with ssh -O check)
+# when it has not been verified in this many seconds, and one that could
+# not be opened is only tried again after as long.
+_CHECK_INTERVAL = 30
+
+# control masters shared by all GerritSSH sessions in this process, keyed
+# by (ssh, host, port).
+_masters = {}
+_masters_lock = threading.Lock()
+
+
+# a multiplexed ssh connection to a gerrit server. The master is opened
+# lazily, the first time a command needs it, and every subsequent ssh
+# command to the same server runs over its control socket instead of
+# setting up a new connection. ControlPersist bounds how long an orphaned
+# master (say, after the process is killed) lingers; masters opened by this
+# process are stopped at exit. The control socket is shared with other
+# gerrit-cli processes, so a stopped master only refuses new commands, and
+# exits once those still running over it, perhaps another process's,
+# are done.
+class SSHControlMaster(object):
+    def __init__(self, ssh, host, port, path, persist):
+        self.ssh = ssh
+        self.host = host
+        self.port = str(port)
+        self.path = path
+        self.persist = persist
+        self.opened = False
+        self.checked = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def _control(self, op):
+        cmd = [self.ssh, '-o', 'ControlPath=%s' % self.path,
+               '-O', op, '-p', self.port, self.host]
+
+        p = Popen(cmd, shell=False, stdout=PIPE, stderr=PIPE,
+                  close_fds=True)
+        p.communicate()
+        return p.returncode == 0
+
+    def check(self):
+        return os.path.exists(self.path) and self._control('check')
+
+    def open(self):
+        d = os.path.dirname(self.path)
+        if not os.path.isdir(d):
+            os.makedirs(d)
+
+        cmd = [self.ssh, '-M', '-N', '-f',
+               '-o', 'ControlPath=%s' % self.path,
+               '-o', 'ControlPersist=%s' % self.persist,
+               '-p', self.port, self.host]
+
+        # the master backgrounds itself once the connection is up and
+        # would hold on to our pipes, so don't give it any.
+        with open(os.devnull, 'w') as devnull:
+            p = Popen(cmd, shell=False, stdout=devnull, stderr=devnull,
+                      close_fds=True)
+            p.wait()
+
+        self.opened = p.returncode == 0
+        return self.opened
+
+    def ensure(self):
+        with self.lock:
+            if time.time() - self.checked < _CHECK_INTERVAL:
+                return True
+
+            # commands run without one meanwhile, rather than each paying
+            # for a master that will not open
+            if time.time() - self.failed < _CHECK_INTERVAL:
+                return False
+
+            if not self.check() and not self.open():
+                self.failed = time.time()
+                return False
+
+            self.failed = 0
+
+            self.checked = time.time()
+            return True
+
+    def options(self):
+        return ['-o', 'ControlMaster=no', '-o', 'ControlPath=%s' % self.path]
+
+    def close(self):
+        with self.lock:
+            if self.opened:
+                self._control('stop')
+                self.opened = False
+            self.checked = 0
+            self.failed = 0
+
+
+def _get_master(config):
+    ssh = config.get('ssh-command', 'ssh')
+    host = config.get('host')
+    port = config.get('port')
+    key = (ssh, host, str(port))
+
+    with _masters_lock:
+        master = _masters.get(key)
+        if master is None:
+            path = os.path.join(
+                os.path.expanduser(config.get('ssh-control-dir',
+                                              '~/.gerrit-cli')),
+                'ssh-%s-%s' % (host, port))
+            master = SSHControlMaster(ssh, host, port, path,
+                                      config.get('ssh-control-persist', 60))
+            _masters[key] = master
+
+    return master
+
+
+def _close_masters():
+    with _masters_lock:
+        for master in _masters.values():
+            master.close()
+        _masters.clear()
+
+
+atexit.register(_close_masters)
+
+
+def _prefetch(lines, size):
+    # read the iterable lines on a separate thread, at most size items
+    # ahead of the consumer.
+    q = queue.Queue(size)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def reader():
+        try:
+            for line in lines:
+                if not put(line):
+                    break
+        except Exception as e:
+            put(e)
+        finally:
+            if hasattr(lines, 'close'):
+                lines.close()
+        put(done)
+
+    t = threading.Thread(target=reader)
+    t.daemon = True
+    t.start()
+
+    try:
+        while True:
+            item = q.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+# the seconds an ssh command may run for, or a query wait between lines,
+# unless ssh-timeout says otherwise
+_SSH_TIMEOUT = 300
+
+# ssh's exit status when it, rather than the remote command, failed
+_SSH_FAILED = 255
+
+# what ssh or gerrit says when a command could not be run now, but may be
+# if it is tried again later: the server could not be reached, or turned
+# the connection away. The command did not run.
+_UNAVAILABLE = re.compile(
+    r'Connection refused|Connection timed out|No route to host|'
+    r'Network is unreachable|(kex|ssh)_exchange_identification|'
+    r'Too many concurrent connections')
+
+# ... and when the connection was lost while the command ran, which may or
+# may not have taken effect.
+_INTERRUPTED = re.compile(
+    r'Connection reset|Connection closed|Broken pipe|Write failed|'
+    r'not responding')
+
+# ... and when ssh won't get any further however often it is tried
+_PERMANENT = re.compile(
+    r'Permission denied|Host key verification failed|'
+    r'Could not resolve hostname')
+
+
+def _classify(returncode, stderr):
+    # the kind of SSHError a command that exited with returncode is, or
+    # None for one that ran
+    if returncode == 0 or _PERMANENT.search(stderr):
+        return None
+    if _UNAVAILABLE.search(stderr):
+        return 'unavailable'
+    if returncode == _SSH_FAILED or _INTERRUPTED.search(stderr):
+        return 'interrupted'
+    return None
+
+
+class SSHTimeout(SSHError):
+    # an ssh command that ran for longer than it was allowed to
+    def __init__(self, cmd, timeout):
+        super(SSHTimeout, self).__init__(
+            cmd, None, "", 'timeout',
+            "ssh timed out after %ss: %s" % (timeout, ' '.join(cmd)))
+        self.timeout = timeout
+
+
+class _Watchdog(object):
+    # kills p once it has gone timeout seconds (if not None) without being
+    # touched, from a thread of its own; fired says whether it did.
+    def __init__(self, p, timeout):
+        self.p = p
+        self.timeout = timeout
+        self.fired = False
+        self.last = time.time()
+        self.stopped = threading.Event()
+
+        if timeout is not None:
+            t = threading.Thread(target=self._watch)
+            t.daemon = True
+            t.start()
+
+    def _watch(self):
+        while True:
+            remaining = self.last + self.timeout - time.time()
+            if remaining <= 0:
+                self.fired = True
+                try:
+                    self.p.kill()
+                except OSError:
+                    pass
+                return
+            if self.stopped.wait(remaining):
+                return
+
+    def touch(self):
+        self.last = time.time()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class _Backoff(object):
+    # the waits between attempts at a command, for up to ssh-retries more
+    # of them: exponential, from ssh-backoff seconds to at most
+    # ssh-backoff-max, and each a random fraction of that, so that clients
+    # turned away together don't all come back together.
+    def __init__(self, config):
+        self.retries = config.get('ssh-retries', 3)
+        self.base = config.get('ssh-backoff', 1)
+        self.cap = config.get('ssh-backoff-max', 30)
+        self.attempt = 0
+
+    def delay(self, error, read_only):
+        # the seconds to wait before trying again after error, which is
+        # raised if the command is not to be tried again
+        if not error.retriable(read_only) or self.attempt >= self.retries:
+            raise error
+
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** self.attempt))
+        self.attempt += 1
+        return delay
+
+
+class CircuitBreaker(object):
+    # stops a session sending commands to a server that keeps failing them.
+    # After threshold transient failures in a row the circuit opens, and
+    # commands fail at once rather than add to the server's load. reset
+    # seconds later one is let through, and if it succeeds the circuit
+    # closes again. A threshold of 0 never opens it.
+    def __init__(self, threshold, reset):
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def check(self, cmd):
+        # raises SSHError if cmd is not to be run
+        with self.lock:
+            if self.opened is None:
+                return
+            if not self.trial and time.time() - self.opened >= self.reset:
+                self.trial = True
+                return
+
+        raise SSHError(cmd, None, "", 'circuit-open',
+                       "not run after %d ssh commands in a row failed: %s" %
+                       (self.failures, ' '.join(cmd)))
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial = False
+            if self.threshold and self.failures >= self.threshold:
+                self.opened = time.time()
+
+
+def _query_error(line):
+    # the message of the error gerrit writes, in place of any results, for
+    # a query it can't run, if line is one
+    if '"error"' not in line:
+        return None
+
+    try:
+        error = json.loads(line)
+    except ValueError:
+        return None
+    return error.get('message') if error.get('type') == 'error' else None
+
+
+class _Pages(object):
+    # the pages of a query, for a session to run one command after another
+    # and read the lines of each; read says which lines are changes.
+    #
+    # gerrit caps the number of changes a query returns and sets
+    # moreChanges in the stats line when it did. Follow it, resuming
+    # either at an offset (--start) or, for servers that predate --start,
+    # after the sortKey of the last change seen. The per page stats lines
+    # are folded into one for the whole result.
+    def __init__(self, session, query, max_results, kwargs):
+        self.session = session
+        self.query = query
+        self.kwargs = dict(kwargs)
+
+        self.pagination = session.config.get('query-pagination', 'start')
+        if [q for q in query if q.startswith('limit:')]:
+            # the query carries its own limit, don't go past it
+            self.pagination = 'none'
+
+        self.limit = self.kwargs.pop('limit', -1)
+        if max_results is not None and (self.limit == -1 or
+                                        max_results < self.limit):
+            self.limit = max_results
+
+        self.rowcount = 0
+        self.rows = 0
+        self.start = None
+        self.sortkey = None
+        self.started = False
+
+        self.page_rows = 0
+        self.more = False
+        self.last = None
+
+    def _done(self):
+        self.rows += self.page_rows
+
+        if (not self.more or self.page_rows == 0 or
+                self.pagination == 'none' or
+                (self.limit != -1 and self.rows >= self.limit)):
+            return True
+
+        if self.pagination == 'sortkey':
+            key = json.loads(self.last).get('sortKey')
+            if not key or key == self.sortkey:
+                return True
+            self.sortkey = key
+        else:
+            self.start = self.rows
+
+        return False
+
+    def command(self):
+        # the command for the next page, or None once there are no more
+        if self.started and self._done():
+            return None
+        self.started = True
+
+        self.page_rows = 0
+        self.more = False
+        self.last = None
+
+        page_limit = self.limit - self.rows if self.limit != -1 else -1
+        self.cmd = self.session._query_command(self.query, limit=page_limit,
+                                               start=self.start,
+                                               resume_sortkey=self.sortkey,
+                                               **self.kwargs)
+        return self.cmd
+
+    def read(self, line):
+        if '"rowCount"' in line:
+            stats = json.loads(line)
+            self.rowcount += int(stats.get('rowCount'))
+            self.more = stats.get('moreChanges', False)
+            return False
+
+        if line.strip() == "":
+            return False
+
+        error = _query_error(line)
+        if error is not None:
+            raise SSHError(self.cmd, None, error,
+                           message="gerrit query failed: %s" % error)
+
+        self.page_rows += 1
+        self.last = line
+        return True
+
+    def stats(self):
+        return json.dumps({'type': 'stats', 'rowCount': self.rowcount,
+                           'moreChanges': self.more}) + '\n'
 
 
 class GerritSSH(object):
+    # commands that fail transiently (see SSHError) are tried again, after
+    # a while (see _Backoff), so long as the session's circuit breaker
+    # lets them; commands that fail otherwise raise SSHError, but for
+    # reviews, whose failures are reported a change at a time.
     def __init__(self, config):
         self.config = config
+        self.breaker = CircuitBreaker(config.get('ssh-breaker-threshold', 5),
+                                      config.get('ssh-breaker-reset', 30))
+
+    def _timeout(self, timeout):
+        # the seconds a command may run for given timeout: ssh-timeout if
+        # it is None, and no limit if it (or ssh-timeout) is 0
+        if timeout is None:
+            timeout = self.config.get('ssh-timeout', _SSH_TIMEOUT)
+        return timeout or None
+
+    def _ssh_command(self):
+        return [self.config.get('ssh-command', 'ssh')]
+
+    def _multiplexed(self, cmd):
+        # cmd[0] is the ssh program, insert the connection sharing options
+        # right after it when multiplexing is enabled (the default).
+        if self.config.get('ssh-multiplex', True):
+            master = _get_master(self.config)
+            if master.ensure():
+                cmd = cmd[:1] + master.options() + cmd[1:]
+
+        return cmd
 
-    def query(self, query, limit=-1,
-              current_patch_set=False,
-              all_patch_sets=True,
-              all_approvals=True,
-              show_files=False,
-              show_comments=False,
-              show_commit_message=False,
-              show_dependencies=False,
-              show_all_reviewers=False):
+    def _execute(self, cmd, timeout=None):
+        p = Popen(self._multiplexed(cmd), shell=False, stdout=PIPE,
+                  stderr=PIPE, close_fds=True, universal_newlines=True)
+        watchdog = _Watchdog(p, self._timeout(timeout))
+        try:
+            stdout, stderr = p.communicate()
+        finally:
+            watchdog.stop()
+
+        if watchdog.fired:
+            raise SSHTimeout(cmd, watchdog.timeout)
+
+        return p.returncode, stdout, stderr
+
+    def _call(self, cmd, read_only):
+        # (returncode, stdout, stderr) of cmd, run as many times as it
+        # takes, and may be, to get past transient failures; SSHError is
+        # raised if it can't be.
+        backoff = _Backoff(self.config)
+        while True:
+            self.breaker.check(cmd)
+            try:
+                returncode, stdout, stderr = self._execute(cmd)
+                kind = _classify(returncode, stderr)
+                if kind is None:
+                    self.breaker.success()
+                    return returncode, stdout, stderr
+                error = SSHError(cmd, returncode, stderr, kind)
+            except SSHTimeout as e:
+                error = e
 
-        cmd = ['ssh', self.config.get('host'),
-               '-p', str(self.config.get('port')),
-               'gerrit query', '--format=JSON']
+            self.breaker.failure()
+            time.sleep(backoff.delay(error, read_only))
+
+    def _stream(self, cmd, timeout=None):
+        # yield stdout a line at a time as ssh produces it, raising
+        # SSHError if ssh fails, or goes timeout seconds without a line.
+        # stderr goes to a temporary file so that a chatty server can't
+        # block the pipe we are reading from.
+        with tempfile.TemporaryFile(mode='w+') as stderr:
+            p = Popen(self._multiplexed(cmd), shell=False, stdout=PIPE,
+                      stderr=stderr, close_fds=True, universal_newlines=True)
+            watchdog = _Watchdog(p, self._timeout(timeout))
+            finished = False
+
+            try:
+                for line in iter(p.stdout.readline, ''):
+                    watchdog.touch()
+                    yield line
+                finished = True
+            finally:
+                watchdog.stop()
+                if not finished and p.poll() is None:
+                    p.kill()
+                p.stdout.close()
+                p.wait()
+
+            if watchdog.fired:
+                raise SSHTimeout(cmd, watchdog.timeout)
+
+            if p.returncode != 0:
+                stderr.seek(0)
+                s = stderr.read()
+                raise SSHError(cmd, p.returncode, s,
+                               _classify(p.returncode, s))
+
+    def _page(self, cmd):
+        # the lines of a page of a query, which is run again after a
+        # transient failure so long as none of its lines have been read
+        backoff = _Backoff(self.config)
+        while True:
+            self.breaker.check(cmd)
+            read = False
+            try:
+                for line in self._stream(cmd):
+                    read = True
+                    yield line
+                self.breaker.success()
+                return
+            except SSHError as e:
+                if e.kind is None:
+                    self.breaker.success()
+                    raise
+                self.breaker.failure()
+                if read:
+                    raise
+                delay = backoff.delay(e, True)
+
+            time.sleep(delay)
+
+    def _query_command(self, query, limit=-1, start=None,
+                       resume_sortkey=None,
+                       current_patch_set=False,
+                       all_patch_sets=True,
+                       all_approvals=True,
+                       show_files=False,
+                       show_comments=False,
+                       show_commit_message=False,
+                       show_dependencies=False,
+                       show_all_reviewers=False):
+
+        cmd = self._ssh_command() + [self.config.get('host'),
+                                     '-p', str(self.config.get('port')),
+                                     'gerrit query', '--format=JSON']
 
         if current_patch_set:
             cmd.append('--current-patch-set')
@@ -50,38 +600,92 @@ class GerritSSH(object):
         if show_comments:
             cmd.append('--comments')
 
+        if show_commit_message:
+            cmd.append('--commit-message')
+
         if show_dependencies:
             cmd.append('--dependencies')
 
         if show_all_reviewers:
             cmd.append('--all-reviewers')
 
+        if start:
+            cmd.append('--start')
+            cmd.append(str(start))
+
         for element in query:
             cmd.append(element)
 
+        if resume_sortkey:
+            cmd.append("resume_sortkey:%s" % resume_sortkey)
+
         if limit != -1:
             cmd.append("limit:%s" % limit)
 
+        return cmd
+
+    def query(self, query, **kwargs):
+        # the whole result of query, as (stdout, stderr), fetched a page at
+        # a time as query_stream fetches it.
+        if self.config.get('dry-run'):
+            print(' '.join(self._query_command(query, **kwargs)))
+            return "", ""
+
+        return ''.join(self._query_pages(query, None, kwargs)), ""
+
+    def _query_pages(self, query, max_results, kwargs):
+        pages = _Pages(self, query, max_results, kwargs)
+
+        cmd = pages.command()
+        while cmd is not None:
+            for line in self._page(cmd):
+                if pages.read(line):
+                    yield line
+            cmd = pages.command()
+
+        yield pages.stats()
+
+    def query_stream(self, query, max_results=None, prefetch=False,
+                     **kwargs):
+        # like query(), but a generator of the JSON lines of the result,
+        # yielded as they arrive rather than after the whole result has
+        # been read into memory. Results larger than the server's page
+        # size are fetched page by page, up to max_results changes. With
+        # prefetch, lines are read ahead on a separate thread so that the
+        # next page is requested while this one is still being consumed.
+        if not self.config.get('dry-run'):
+            lines = self._query_pages(query, max_results, kwargs)
+            if prefetch:
+                lines = _prefetch(lines,
+                                  self.config.get('query-prefetch', 1000))
+
+            for line in lines:
+                yield line
+        else:
+            print(' '.join(self._query_command(query, **kwargs)))
+
+    def stream_events(self):
+        # a generator of the JSON lines of 'gerrit stream-events', which
+        # runs until the connection is closed. Events may be hours apart,
+        # so they are waited for without a timeout.
+        cmd = self._ssh_command() + [self.config.get('host'),
+                                     '-p', str(self.config.get('port')),
+                                     'gerrit stream-events']
+
         if not self.config.get('dry-run'):
             try:
-                p = Popen(cmd, shell=False, stdout=PIPE, stderr=PIPE,
-                          close_fds=True)
-                stdout, stderr = p.communicate()
-                if p.returncode != 0:
-                    if stderr and stderr != "":
-                        print(stderr)
-            except Exception:
-                raise
+                for line in self._stream(cmd, 0):
+                    yield line
+            except SSHError as e:
+                print(e)
         else:
             print(' '.join(cmd))
-            return "", ""
-
-        return stdout, stderr
 
-    def _review(self, commitid, message, review, workflow, extra=None):
-        cmd = ['ssh', self.config.get('host'),
-               '-p', str(self.config.get('port')),
-               'gerrit review']
+    def _review_command(self, targets, message, review, workflow,
+                        extra=None):
+        cmd = self._ssh_command() + [self.config.get('host'),
+                                     '-p', str(self.config.get('port')),
+                                     'gerrit review']
 
         m = ' '.join(_m for _m in message)
 
@@ -101,22 +705,39 @@ class GerritSSH(object):
         if extra:
             cmd.append(extra)
 
-        cmd.append(commitid)
+        for target in targets:
+            cmd.append(target)
+
+        return cmd
+
+    def _review(self, commitid, message, review, workflow, extra=None):
+        cmd = self._review_command([commitid], message, review, workflow,
+                                   extra)
 
         if not self.config.get('dry-run'):
-            try:
-                p = Popen(cmd, shell=False, stdout=PIPE, stderr=PIPE,
-                          close_fds=True)
-                stdout, stderr = p.communicate()
-                if p.returncode != 0:
-                    if stdout and stdout != "":
-                        print(stdout)
-                    if stderr and stderr != "":
-                        print(stderr)
-            except Exception:
-                raise
+            return self._call(cmd, False)
         else:
-            print(' '.join(cmd))
+            return 0, ' '.join(cmd), ""
+
+    def review(self, targets, message, review, workflow, extra=None,
+               keys=None):
+        # review several changes (commit ids or change,patchset) with a
+        # single 'gerrit review', returning a (returncode, stdout, stderr)
+        # per target. gerrit reports each change that fails on its own
+        # line; keys, if given, are the strings (change number, commit id,
+        # ...) by which each target may be mentioned in those lines.
+        # SSHError is raised if gerrit couldn't be asked, or the outcome is
+        # not known.
+        cmd = self._review_command(targets, message, review, workflow,
+                                   extra)
+
+        if self.config.get('dry-run'):
+            return [(0, ' '.join(cmd), "")] + [(0, "", "")] * (
+                len(targets) - 1)
+
+        returncode, stdout, stderr = self._call(cmd, False)
+        return _attribute(targets, keys or [[t] for t in targets],
+                          returncode, stdout, stderr)
 
     def update(self, commitid, message, review, workflow):
         return self._review(commitid, message, review, workflow)
@@ -126,3 +747,78 @@ class GerritSSH(object):
 
     def restore(self, commitid, message, review, workflow):
         return self._review(commitid, message, review, workflow, '--restore')
+
+
+def open_session(config):
+    # a GerritSSH, or a GerritREST if the configuration's transport is
+    # "rest", or an AsyncGerritSSH if it is "ssh-async".
+    transport = config.get('transport', 'ssh')
+    if transport == 'rest':
+        from gerrit_rest import GerritREST
+        return GerritREST(config)
+
+    if transport == 'ssh-async':
+        if sys.version_info < (3, 8):
+            raise Exception("the ssh-async transport needs Python 3.8 or "
+                            "later")
+        from gerrit_async import AsyncGerritSSH
+        return AsyncGerritSSH(config)
+
+    if transport != 'ssh':
+        raise Exception("unknown transport %s, choose from ssh, ssh-async, "
+                        "rest" % transport)
+
+    return GerritSSH(config)
+
+
+# the line gerrit review ends with when any change in it failed
+_REVIEW_FAILED = 'one or more reviews failed'
+
+
+def _mentions(line, key):
+    # whether the error line names key. A bare change number only counts
+    # where it reads as one, 'change N' or 'N,patchset', and not as the
+    # patch set of another change (123,12) or any other number.
+    key = re.escape(str(key))
+    if key.isdigit():
+        pattern = r'\bchange %s(?![\w,])|(?<![\w,])%s,\d' % (key, key)
+    else:
+        pattern = r'(^|[^\w])%s($|[^\w])' % key
+
+    return re.search(pattern, line) is not None
+
+
+def _attribute(targets, keys, returncode, stdout, stderr):
+    # split the output of a multi-target gerrit review into a result per
+    # target. Error lines naming a target fail that target; if there are
+    # errors that name none of them, the outcome of every target not
+    # otherwise accounted for is unknown, and reported as a failure.
+    errors = [[] for t in targets]
+    unattributed = []
+
+    for line in (stderr or "").splitlines():
+        if line.strip() == "" or _REVIEW_FAILED in line:
+            continue
+
+        hits = [i for i, k in enumerate(keys)
+                if [x for x in k if _mentions(line, x)]]
+        for i in hits:
+            errors[i].append(line)
+        if len(hits) == 0:
+            unattributed.append(line)
+
+    if returncode != 0 and len(unattributed) == 0 and not any(errors):
+        unattributed.append(stderr.strip() if stderr and stderr.strip()
+                            else "gerrit review failed (%s)" % returncode)
+
+    results = []
+    for i in range(len(targets)):
+        if len(errors[i]) > 0:
+            results.append((1, "", '\n'.join(errors[i])))
+        elif returncode != 0 and len(unattributed) > 0:
+            results.append((1, "", "outcome unknown: %s" %
+                            '\n'.join(unattributed)))
+        else:
+            results.append((0, stdout if i == 0 else "", ""))
+
+    return results
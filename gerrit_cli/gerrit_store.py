@@ -0,0 +1,408 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# gerrit_store:
+#
+# an indexed SQLite store of change records, fed by the mirrors that sync
+# maintains. Each mirrored query is a 'scope' with the changes that match
+# it. A query that ANDs further terms onto a scope's terms can only match
+# changes in that scope, so ls answers it locally by translating the extra
+# operators to SQL over the scope's changes. Queries using operators the
+# translator doesn't know go to the server as before.
+#
+
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+
+_SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS changes ('
+    ' number INTEGER PRIMARY KEY, project TEXT, branch TEXT, topic TEXT,'
+    ' owner_username TEXT, owner_email TEXT, owner_name TEXT,'
+    ' status TEXT, last_updated INTEGER, data TEXT)',
+    'CREATE TABLE IF NOT EXISTS approvals ('
+    ' number INTEGER, label TEXT, value INTEGER, by_username TEXT,'
+    ' by_email TEXT)',
+    'CREATE TABLE IF NOT EXISTS scopes ('
+    ' scope TEXT PRIMARY KEY, terms TEXT, synced REAL)',
+    'CREATE TABLE IF NOT EXISTS members ('
+    ' scope TEXT, number INTEGER, PRIMARY KEY (scope, number))',
+    'CREATE INDEX IF NOT EXISTS changes_project ON changes (project)',
+    'CREATE INDEX IF NOT EXISTS changes_owner ON changes (owner_username)',
+    'CREATE INDEX IF NOT EXISTS changes_email ON changes (owner_email)',
+    'CREATE INDEX IF NOT EXISTS changes_name ON changes (owner_name)',
+    'CREATE INDEX IF NOT EXISTS changes_status ON changes (status)',
+    'CREATE INDEX IF NOT EXISTS changes_updated ON changes (last_updated)',
+    'CREATE INDEX IF NOT EXISTS approvals_number ON approvals'
+    ' (number, label, value)',
+]
+
+_STATUS = {'open': ['NEW'], 'pending': ['NEW'], 'new': ['NEW'],
+           'reviewed': None, 'closed': ['MERGED', 'ABANDONED'],
+           'merged': ['MERGED'], 'abandoned': ['ABANDONED'],
+           'draft': ['DRAFT']}
+
+_AGE = {'s': 1, 'sec': 1, 'second': 1, 'seconds': 1,
+        'm': 60, 'min': 60, 'minute': 60, 'minutes': 60,
+        'h': 3600, 'hr': 3600, 'hour': 3600, 'hours': 3600,
+        'd': 86400, 'day': 86400, 'days': 86400,
+        'w': 604800, 'week': 604800, 'weeks': 604800,
+        'mon': 2592000, 'month': 2592000, 'months': 2592000,
+        'y': 31536000, 'year': 31536000, 'years': 31536000}
+
+_TOKEN = re.compile(r'\s*(\(|\)|[^\s()"{]*(?:"[^"]*"|\{[^}]*\})|[^\s()]+)')
+_LABEL = re.compile(r'^([\w-]+?)(>=|<=|=|>|<|(?=[+-]\d))([+-]?\d+)'
+                    r'(?:,(.+))?$')
+
+
+def _normalize(query):
+    return ' '.join(' '.join(query).split())
+
+
+class _Unsupported(Exception):
+    pass
+
+
+class _Translator(object):
+    # a recursive descent parser for the gerrit query language, producing
+    # an SQL expression over the changes table. Raises _Unsupported on
+    # anything it can't translate faithfully.
+    def __init__(self, tokens, username, now):
+        self.tokens = tokens
+        self.pos = 0
+        self.username = username
+        self.now = now
+        self.params = []
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def parse(self):
+        sql = self._or()
+        if self._peek() is not None:
+            raise _Unsupported(self._peek())
+        return sql
+
+    def _or(self):
+        parts = [self._and()]
+        while self._peek() == 'OR':
+            self._next()
+            parts.append(self._and())
+        return parts[0] if len(parts) == 1 else '(%s)' % ' OR '.join(parts)
+
+    def _and(self):
+        parts = [self._unary()]
+        while self._peek() not in (None, 'OR', ')'):
+            if self._peek() == 'AND':
+                self._next()
+            parts.append(self._unary())
+        return parts[0] if len(parts) == 1 else '(%s)' % ' AND '.join(parts)
+
+    def _unary(self):
+        t = self._peek()
+        if t is None:
+            raise _Unsupported('unexpected end of query')
+
+        if t == 'NOT':
+            self._next()
+            return '(NOT %s)' % self._unary()
+
+        if t == '(':
+            self._next()
+            sql = self._or()
+            if self._peek() != ')':
+                raise _Unsupported('unbalanced parentheses')
+            self._next()
+            return sql
+
+        self._next()
+        if t.startswith('-') and len(t) > 1:
+            return '(NOT %s)' % self._term(t[1:])
+
+        return self._term(t)
+
+    def _user(self, user):
+        if user == 'self':
+            if not self.username:
+                raise _Unsupported('self without a configured username')
+            return self.username
+        return user
+
+    def _term(self, term):
+        if term.isdigit():
+            self.params.append(int(term))
+            return 'changes.number = ?'
+
+        op, _, value = term.partition(':')
+        if value == '':
+            raise _Unsupported(term)
+        if value[0] in '"{':
+            value = value[1:-1]
+
+        if op in ('project', 'branch', 'topic'):
+            self.params.append(value)
+            return '%s = ?' % op
+
+        if op == 'owner':
+            value = self._user(value)
+            self.params.extend([value, value, value])
+            return '(owner_username = ? OR owner_email = ? OR owner_name = ?)'
+
+        if op in ('status', 'is') and _STATUS.get(value):
+            states = _STATUS.get(value)
+            self.params.extend(states)
+            return 'status IN (%s)' % ','.join('?' * len(states))
+
+        if op == 'age':
+            m = re.match(r'^(\d+)([a-z]+)$', value)
+            if not m or m.group(2) not in _AGE:
+                raise _Unsupported(term)
+            self.params.append(self.now - int(m.group(1)) * _AGE[m.group(2)])
+            return 'last_updated <= ?'
+
+        if op == 'label':
+            return self._label(term, value)
+
+        raise _Unsupported(term)
+
+    def _label(self, term, value):
+        m = _LABEL.match(value)
+        if not m:
+            raise _Unsupported(term)
+
+        label, cmp, v, user = m.groups()
+        cmp = cmp or '='
+        v = int(v)
+
+        sql = ('EXISTS (SELECT 1 FROM approvals a WHERE '
+               'a.number = changes.number AND a.label = ? AND a.value %s ?' %
+               cmp)
+        self.params.extend([label, v])
+
+        if user:
+            user = self._user(user)
+            sql += ' AND (a.by_username = ? OR a.by_email = ?)'
+            self.params.extend([user, user])
+        sql += ')'
+
+        # like gerrit, a change with no votes on the label at all has an
+        # implicit 0 vote.
+        if {'=': v == 0, '>=': v <= 0, '>': v < 0,
+                '<=': v >= 0, '<': v > 0}.get(cmp):
+            sql = ('(%s OR NOT EXISTS (SELECT 1 FROM approvals a WHERE '
+                   'a.number = changes.number AND a.label = ?))' % sql)
+            self.params.append(label)
+
+        return sql
+
+
+def translate(query, username=None, now=None):
+    # translate a list of query terms to an SQL expression and parameters,
+    # or None if the query uses operators that can't be evaluated locally.
+    tokens = _TOKEN.findall(' '.join(query))
+    t = _Translator([x for x in tokens if x != ''], username,
+                    int(now if now is not None else time.time()))
+
+    try:
+        return t.parse(), t.params
+    except _Unsupported:
+        return None
+
+
+class ChangeStore(object):
+    def __init__(self, config):
+        self.config = config
+        self.path = os.path.expandvars(os.path.expanduser(config.get(
+            'store', '~/.gerrit-cli/changes-%s-%s.db' % (
+                config.get('host'), config.get('port')))))
+        self.lock = threading.Lock()
+        self.db = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def open(self):
+        if self.db is None:
+            d = os.path.dirname(self.path)
+            if not os.path.isdir(d):
+                os.makedirs(d)
+
+            # the sync flusher writes from its own thread
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            for statement in _SCHEMA:
+                self.db.execute(statement)
+
+        return self.db
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def _put(self, db, review):
+        number = int(review.get('number'))
+        owner = review.get('owner') or {}
+        db.execute('INSERT OR REPLACE INTO changes VALUES '
+                   '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                   (number, review.get('project'), review.get('branch'),
+                    review.get('topic'), owner.get('username'),
+                    owner.get('email'), owner.get('name'),
+                    review.get('status'),
+                    int(review.get('lastUpdated', 0)), json.dumps(review)))
+
+        db.execute('DELETE FROM approvals WHERE number = ?', (number,))
+        cps = review.get('currentPatchSet') or {}
+        db.executemany('INSERT INTO approvals VALUES (?, ?, ?, ?, ?)',
+                       [(number, a.get('type'), int(a.get('value', 0)),
+                         (a.get('by') or {}).get('username'),
+                         (a.get('by') or {}).get('email'))
+                        for a in cps.get('approvals', [])])
+
+    def update(self, query, changes, removed=(), replace=False):
+        # record changes (a list of change records) as members of the scope
+        # for query, and drop the numbers in removed from it. With replace
+        # the scope's membership is exactly changes.
+        scope = _normalize(query)
+
+        with self.lock:
+            db = self.open()
+            with db:
+                if replace:
+                    db.execute('DELETE FROM members WHERE scope = ?',
+                               (scope,))
+                for review in changes:
+                    self._put(db, review)
+                    db.execute('INSERT OR IGNORE INTO members VALUES (?, ?)',
+                               (scope, int(review.get('number'))))
+                for number in removed:
+                    db.execute('DELETE FROM members WHERE scope = ? AND '
+                               'number = ?', (scope, int(number)))
+                db.execute('INSERT OR REPLACE INTO scopes VALUES (?, ?, ?)',
+                           (scope, json.dumps(query), time.time()))
+
+    def touch(self, query):
+        with self.lock:
+            db = self.open()
+            with db:
+                db.execute('UPDATE scopes SET synced = ? WHERE scope = ?',
+                           (time.time(), _normalize(query)))
+
+    def covering(self, query):
+        # the freshest scope whose terms are all terms of query, as
+        # (scope, terms, synced), or None. Only a query that is its terms
+        # ANDed together is the scope ANDed with the rest of them.
+        if not _conjunctive(query):
+            return None
+
+        terms = set(query)
+        best = None
+
+        for scope, t, synced in self.open().execute(
+                'SELECT scope, terms, synced FROM scopes'):
+            t = json.loads(t)
+            if set(t) <= terms and (best is None or synced > best[2]):
+                best = (scope, t, synced)
+
+        return best
+
+    def select(self, query, scope_terms):
+        # the change records (as JSON) of the scope for scope_terms matching
+        # the rest of query, most recently updated first; None if the rest
+        # of query can't be evaluated locally.
+        rest = [q for q in query if q not in scope_terms]
+        where = 'members.scope = ?'
+        params = [_normalize(scope_terms)]
+
+        if len(rest) > 0:
+            t = translate(rest, self.config.get('username'))
+            if t is None:
+                return None
+            where = '%s AND %s' % (where, t[0])
+            params.extend(t[1])
+
+        # CROSS JOIN makes sqlite drive the lookup from the indexes on
+        # changes, checking scope membership second.
+        return [row[0] for row in self.open().execute(
+            'SELECT data FROM changes CROSS JOIN members '
+            'ON members.number = changes.number '
+            'WHERE %s ORDER BY last_updated DESC' % where, params)]
+
+
+def _standalone(term):
+    # whether term is a whole query ANDed with the ones around it: its
+    # groups balance, it has no OR outside them, and it neither starts
+    # with AND or OR nor ends with an operator that would bind it to the
+    # next term.
+    tokens = [t for t in _TOKEN.findall(term) if t != '']
+    if not tokens:
+        return True
+
+    depth = 0
+    for t in tokens:
+        if t == '(':
+            depth += 1
+        elif t == ')':
+            depth -= 1
+            if depth < 0:
+                return False
+        elif depth == 0 and t.upper() == 'OR':
+            return False
+
+    return (depth == 0 and tokens[0].upper() not in ('AND', 'OR') and
+            tokens[-1].upper() not in ('AND', 'OR', 'NOT'))
+
+
+def _conjunctive(query):
+    # whether query is its elements ANDed together
+    return not [q for q in query if not _standalone(q)]
+
+
+def store_lines(config, query):
+    # JSON lines answering query from the local store, or None when the
+    # store has no fresh scope covering query or can't evaluate it.
+    store = ChangeStore(config)
+    if not store.exists():
+        return None
+
+    try:
+        scope = store.covering(query)
+        if scope is None:
+            return None
+
+        staleness = time.time() - scope[2]
+        if staleness > config.get('mirror-staleness', 300):
+            return None
+
+        reviews = store.select(query, scope[1])
+        if reviews is None:
+            return None
+    finally:
+        store.close()
+
+    sys.stderr.write("answered from local store, %ds stale\n" %
+                     int(staleness))
+
+    return [r + '\n' for r in reviews] + [
+        json.dumps({'type': 'stats', 'rowCount': len(reviews)}) + '\n']
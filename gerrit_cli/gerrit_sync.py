@@ -0,0 +1,351 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# gerrit_sync:
+#
+# a local mirror of the changes matching a query, kept current by
+# 'gerrit stream-events'. The sync subcommand subscribes to the events,
+# seeds the mirror with a full query and then applies the events, those
+# that arrived while it was seeded first; ls and show answer from the
+# mirror for the same query, with no round trip to the server, for as long
+# as the mirror is not stale.
+#
+# The mirror is a JSON file under ~/.gerrit-cli/mirror holding the query
+# and the change records, in the same shape process_results returns them.
+# While sync is connected it touches the file every few seconds, so the
+# file's mtime is when the mirror was last known to be current. Mirrors
+# also feed the indexed store in gerrit_store.
+#
+
+import hashlib
+import json
+import os
+from six.moves import queue
+import sys
+import tempfile
+import threading
+import time
+
+from gerrit_query import construct_query
+from gerrit_query import iter_results
+from gerrit_ssh import open_session
+from gerrit_store import ChangeStore
+
+
+# events that can change whether a change matches the mirrored query, and
+# so are checked against the server after being applied.
+_RECONCILE = ('change-merged', 'change-abandoned', 'change-restored')
+
+# ... and for a query on labels, votes
+_RECONCILE_LABELS = _RECONCILE + ('comment-added',)
+
+
+def _by(account):
+    account = account or {}
+    return account.get('username', account.get('email', account.get('name')))
+
+
+class ChangeMirror(object):
+    def __init__(self, config, query):
+        self.config = config
+        self.query = query
+        self.changes = {}
+        self.synced = 0
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.labels = bool([q for q in query if 'label:' in q])
+
+        # what changed since the last save, for the indexed store
+        self.modified = set()
+        self.removed = set()
+        self.reseeded = False
+        self.store = (ChangeStore(config)
+                      if config.get('mirror-store', True) else None)
+
+        key = json.dumps([config.get('host'), str(config.get('port')),
+                          ' '.join(' '.join(query).split())])
+        self.path = os.path.join(
+            os.path.expandvars(os.path.expanduser(
+                config.get('mirror-dir', '~/.gerrit-cli/mirror'))),
+            hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        with open(self.path) as f:
+            m = json.load(f)
+
+        with self.lock:
+            self.changes = m.get('changes')
+            self.synced = os.path.getmtime(self.path)
+            self.dirty = False
+
+    def save(self):
+        d = os.path.dirname(self.path)
+        if not os.path.isdir(d):
+            os.makedirs(d)
+
+        with self.lock:
+            m = {'query': self.query, 'changes': self.changes}
+            fd, tmp = tempfile.mkstemp(dir=d, prefix='.tmp-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(m, f)
+            os.rename(tmp, self.path)
+
+            if self.store is not None:
+                self.store.update(self.query,
+                                  [self.changes[n] for n in self.modified
+                                   if n in self.changes],
+                                  self.removed, replace=self.reseeded)
+
+            self.synced = time.time()
+            self.dirty = False
+            self.modified = set()
+            self.removed = set()
+            self.reseeded = False
+
+    def touch(self):
+        if self.dirty or not self.exists():
+            self.save()
+        else:
+            os.utime(self.path, None)
+            if self.store is not None:
+                self.store.touch(self.query)
+            self.synced = time.time()
+
+    def staleness(self):
+        return time.time() - self.synced
+
+    def lines(self):
+        # the mirror as JSON lines, most recently updated first, suitable
+        # for iter_results and iter_output.
+        with self.lock:
+            changes = sorted(self.changes.values(),
+                             key=lambda c: int(c.get('lastUpdated', 0)),
+                             reverse=True)
+
+        for change in changes:
+            yield json.dumps(change) + '\n'
+        yield json.dumps({'type': 'stats', 'rowCount': len(changes)}) + '\n'
+
+    def seed(self, session):
+        changes = {}
+        for review in iter_results(session.query_stream(
+                self.query, current_patch_set=True)):
+            changes[str(review.get('number'))] = review
+
+        with self.lock:
+            self.changes = changes
+            self.dirty = True
+            self.modified = set(changes.keys())
+            self.removed = set()
+            self.reseeded = True
+
+    def reconcile(self, session, number):
+        # replace a change with the server's copy, or drop it if it no
+        # longer matches the query.
+        reviews = list(iter_results(session.query_stream(
+            ['change:%s' % number] + self.query, current_patch_set=True)))
+
+        with self.lock:
+            if len(reviews) > 0:
+                self.changes[str(number)] = reviews[0]
+                self.modified.add(str(number))
+            else:
+                self.changes.pop(str(number), None)
+                self.removed.add(str(number))
+            self.dirty = True
+
+    def apply(self, event):
+        # apply an event from stream-events to the mirror. Returns the
+        # change number if the change should be reconciled with the server
+        # (it may be new to the query, or its status changed), else None.
+        c = event.get('change')
+        if c is None or c.get('number') is None:
+            return None
+
+        number = str(c.get('number'))
+        etype = event.get('type')
+        when = event.get('eventCreatedOn', int(time.time()))
+
+        reconciled = _RECONCILE
+        if self.labels and event.get('approvals'):
+            reconciled = _RECONCILE_LABELS
+
+        with self.lock:
+            change = self.changes.get(number)
+            if change is None:
+                # a new change, or one that may have come to match, as
+                # one merged does status:merged
+                if etype == 'patchset-created' or etype in reconciled:
+                    return number
+                return None
+
+            ps = event.get('patchSet')
+
+            if etype == 'patchset-created' and ps is not None:
+                patchsets = change.setdefault('patchSets', [])
+                if not [p for p in patchsets
+                        if str(p.get('number')) == str(ps.get('number'))]:
+                    patchsets.append(dict(ps))
+                change['currentPatchSet'] = dict(ps)
+            elif etype == 'comment-added':
+                self._approve(change, ps, event.get('author'),
+                              event.get('approvals') or [], when)
+            elif etype == 'change-merged':
+                change['status'] = 'MERGED'
+                change['open'] = False
+            elif etype == 'change-abandoned':
+                change['status'] = 'ABANDONED'
+                change['open'] = False
+            elif etype == 'change-restored':
+                change['status'] = 'NEW'
+                change['open'] = True
+            else:
+                return None
+
+            change['lastUpdated'] = when
+            self.dirty = True
+            self.modified.add(number)
+
+        return number if etype in reconciled else None
+
+    def _approve(self, change, ps, author, approvals, when):
+        number = str(ps.get('number')) if ps is not None else None
+        targets = [change.get('currentPatchSet')] + change.get('patchSets',
+                                                               [])
+
+        for target in targets:
+            if target is None or (number is not None and
+                                  str(target.get('number')) != number):
+                continue
+
+            existing = target.get('approvals', [])
+            for a in approvals:
+                existing = [e for e in existing
+                            if not (e.get('type') == a.get('type') and
+                                    _by(e.get('by')) == _by(author))]
+                if int(a.get('value', 0)) != 0:
+                    existing.append({'type': a.get('type'),
+                                     'description': a.get('description'),
+                                     'value': a.get('value'),
+                                     'grantedOn': when,
+                                     'by': author})
+            target['approvals'] = existing
+
+
+def mirror_lines(config, query):
+    # the lines of a fresh enough mirror for query, or None if there is
+    # no mirror or it is too stale to answer from.
+    mirror = ChangeMirror(config, query)
+    if not mirror.exists():
+        return None
+
+    try:
+        mirror.load()
+    except (IOError, OSError, ValueError):
+        return None
+
+    staleness = mirror.staleness()
+    if staleness > config.get('mirror-staleness', 300):
+        return None
+
+    sys.stderr.write("answered from mirror, %ds stale\n" % int(staleness))
+    return mirror.lines()
+
+
+def _flusher(mirror, stop, interval):
+    # while connected the mirror is current; record that periodically,
+    # writing out any changes along with it.
+    while not stop.wait(interval):
+        mirror.touch()
+
+
+def _subscribe(session):
+    # a queue of the lines of session's event stream, read on a thread of
+    # its own, so that events arriving while the mirror is seeded are
+    # kept rather than missed. The stream's end is queued as None, and
+    # its failure as the exception.
+    events = queue.Queue()
+
+    def reader():
+        try:
+            for line in session.stream_events():
+                events.put(line)
+        except Exception as e:
+            events.put(e)
+        finally:
+            events.put(None)
+
+    t = threading.Thread(target=reader)
+    t.daemon = True
+    t.start()
+
+    return events
+
+
+def _events(events):
+    while True:
+        line = events.get()
+        if line is None:
+            return
+        if isinstance(line, Exception):
+            raise line
+        yield line
+
+
+def _sync(mirror, session, config):
+    # subscribe before seeding, and apply what arrived meanwhile after
+    events = _subscribe(session)
+    mirror.seed(session)
+    mirror.save()
+
+    stop = threading.Event()
+    flusher = threading.Thread(target=_flusher,
+                               args=(mirror, stop,
+                                     config.get('mirror-flush', 1)))
+    flusher.daemon = True
+    flusher.start()
+
+    try:
+        for line in _events(events):
+            if line.strip() == "":
+                continue
+
+            number = mirror.apply(json.loads(line))
+            if number is not None and config.get('mirror-reconcile', True):
+                mirror.reconcile(session, number)
+    finally:
+        stop.set()
+        flusher.join()
+        mirror.save()
+
+
+def gerrit_sync(args, config):
+    query = construct_query(args.query, config)
+    mirror = ChangeMirror(config, query)
+    session = open_session(config)
+
+    while True:
+        _sync(mirror, session, config)
+
+        if args.once:
+            return
+
+        # the event stream was dropped, events may have been missed while
+        # reconnecting so the mirror is seeded again.
+        time.sleep(config.get('mirror-reconnect', 5))
@@ -0,0 +1,240 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# gerrit_table:
+#
+# TABLE output, drawn as PrettyTable draws it, without holding every row:
+#
+#   sorted      the rows are sorted by a column, a run of _RUN_ROWS at a
+#               time; runs beyond the first are written to temporary files
+#               and merged. Every row has been seen before the first is
+#               drawn, so the columns are as wide as their widest value.
+#               When only the first N rows are wanted, they are kept in a
+#               heap instead.
+#   unsorted    the rows are drawn as they arrive. The columns are as wide
+#               as their widest value in the first _SAMPLE_ROWS rows, and
+#               when there are more, at least the column's length, where
+#               it has one; a later value that is wider is truncated, as
+#               values longer than a column's length are.
+#
+# A value's newlines are drawn as spaces, keeping each row on one line.
+#
+
+import heapq
+import itertools
+import marshal
+import six
+import tempfile
+
+
+# the rows looked at to decide the width of the columns of an unsorted
+# table
+_SAMPLE_ROWS = 1000
+
+# the rows sorted in memory at a time
+_RUN_ROWS = 1 << 16
+
+
+def _read_run(f):
+    f.seek(0)
+    while True:
+        try:
+            yield marshal.load(f)
+        except EOFError:
+            return
+
+
+class _Descending(object):
+    # an item ordered in reverse, for merging runs sorted in reverse
+    __slots__ = ['item']
+
+    def __init__(self, item):
+        self.item = item
+
+    def __lt__(self, other):
+        return other.item < self.item
+
+    def __eq__(self, other):
+        return self.item == other.item
+
+
+def _merge(runs, reverse):
+    if not reverse:
+        return heapq.merge(*runs)
+
+    return (d.item for d in heapq.merge(
+        *[(_Descending(item) for item in run) for run in runs]))
+
+
+def external_sort(items, run_rows=None, reverse=False):
+    # generator over items, sorted, holding no more than run_rows of them
+    # in memory; the rest are sorted a run at a time, in temporary files,
+    # and then merged. Items must be marshallable.
+    run_rows = run_rows or _RUN_ROWS
+
+    runs = []
+    run = []
+    try:
+        for item in items:
+            run.append(item)
+            if len(run) == run_rows:
+                run.sort(reverse=reverse)
+                f = tempfile.TemporaryFile()
+                for r in run:
+                    marshal.dump(r, f)
+                runs.append(f)
+                run = []
+
+        run.sort(reverse=reverse)
+        if not runs:
+            for r in run:
+                yield r
+            return
+
+        for r in _merge([iter(run)] + [_read_run(f) for f in runs],
+                        reverse):
+            yield r
+    finally:
+        for f in runs:
+            f.close()
+
+
+def _key(value):
+    # rows without a value sort first
+    return (0, '') if value is None else (1, value)
+
+
+def sort_rows(rows, index, reverse=False, limit=None, key=None):
+    # rows sorted by the value at index, through key, in a stable order;
+    # with limit, only the first limit of them, kept in a heap.
+    key = key or _key
+
+    if limit is not None:
+        top = heapq.nlargest if reverse else heapq.nsmallest
+        return iter(top(limit, rows, key=lambda row: key(row[index])))
+
+    # the position of each row decides between equal keys, and with
+    # reverse, it is negated to keep them in the order they came in
+    sign = -1 if reverse else 1
+    return (row for k, i, row in external_sort(
+        ((key(row[index]), sign * i, row) for i, row in enumerate(rows)),
+        reverse=reverse))
+
+
+def _cells(row):
+    return [six.text_type(value).replace('\n', ' ') for value in row]
+
+
+def _fit(cell, width):
+    if len(cell) <= width:
+        return cell
+    return cell[0:width - 3] + "..." if width > 3 else cell[0:width]
+
+
+def _aligned(cell, width, align):
+    if align == 'l':
+        return cell.ljust(width)
+    if align == 'c':
+        return cell.center(width)
+    return cell.rjust(width)
+
+
+class _Table(object):
+    def __init__(self, out, show):
+        self.out = out
+        self.aligns = [f.get('align') for f in show]
+        self.headers = [f.get('colname') for f in show]
+        self.widths = [len(h) for h in self.headers]
+
+    def measure(self, cells):
+        self.widths = [max(w, len(c)) for w, c in zip(self.widths, cells)]
+
+    def _line(self, cells):
+        self.out.write('| ' + ' | '.join(
+            _aligned(_fit(c, w), w, a)
+            for c, w, a in zip(cells, self.widths, self.aligns)) + ' |\n')
+
+    def draw(self, rows):
+        rule = '+' + '+'.join('-' * (w + 2) for w in self.widths) + '+\n'
+        self.out.write(rule)
+        self._line(self.headers)
+        self.out.write(rule)
+        for cells in rows:
+            self._line(cells)
+        self.out.write(rule)
+
+
+def render_table(out, show, rows, sortby=None, reverse=False, limit=None,
+                 key=None):
+    # write rows, with the columns in show, as a table to out; sorted by
+    # the value at index sortby, through key, or as they arrive. With
+    # limit, only the first limit rows are drawn.
+    table = _Table(out, show)
+
+    if sortby is not None and limit is not None:
+        top = [_cells(row) for row in sort_rows(rows, sortby, reverse, limit,
+                                                key)]
+        for cells in top:
+            table.measure(cells)
+        table.draw(top)
+        return
+
+    if sortby is not None:
+        key = key or _key
+
+        def decorated():
+            for row in rows:
+                cells = _cells(row)
+                table.measure(cells)
+                yield (key(row[sortby]), cells)
+
+        ordered = external_sort(decorated(), reverse=reverse)
+
+        # every row is measured once the first of them comes out of the
+        # sort, and before anything is drawn
+        first = next(ordered, None)
+
+        def drawn():
+            if first is not None:
+                yield first[1]
+            for k, cells in ordered:
+                yield cells
+
+        table.draw(drawn())
+        return
+
+    rows = iter(rows) if limit is None else itertools.islice(rows, limit)
+    sample = []
+    for row in rows:
+        sample.append(_cells(row))
+        if len(sample) == _SAMPLE_ROWS:
+            break
+
+    for cells in sample:
+        table.measure(cells)
+    if len(sample) == _SAMPLE_ROWS:
+        # there may be more rows, and no value is longer than its column's
+        # length
+        table.widths = [max(w, f.get('length') or 0)
+                        for w, f in zip(table.widths, show)]
+
+    def streamed():
+        for cells in sample:
+            yield cells
+        for row in rows:
+            yield _cells(row)
+
+    table.draw(streamed())
@@ -0,0 +1,274 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# gerrit_tally:
+#
+# vote tallies for the state column, worked out for a whole batch of
+# changes at once. Every vote in the batch is gathered into columns
+# (change, label, value), which are then counted into one row of counts
+# per change, with NumPy when it is installed and with array otherwise.
+# NumPy is slow to import, so that is put off until the first tally.
+#
+# Code-Review, Workflow and Verified are always shown, as R, W and V.
+# Any other label is shown under its own name on the changes that have
+# votes for it, counted from -2 to +2 like Code-Review, so that a vote
+# reads the same on every change.
+#
+
+from array import array
+from operator import itemgetter
+
+# NumPy once _load_numpy has imported it, or None if it isn't installed
+numpy = None
+_numpy_loaded = False
+
+
+def _load_numpy():
+    global numpy, _numpy_loaded
+
+    if not _numpy_loaded:
+        _numpy_loaded = True
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+
+    return numpy
+
+
+# the labels always shown: name, short name and the range of votes
+LABELS = [('Code-Review', 'R', -2, 2),
+          ('Workflow', 'W', -1, 1),
+          ('Verified', 'V', -2, 2)]
+
+# the range of votes counted for any other label
+OTHER = (-2, 2)
+
+# labels that are never shown
+IGNORED = ('Rollcall-Vote',)
+
+
+class Tallies(object):
+    # the counts of each vote for each label on a batch of changes. Label
+    # slot s occupies counts[i][offsets[s]:offsets[s] + widths[s]] for
+    # change i, counting votes from lows[s] upwards; seen[i][s] is set if
+    # change i has votes for it.
+    #
+    # Most changes share their tallies with others, so rows holds each
+    # distinct row of counts (followed by its seen flags) once, and
+    # index[i] is the row of change i.
+    __slots__ = ('names', 'lows', 'offsets', 'widths', 'counts', 'seen',
+                 'rows', 'index')
+
+    def __init__(self, names, lows, offsets, widths, counts, seen, rows,
+                 index):
+        self.names = names
+        self.lows = lows
+        self.offsets = offsets
+        self.widths = widths
+        self.counts = counts
+        self.seen = seen
+        self.rows = rows
+        self.index = index
+
+    def count(self, i, name):
+        if name not in self.names:
+            return None
+
+        s = self.names.index(name)
+        return [int(c) for c in self.counts[i][self.offsets[s]:
+                                               self.offsets[s] +
+                                               self.widths[s]]]
+
+
+def _collect(votes):
+    # every vote on every change in the batch, as columns of label slot
+    # and value, with the number of votes on each change.
+    slots = dict((label[0], s) for s, label in enumerate(LABELS))
+    slots.update((label, -1) for label in IGNORED)
+    names = [label[0] for label in LABELS]
+    lows = [label[2] for label in LABELS]
+    highs = [label[3] for label in LABELS]
+
+    approvals = [a for v in votes if v for a in v]
+    types = [a['type'] for a in approvals]
+    values = list(map(int, [a['value'] for a in approvals]))
+    lengths = [len(v) if v else 0 for v in votes]
+
+    for label in sorted(set(types).difference(slots)):
+        v = [value for t, value in zip(types, values) if t == label]
+        slots[label] = len(names)
+        names.append(label)
+        lows.append(min([OTHER[0]] + v))
+        highs.append(max([OTHER[1]] + v))
+
+    labels = [slots[t] for t in types]
+
+    return names, lows, highs, lengths, labels, values
+
+
+def _layout(lows, highs):
+    widths = [high - low + 1 for low, high in zip(lows, highs)]
+    offsets = [sum(widths[:s]) for s in range(len(widths))]
+
+    return widths, offsets
+
+
+def _count_numpy(names, lows, highs, lengths, labels, values):
+    n = len(lengths)
+    rows = numpy.repeat(numpy.arange(n, dtype=numpy.int64), lengths)
+    labels = numpy.array(labels, dtype=numpy.int64)
+    values = numpy.array(values, dtype=numpy.int64)
+
+    keep = labels >= 0
+    rows, labels, values = rows[keep], labels[keep], values[keep]
+
+    low = numpy.array(lows, dtype=numpy.int64)
+    high = numpy.array(highs, dtype=numpy.int64)
+    numpy.minimum.at(low, labels, values)
+    numpy.maximum.at(high, labels, values)
+
+    lows = low.tolist()
+    widths, offsets = _layout(lows, high.tolist())
+    total = sum(widths)
+
+    flat = (rows * total + numpy.array(offsets, dtype=numpy.int64)[labels] +
+            values - low[labels])
+    counts = numpy.bincount(flat, minlength=n * total).reshape(n, total)
+
+    seen = numpy.zeros((n, len(names)), dtype=numpy.int64)
+    seen[rows, labels] = 1
+
+    distinct, index = _distinct(numpy.hstack([counts, seen]))
+
+    return Tallies(names, lows, offsets, widths, counts, seen, distinct,
+                   index)
+
+
+def _distinct(rows):
+    # the distinct rows of a 2D array, and the index of each row in them.
+    # Rows are compared as a single integer, each column a digit in a base
+    # one more than its largest value, when that fits in 63 bits.
+    if len(rows) == 0:
+        return [], []
+
+    radix = (rows.max(axis=0) + 1).tolist()
+    weights = []
+    w = 1
+    for r in radix:
+        weights.append(w)
+        w *= r
+
+    if w < 2 ** 63:
+        keys = rows.dot(numpy.array(weights, dtype=numpy.int64))
+        keys, first, index = numpy.unique(keys, return_index=True,
+                                          return_inverse=True)
+        return rows[first].tolist(), index.ravel().tolist()
+
+    distinct, index = numpy.unique(rows, axis=0, return_inverse=True)
+    return distinct.tolist(), index.ravel().tolist()
+
+
+def _count_array(names, lows, highs, lengths, labels, values):
+    n = len(lengths)
+    rows = [r for r, length in enumerate(lengths) for i in range(length)]
+
+    for s, v in zip(labels, values):
+        if s < 0:
+            continue
+        if v < lows[s]:
+            lows[s] = v
+        elif v > highs[s]:
+            highs[s] = v
+
+    widths, offsets = _layout(lows, highs)
+    total = sum(widths)
+
+    flat = array('l', [0]) * (n * total)
+    seen = bytearray(n * len(names))
+    for r, s, v in zip(rows, labels, values):
+        if s >= 0:
+            flat[r * total + offsets[s] + v - lows[s]] += 1
+            seen[r * len(names) + s] = 1
+
+    counts = [flat[i * total:(i + 1) * total] for i in range(n)]
+    seen = [seen[i * len(names):(i + 1) * len(names)] for i in range(n)]
+
+    rows = {}
+    distinct = []
+    index = []
+    for c, f in zip(counts, seen):
+        key = tuple(c) + tuple(f)
+        j = rows.get(key)
+        if j is None:
+            j = rows[key] = len(distinct)
+            distinct.append(list(c) + list(f))
+        index.append(j)
+
+    return Tallies(names, lows, offsets, widths, counts, seen, distinct,
+                   index)
+
+
+def tally(votes, use_numpy=True):
+    # votes is a list with, for each change, the approvals on its current
+    # patch set as gerrit returns them, or None.
+    collected = _collect(votes)
+
+    if use_numpy and _load_numpy() is not None:
+        return _count_numpy(*collected)
+
+    return _count_array(*collected)
+
+
+def _template(tallies, shorts, shown):
+    # the format string for the state of a change showing the labels in
+    # shown, and a getter for the counts it is formatted from.
+    fmt = []
+    columns = []
+    for s in shown:
+        offset = tallies.offsets[s]
+        fmt.append("%s:[%s]" % (shorts[s].replace('%', '%%'),
+                                ','.join(['%d'] * tallies.widths[s])))
+        columns.extend(range(offset, offset + tallies.widths[s]))
+
+    return ' '.join(fmt), itemgetter(*columns)
+
+
+def format_states(votes, use_numpy=True):
+    # the state column for each change, as "R:[..] W:[..] V:[..]" with
+    # any other labels voted on after these, or "None" for a change
+    # without votes.
+    tallies = tally(votes, use_numpy)
+    names = tallies.names
+
+    shorts = [label[1] for label in LABELS] + names[len(LABELS):]
+    extras = sorted(range(len(LABELS), len(names)), key=lambda s: names[s])
+    seen = sum(tallies.widths)
+
+    templates = {}
+    formatted = []
+    for row in tallies.rows:
+        shown = tuple(range(len(LABELS))) + tuple(s for s in extras
+                                                  if row[seen + s])
+
+        template = templates.get(shown)
+        if template is None:
+            template = templates[shown] = _template(tallies, shorts, shown)
+
+        formatted.append(template[0] % template[1](row))
+
+    return ["None" if approvals is None else formatted[j]
+            for approvals, j in zip(votes, tallies.index)]
@@ -0,0 +1,123 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# gerrit_union:
+#
+# the changes matching any of several queries ('ls --any'). There are two
+# ways to get them:
+#
+#   or      a single query, OR-ing them together, which the server
+#           answers a page at a time.
+#   merge   each query run on its own, concurrently over the shared ssh
+#           connection, and the results merged, dropping changes already
+#           seen. Each query can be answered from the store, a mirror or
+#           the result cache, and large results are fetched in parallel.
+#
+# plan picks one, from the number of changes each query returned when it
+# was last cached: 'or' when that is known for every query and they fit
+# in union-or-rows (a page, by default), which saves all but one round
+# trip; 'merge' otherwise. The 'union-plan' option forces either.
+#
+
+from gerrit_cache import QueryCache
+from gerrit_hosts import fan_out
+import gerrit_json
+from gerrit_query import or_query
+
+
+# the most changes, in all, for which a single OR query is preferred
+_OR_ROWS = 500
+
+
+def plan(estimates, limit=_OR_ROWS):
+    # estimates are the number of changes expected from each query, None
+    # where it isn't known.
+    if len(estimates) == 1:
+        return 'or'
+
+    if None in estimates or sum(estimates) > limit:
+        return 'merge'
+
+    return 'or'
+
+
+def merge_lines(tagged, names, limit=None):
+    # the JSON lines of each change in tagged, an iterable of (name, line)
+    # for the queries in names, the first time its number is seen, and
+    # then a stats line for them. The row count each query reports is
+    # checked, and every one of them must report one. With limit, only
+    # the first limit changes are kept.
+    seen = set()
+    rows = {}
+    counted = set()
+
+    for name, line in tagged:
+        if line.strip() == "":
+            continue
+
+        review = gerrit_json.loads(line)
+        if review.get('rowCount') is not None:
+            if int(review.get('rowCount')) != rows.get(name, 0):
+                raise Exception("mismatch between expected and found rows "
+                                "for %s." % name)
+            counted.add(name)
+            continue
+
+        rows[name] = rows.get(name, 0) + 1
+        number = str(review.get('number'))
+        if number in seen:
+            continue
+
+        seen.add(number)
+        yield line if line.endswith('\n') else line + '\n'
+
+        if limit is not None and len(seen) >= limit:
+            yield '{"type": "stats", "rowCount": %d}\n' % len(seen)
+            return
+
+    missing = [name for name in names if name not in counted]
+    if missing:
+        raise Exception("no result for %s." % ', '.join(missing))
+
+    yield '{"type": "stats", "rowCount": %d}\n' % len(seen)
+
+
+def union_lines(config, queries, kwargs, lines):
+    # the JSON lines of the changes matching any of queries, where
+    # lines(config, query) gives those matching one.
+    unique = []
+    for q in queries:
+        if q not in unique:
+            unique.append(q)
+    queries = unique
+
+    how = config.get('union-plan', 'auto')
+    if how == 'auto':
+        cache = QueryCache(config)
+        how = plan([cache.rows(q, **kwargs) for q in queries],
+                   config.get('union-or-rows', _OR_ROWS))
+
+    if how == 'or':
+        return lines(config, or_query(queries))
+
+    if how != 'merge':
+        raise Exception("unknown union-plan %s, choose from auto, or, "
+                        "merge" % how)
+
+    named = [(' '.join(q), q) for q in queries]
+    return merge_lines(fan_out(named, lambda query: lines(config, query),
+                               report=config.get('verbose')),
+                       [name for name, q in named], kwargs.get('max_results'))
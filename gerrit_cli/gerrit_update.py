@@ -13,53 +13,144 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import sys
+import threading
+
 from gerrit_query import construct_query
 from gerrit_query import construct_show
 from gerrit_query import generate_output
+from gerrit_query import query_flags
+
+from gerrit_ssh import open_session
+
+
+def _run_parallel(fn, items, parallel):
+    # run fn over items on at most 'parallel' threads and yield
+    # (item, result) in the order of items, as soon as each result and
+    # all the ones before it are available. an exception raised by fn is
+    # yielded as the result.
+    items = list(items)
+    results = {}
+    done = threading.Condition()
+    pending = iter(enumerate(items))
+    pending_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with pending_lock:
+                try:
+                    index, item = next(pending)
+                except StopIteration:
+                    return
+
+            try:
+                result = fn(item)
+            except Exception as e:
+                result = e
 
-from gerrit_ssh import GerritSSH
+            with done:
+                results[index] = result
+                done.notify()
+
+    for i in range(min(max(1, parallel), len(items))):
+        t = threading.Thread(target=worker)
+        t.daemon = True
+        t.start()
+
+    for index, item in enumerate(items):
+        with done:
+            while index not in results:
+                done.wait()
+            result = results.pop(index)
+
+        yield item, result
 
 
 def _do_change(args, config, op):
     show_list = ['number', 'subject:l:70', 'commitid', 'patchset']
 
+    if op not in ("update", "recheck", "abandon", "restore"):
+        raise Exception("unknown operation")
+
     query = construct_query(args.query, config)
     show = construct_show(show_list, config)
 
-    session = GerritSSH(config)
-    out, err = session.query(query, current_patch_set=True)
+    session = open_session(config)
+    out, err = session.query(query, **query_flags(show))
     reviews, _ = generate_output(out, show)
 
-    for review in reviews:
-        number = review[0]
-        subject = review[1]
-        commitid = review[2]
-        patchset = review[3]
-
-        print("%s review %s,%s [%s]" % (op, number, patchset, subject))
-        if op == "update":
-            session.update(commitid, args.comment, args.review, args.workflow)
-        elif op == "recheck":
-            session.update(commitid, ['recheck'], args.review, args.workflow)
-        elif op == "abandon":
-            session.abandon(commitid, args.comment, args.review, args.workflow)
-        elif op == "restore":
-            session.restore(commitid, args.comment, args.review, args.workflow)
-        else:
-            raise Exception("unknown operation")
+    message = ['recheck'] if op == "recheck" else args.comment
+    extra = {"abandon": '--abandon', "restore": '--restore'}.get(op)
+
+    # reviews getting the same message, labels and action are sent to
+    # gerrit review in chunks, several changes per ssh command.
+    chunk_size = max(1, getattr(args, 'chunk_size', None) or
+                     config.get('review-chunk-size', 25))
+    chunks = [reviews[i:i + chunk_size]
+              for i in range(0, len(reviews), chunk_size)]
+
+    def change(chunk, method=session.review):
+        return method([review[2] for review in chunk], message,
+                      args.review, args.workflow, extra,
+                      keys=[[review[2], review[0],
+                             "%s,%s" % (review[0], review[3])]
+                            for review in chunk])
+
+    failed = []
+    parallel = getattr(args, 'parallel', None) or 1
+
+    if config.get('transport') == 'ssh-async':
+        # the chunks are run on the session's event loop, rather than on
+        # a thread each
+        reviewed = zip(chunks, session.run_all(
+            [change(chunk, session.areview) for chunk in chunks],
+            parallel))
+    else:
+        reviewed = _run_parallel(change, chunks, parallel)
+
+    for chunk, results in reviewed:
+        if isinstance(results, Exception):
+            results = [(None, "", str(results))] * len(chunk)
+
+        for review, result in zip(chunk, results):
+            number = review[0]
+            subject = review[1]
+            patchset = review[3]
+
+            print("%s review %s,%s [%s]" % (op, number, patchset, subject))
+
+            returncode, stdout, stderr = result
+            if stdout and stdout != "":
+                print(stdout)
+            if stderr and stderr != "":
+                print(stderr)
+
+            if returncode != 0:
+                failed.append("%s,%s" % (number, patchset))
+
+    print("%s: %d succeeded, %d failed" %
+          (op, len(reviews) - len(failed), len(failed)))
+    if len(failed) > 0:
+        print("failed: %s" % ' '.join(failed))
+
+    return failed
 
 
 def gerrit_update(args, config):
-    _do_change(args, config, "update")
+    if _do_change(args, config, "update"):
+        sys.exit(1)
 
 
 def gerrit_recheck(args, config):
-    _do_change(args, config, "recheck")
+    if _do_change(args, config, "recheck"):
+        sys.exit(1)
 
 
 def gerrit_abandon(args, config):
-    _do_change(args, config, "abandon")
+    if _do_change(args, config, "abandon"):
+        sys.exit(1)
 
 
 def gerrit_restore(args, config):
-    _do_change(args, config, "restore")
+    if _do_change(args, config, "restore"):
+        sys.exit(1)
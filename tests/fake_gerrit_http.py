@@ -0,0 +1,200 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# fake_gerrit_http:
+#
+# a stand-in for gerrit's REST API, served from a thread on localhost, for
+# testing GerritREST. It answers:
+#
+#   GET  /changes/?q=...&o=...&n=...&S=...   a page of changes, at most
+#        page_size of them, the last marked _more_changes if there are
+#        more. A query made of commit:<sha> terms matches the changes with
+#        those revisions, any other query matches every change.
+#   POST /changes/<n>/revisions/<r>/review, /changes/<n>/abandon and
+#        /changes/<n>/restore, recorded in posts. Changes in fail answer
+#        with 409.
+#
+# The same under /a/ requires basic authentication when credentials are
+# set. Responses are gzipped when asked, and connections kept alive,
+# unless drop is set, in which case the server closes each connection
+# after one response without saying it will. handshake delays each new
+# connection, for benchmarks.
+#
+
+import base64
+import gzip
+import io
+import json
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+from six.moves.urllib.parse import parse_qs
+from six.moves.urllib.parse import urlsplit
+import threading
+import time
+
+
+class _Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately; without this each response
+    # on a kept connection waits for the client's delayed ack
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.fake.connections += 1
+        if self.server.fake.handshake:
+            time.sleep(self.server.fake.handshake)
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body):
+        fake = self.server.fake
+        data = body.encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+            out = io.BytesIO()
+            with gzip.GzipFile(fileobj=out, mode='wb') as f:
+                f.write(data)
+            data = out.getvalue()
+            self.send_header('Content-Encoding', 'gzip')
+            fake.gzipped += 1
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+        if fake.drop:
+            self.close_connection = True
+
+    def _authorized(self, path):
+        fake = self.server.fake
+        if not path.startswith('/a/') or fake.username is None:
+            return True
+
+        credentials = '%s:%s' % (fake.username, fake.password)
+        expected = 'Basic %s' % base64.b64encode(
+            credentials.encode('utf-8')).decode('ascii')
+        return self.headers.get('Authorization') == expected
+
+    def _record(self):
+        parts = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        body = json.loads(body.decode('utf-8')) if body else None
+
+        self.server.fake.requests.append((self.command, parts.path,
+                                          parse_qs(parts.query), body))
+        path = parts.path[2:] if parts.path.startswith('/a/') else parts.path
+        return parts.path, path, parse_qs(parts.query), body
+
+    def do_GET(self):
+        fake = self.server.fake
+        full, path, params, body = self._record()
+        if not self._authorized(full):
+            return self._reply(401, 'Unauthorized')
+        if path != '/changes/':
+            return self._reply(404, 'Not found')
+
+        query = params.get('q', [''])[0]
+        commits = [t[len('commit:'):] for t in query.strip('()').split(' OR ')
+                   if t.startswith('commit:')]
+        changes = [c for c in fake.changes
+                   if not commits or
+                   [r for r in c.get('revisions', {}) if r in commits]]
+
+        start = int(params.get('S', ['0'])[0])
+        n = min(int(params.get('n', [fake.page_size])[0]), fake.page_size)
+        page = [dict(c) for c in changes[start:start + n]]
+        if page and start + n < len(changes):
+            page[-1]['_more_changes'] = True
+
+        self._reply(200, ")]}'\n" + json.dumps(page))
+
+    def do_POST(self):
+        fake = self.server.fake
+        full, path, params, body = self._record()
+        if not self._authorized(full):
+            return self._reply(401, 'Unauthorized')
+
+        number = path.split('/')[2]
+        if number in fake.fail:
+            return self._reply(409, 'change is closed')
+
+        fake.posts.append((path, body))
+        self._reply(200, ")]}'\n{}")
+
+
+class FakeGerrit(object):
+    def __init__(self, changes, page_size=500, username=None,
+                 password=None):
+        self.changes = changes
+        self.page_size = page_size
+        self.username = username
+        self.password = password
+        self.fail = set()
+        self.drop = False
+        # seconds each new connection takes, as TLS would
+        self.handshake = 0
+        self.requests = []
+        self.posts = []
+        self.connections = 0
+        self.gzipped = 0
+        self.server = None
+
+    def start(self):
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.fake = self
+        t = threading.Thread(target=self.server.serve_forever,
+                             kwargs={'poll_interval': 0.01})
+        t.daemon = True
+        t.start()
+
+        return 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def change(number, revisions=1, **kwargs):
+    # a ChangeInfo, as returned with the options GerritREST asks for
+    c = {'id': 'project~master~I%040d' % number, 'project': 'project',
+         'branch': 'master', 'change_id': 'I%040d' % number,
+         'subject': 'change %d' % number, 'status': 'NEW',
+         'created': '2016-01-01 00:00:00.000000000',
+         'updated': '2016-01-02 03:04:05.000000000',
+         'insertions': 10, 'deletions': 2, '_number': number,
+         'owner': {'_account_id': 1, 'name': 'Owner', 'username': 'owner'},
+         'current_revision': '%040x' % (number * 100 + revisions),
+         'revisions': dict(('%040x' % (number * 100 + i),
+                            {'_number': i, 'ref': 'refs/changes/%d/%d' %
+                             (number, i),
+                             'created': '2016-01-01 00:00:00.000000000'})
+                           for i in range(1, revisions + 1)),
+         'labels': {'Code-Review': {'all': [
+             {'value': 2, '_account_id': 2, 'name': 'Core',
+              'username': 'core', 'date': '2016-01-02 00:00:00.000000000'},
+             {'value': 0, '_account_id': 3, 'name': 'Nobody'}]}},
+         'reviewers': {'REVIEWER': [{'_account_id': 2, 'name': 'Core',
+                                     'username': 'core'}]}}
+    c.update(kwargs)
+    return c
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+#
+# fake_ssh:
+#
+# a stand-in for the ssh client used by the tests and benchmarks. It
+# understands just enough of the ssh command line (-o, -p, -O, -M, -N, -f)
+# to emulate connection multiplexing: a control master is a plain file at
+# ControlPath, and any connection made without one pays a simulated
+# handshake which is recorded in the log.
+#
+# environment:
+#
+#   FAKE_SSH_LOG        file to which handshakes and commands are appended
+#   FAKE_SSH_HANDSHAKE  seconds to sleep per handshake (default 0.05)
+#   FAKE_SSH_OUTPUT     file whose contents are written for 'gerrit query'
+#   FAKE_SSH_EVENTS     file whose lines are written for 'gerrit stream-events'
+#   FAKE_SSH_REVIEW_FAIL  space separated review targets that fail
+#   FAKE_SSH_PAGE_SIZE  if set, serve FAKE_SSH_OUTPUT in pages of this many
+#                       rows, the way gerrit caps query results
+#   FAKE_SSH_DELAY      seconds to sleep before running any gerrit command,
+#                       as a slow or hung server would
+#   FAKE_SSH_FAIL       file holding the number of gerrit commands still to
+#                       turn away, as a throttling server would: each exits
+#                       255 with FAKE_SSH_FAIL_ERROR (by default, gerrit's
+#                       error for too many connections) and counts one down
+#   FAKE_SSH_QUERY_ERROR  if set, 'gerrit query' writes an error with this
+#                       message instead of any results
+#   FAKE_SSH_MASTER_FAIL  if set, a control master cannot be opened
+#
+
+import json
+import os
+import sys
+import time
+
+
+def _log(line):
+    path = os.environ.get('FAKE_SSH_LOG')
+    if path:
+        with open(path, 'a') as f:
+            f.write(line + '\n')
+
+
+def _query_page(output, page_size, remote):
+    # emulate the server capping results at page_size rows: honour
+    # --start, resume_sortkey: and limit: and report moreChanges in the
+    # stats line.
+    with open(output) as f:
+        rows = [r for r in f if r.strip() and '"rowCount"' not in r]
+
+    start = 0
+    limit = page_size
+    for i, a in enumerate(remote):
+        if a == '--start':
+            start = int(remote[i + 1])
+        elif a.startswith('limit:'):
+            limit = min(limit, int(a[len('limit:'):]))
+        elif a.startswith('resume_sortkey:'):
+            key = a[len('resume_sortkey:'):]
+            start = [json.loads(r).get('sortKey') for r in rows].index(key) + 1
+
+    page = rows[start:start + limit]
+    for row in page:
+        sys.stdout.write(row)
+    sys.stdout.write(json.dumps({'type': 'stats', 'rowCount': len(page),
+                                 'moreChanges': start + limit < len(rows)}))
+    sys.stdout.write('\n')
+
+
+def main(argv):
+    options = {}
+    control = None
+    master = False
+    host = None
+    remote = []
+
+    # like ssh, options may appear either side of the host name
+    i = 0
+    while i < len(argv):
+        a = argv[i]
+        if a == '-o':
+            k, _, v = argv[i + 1].partition('=')
+            options[k] = v
+            i += 2
+        elif a in ('-p', '-l'):
+            i += 2
+        elif a == '-O':
+            control = argv[i + 1]
+            i += 2
+        elif a == '-M':
+            master = True
+            i += 1
+        elif a in ('-N', '-f'):
+            i += 1
+        elif host is None:
+            host = a
+            i += 1
+        else:
+            remote = argv[i:]
+            break
+
+    path = options.get('ControlPath')
+
+    if control == 'check':
+        return 0 if path and os.path.exists(path) else 255
+
+    if control in ('exit', 'stop'):
+        if path and os.path.exists(path):
+            os.unlink(path)
+            _log(control)
+            return 0
+        return 255
+
+    if not (path and os.path.exists(path) and
+            options.get('ControlMaster') == 'no'):
+        _log('handshake')
+        time.sleep(float(os.environ.get('FAKE_SSH_HANDSHAKE', '0.05')))
+
+    if master:
+        if os.environ.get('FAKE_SSH_MASTER_FAIL'):
+            return 255
+        open(path, 'w').close()
+        return 0
+
+    command = ' '.join(remote)
+    _log('command %s' % command)
+    time.sleep(float(os.environ.get('FAKE_SSH_DELAY', '0')))
+
+    fail = os.environ.get('FAKE_SSH_FAIL')
+    if fail and os.path.exists(fail):
+        with open(fail) as f:
+            remaining = int(f.read().strip() or '0')
+        if remaining > 0:
+            with open(fail, 'w') as f:
+                f.write(str(remaining - 1))
+            sys.stderr.write(os.environ.get(
+                'FAKE_SSH_FAIL_ERROR',
+                'Received disconnect from 127.0.0.1 port 29418:14: Too many '
+                'concurrent connections (4) - max. allowed: 4') + '\n')
+            return 255
+
+    if command.startswith('gerrit stream-events'):
+        events = os.environ.get('FAKE_SSH_EVENTS')
+        if events:
+            with open(events) as f:
+                for line in f:
+                    sys.stdout.write(line)
+                    sys.stdout.flush()
+        return 0
+
+    if command.startswith('gerrit review'):
+        # the targets named in FAKE_SSH_REVIEW_FAIL fail, like gerrit
+        # reporting each failed change and then failing the command.
+        failures = [t for t in remote
+                    if t in os.environ.get('FAKE_SSH_REVIEW_FAIL',
+                                           '').split()]
+        for t in failures:
+            sys.stderr.write('error: no such change %s\n' % t)
+        if len(failures) > 0:
+            sys.stderr.write('fatal: one or more reviews failed; '
+                             'review output above\n')
+            return 1
+        return 0
+
+    if command.startswith('gerrit query'):
+        output = os.environ.get('FAKE_SSH_OUTPUT')
+        if os.environ.get('FAKE_SSH_QUERY_ERROR'):
+            sys.stdout.write(json.dumps(
+                {'type': 'error',
+                 'message': os.environ.get('FAKE_SSH_QUERY_ERROR')}) + '\n')
+        elif output and os.environ.get('FAKE_SSH_PAGE_SIZE'):
+            _query_page(output, int(os.environ.get('FAKE_SSH_PAGE_SIZE')),
+                        remote)
+        elif output:
+            with open(output) as f:
+                sys.stdout.write(f.read())
+        else:
+            sys.stdout.write('{"type":"stats","rowCount":0}\n')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
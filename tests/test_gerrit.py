@@ -14,6 +14,15 @@
 #    under the License.
 
 from gerrit_cli import gerrit
+from gerrit_cli import gerrit_ssh
+from mock import Mock
+from mock import patch
+import os
+import shutil
+import six
+import subprocess
+import sys
+import tempfile
 import unittest
 
 
@@ -269,3 +278,221 @@ class testParser(unittest.TestCase):
             self.assertEqual(args.query, ['abc', 'def', 'ghi'])
             self.assertEqual(args.workflow, w)
             self.assertEqual(args.subparser_name, 'recheck')
+
+    def testParallel1(self):
+        for op in ['update', 'abandon', 'restore']:
+            args = gerrit.parse_arguments([op, 'abc', '--comment', 'pqr'])
+            self.assertEqual(args.parallel, 1)
+
+            args = gerrit.parse_arguments([op, 'abc', '--comment', 'pqr',
+                                           '--parallel', '8'])
+            self.assertEqual(args.parallel, 8)
+
+    def testParallel2(self):
+        args = gerrit.parse_arguments(['recheck', 'abc', '--parallel', '4'])
+        self.assertEqual(args.parallel, 4)
+        self.assertRaises(SystemExit, gerrit.parse_arguments,
+                          ['recheck', 'abc', '--parallel', 'x'])
+
+    def testListPagination(self):
+        args = gerrit.parse_arguments(['ls', 'abc'])
+        self.assertIsNone(args.max_results)
+        self.assertEqual(args.prefetch, False)
+
+        args = gerrit.parse_arguments(['ls', 'abc', '--max-results', '1000',
+                                       '--prefetch'])
+        self.assertEqual(args.max_results, 1000)
+        self.assertEqual(args.prefetch, True)
+
+    def testListCache(self):
+        args = gerrit.parse_arguments(['ls', 'abc'])
+        self.assertEqual(args.no_cache, False)
+        self.assertEqual(args.refresh, False)
+
+        args = gerrit.parse_arguments(['ls', 'abc', '--no-cache',
+                                       '--refresh'])
+        self.assertEqual(args.no_cache, True)
+        self.assertEqual(args.refresh, True)
+
+    def testListAny(self):
+        self.assertEqual(False, gerrit.parse_arguments(['ls', 'a']).any)
+        args = gerrit.parse_arguments(['ls', '--any', 'a', 'b'])
+        self.assertEqual(True, args.any)
+        self.assertEqual(['a', 'b'], args.query)
+
+    def testSyncSubparser(self):
+        args = gerrit.parse_arguments(['sync'])
+        self.assertEqual(args.subparser_name, 'sync')
+        self.assertEqual(args.query, [])
+        self.assertEqual(args.once, False)
+
+        args = gerrit.parse_arguments(['sync', 'abc', '--once'])
+        self.assertEqual(args.query, ['abc'])
+        self.assertEqual(args.once, True)
+
+    def testChunkSize(self):
+        args = gerrit.parse_arguments(['recheck', 'abc'])
+        self.assertIsNone(args.chunk_size)
+
+        for op in ['update', 'abandon', 'restore']:
+            args = gerrit.parse_arguments([op, 'abc', '--comment', 'pqr',
+                                           '--chunk-size', '50'])
+            self.assertEqual(args.chunk_size, 50)
+
+    def testServeSubparser(self):
+        args = gerrit.parse_arguments(['serve'])
+        self.assertEqual(args.subparser_name, 'serve')
+
+
+class testForwarded(unittest.TestCase):
+    def testConfigFile(self):
+        # relative to the directory the command was run in
+        with patch.object(gerrit, 'run') as run:
+            with patch.object(gerrit, 'load_compiled_configuration',
+                              return_value={'port': 2}) as load:
+                gerrit.run_forwarded(['--config-file', 'x.json', 'ls'],
+                                     '/work')
+
+        load.assert_called_once_with('/work/x.json')
+        args, config = run.call_args[0]
+        self.assertEqual('ls', args.subparser_name)
+        self.assertEqual({'port': 2}, config)
+
+    def testOutput(self):
+        with patch.object(gerrit, 'run') as run:
+            with patch.object(gerrit, 'load_compiled_configuration',
+                              return_value={}):
+                gerrit.run_forwarded(['ls', '--output', 'out.csv'], '/work')
+
+        self.assertEqual('/work/out.csv', run.call_args[0][0].output)
+
+
+class testMain(unittest.TestCase):
+    def _main(self, argv):
+        forward = Mock(return_value=None)
+        # Python 2 imports it relative to the package
+        serve = Mock(forward=forward)
+        with patch.dict('sys.modules', {'gerrit_serve': serve,
+                                        'gerrit_cli.gerrit_serve': serve}):
+            with patch.object(sys, 'argv', ['gerrit-cli'] + argv):
+                with patch.object(gerrit, 'run') as run:
+                    with patch.object(gerrit, 'load_compiled_configuration',
+                                      return_value={}):
+                        gerrit.main()
+
+        self.assertEqual(1, run.call_count)
+        return forward.call_count
+
+    def testForwarded(self):
+        self.assertEqual(1, self._main(['ls']))
+
+    def testLocal(self):
+        # those that don't return would hold up 'gerrit-cli serve'
+        self.assertEqual(0, self._main(['sync']))
+        self.assertEqual(0, self._main(['serve']))
+
+    def testSSHError(self):
+        error = gerrit_ssh.SSHError(['ssh', 'x'], 255, 'Connection refused',
+                                    kind='unavailable')
+        with patch.object(gerrit, 'run', side_effect=error), \
+                patch('sys.stderr', new_callable=six.StringIO) as err:
+            with self.assertRaises(SystemExit) as e:
+                gerrit._run(None, {})
+
+        self.assertEqual(1, e.exception.code)
+        self.assertEqual('%s\n' % error, err.getvalue())
+
+        # anything else is left alone
+        with patch.object(gerrit, 'run', side_effect=ValueError('x')):
+            self.assertRaises(ValueError, gerrit._run, None, {})
+
+
+class testLoadConfiguration(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'gerrit-cli.json')
+        self.cache = os.path.join(self.tmpdir, 'compiled')
+        self._write('{\n  # aliases\n  "queries": {"a": ["b", "x"], '
+                    '"b": ["y"]},\n    # "port": 1,\n  "port": 2\n}\n')
+        super(testLoadConfiguration, self).setUp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(testLoadConfiguration, self).tearDown()
+
+    def _write(self, content):
+        with open(self.path, 'w') as f:
+            f.write(content)
+
+    def _load(self):
+        return gerrit.load_compiled_configuration(self.path, self.cache)
+
+    def testLoad(self):
+        self.assertEqual({'queries': {'a': ['b', 'x'], 'b': ['y']},
+                          'port': 2},
+                         gerrit.load_configuration(self.path))
+
+    def testCompiled(self):
+        config = self._load()
+        self.assertEqual(2, config['port'])
+        self.assertEqual(['y', 'x'], config['aliases']['queries']['a'])
+
+        with patch.object(gerrit, 'load_configuration',
+                          side_effect=Exception("not compiled")):
+            self.assertEqual(config, self._load())
+
+    def testChanged(self):
+        self._load()
+        self._write('{"queries": {"a": ["z"]}}')
+        self.assertEqual(['z'], self._load()['aliases']['queries']['a'])
+
+    def testCorrupt(self):
+        self._load()
+        for name in os.listdir(self.cache):
+            with open(os.path.join(self.cache, name), 'wb') as f:
+                f.write(b'\x00garbage')
+        self.assertEqual(2, self._load()['port'])
+
+
+class testStartup(unittest.TestCase):
+    # the time taken to import gerrit, which every invocation pays before
+    # doing anything, in microseconds.
+    BUDGET = 100000
+
+    # modules only the subcommands need, which are slow to import
+    DEFERRED = ['prettytable', 'numpy', 'gerrit_list', 'gerrit_query',
+                'gerrit_ssh', 'gerrit_sync', 'gerrit_update', 'gerrit_json']
+
+    def _importtime(self):
+        # (module, cumulative microseconds) for each module imported by
+        # 'import gerrit', as reported by python -X importtime.
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            'gerrit_cli')
+        p = subprocess.Popen([sys.executable, '-X', 'importtime', '-c',
+                              'import gerrit'],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             env=env)
+        out, err = p.communicate()
+        self.assertEqual(0, p.returncode, err)
+
+        times = {}
+        for line in err.decode('utf-8').splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[1].strip().isdigit():
+                times[fields[2].strip()] = int(fields[1])
+        return times
+
+    @unittest.skipIf(sys.version_info < (3, 7), "needs -X importtime")
+    def testDeferredImports(self):
+        times = self._importtime()
+        self.assertIn('gerrit', times)
+        for module in self.DEFERRED:
+            self.assertNotIn(module, times)
+
+    @unittest.skipIf(sys.version_info < (3, 7), "needs -X importtime")
+    def testBudget(self):
+        # the best of a few, to allow for a cold start
+        best = min(self._importtime()['gerrit'] for i in range(3))
+        self.assertLess(best, self.BUDGET)
@@ -0,0 +1,196 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from gerrit_cli import gerrit_ssh
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+# this module is parsed, though skipped, by Python 2, so coroutines are
+# made without async syntax
+if sys.version_info >= (3, 8):
+    import asyncio
+    from gerrit_cli import gerrit_async as ga
+
+
+FAKE_SSH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'fake_ssh.py')
+
+
+@unittest.skipIf(sys.version_info < (3, 8), "needs Python 3.8")
+class testAsyncGerritSSH(unittest.TestCase):
+    def setUp(self):
+        super(testAsyncGerritSSH, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmpdir, 'log')
+        output = os.path.join(self.tmpdir, 'output')
+        with open(output, 'w') as f:
+            for i in range(1, 26):
+                f.write('{"number": "%d"}\n' % i)
+            f.write('{"type": "stats", "rowCount": 25}\n')
+
+        self.environ = dict(os.environ)
+        os.environ['FAKE_SSH_LOG'] = self.log
+        os.environ['FAKE_SSH_HANDSHAKE'] = '0'
+        os.environ['FAKE_SSH_OUTPUT'] = output
+        self.config = {'host': 'review.example.com',
+                       'port': 29418,
+                       'ssh-command': FAKE_SSH,
+                       'ssh-control-dir': self.tmpdir,
+                       'ssh-backoff': 0.01}
+        self.session = ga.AsyncGerritSSH(self.config)
+
+    def tearDown(self):
+        self.session.close()
+        gerrit_ssh._close_masters()
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tmpdir)
+        super(testAsyncGerritSSH, self).tearDown()
+
+    def _commands(self):
+        with open(self.log) as f:
+            return [e for e in f if e.startswith('command')]
+
+    def _collect(self, lines):
+        # the items of the async generator lines
+        collected = []
+        while True:
+            try:
+                collected.append(self.session._run(lines.__anext__()))
+            except StopAsyncIteration:
+                return collected
+
+    def testQuery(self):
+        stdout, stderr = self.session.query(['status:open'])
+        self.assertEqual(26, len(stdout.splitlines()))
+        self.assertEqual("", stderr)
+
+    def testQueryStreamPages(self):
+        os.environ['FAKE_SSH_PAGE_SIZE'] = '10'
+
+        results = [json.loads(line) for line in self._collect(
+            self.session.aquery_stream(['status:open']))]
+        self.assertEqual([str(i) for i in range(1, 26)],
+                         [r.get('number') for r in results[:-1]])
+        self.assertEqual(25, results[-1].get('rowCount'))
+        self.assertEqual(3, len(self._commands()))
+
+    def testQueryStreamWrapped(self):
+        os.environ['FAKE_SSH_PAGE_SIZE'] = '10'
+        for prefetch in [False, True]:
+            lines = list(self.session.query_stream(['status:open'],
+                                                   max_results=15,
+                                                   prefetch=prefetch))
+            self.assertEqual(16, len(lines))
+            self.assertEqual(15, json.loads(lines[-1]).get('rowCount'))
+
+    def testTimeout(self):
+        os.environ['FAKE_SSH_DELAY'] = '10'
+        started = time.time()
+        self.assertRaisesRegex(Exception, 'timed out after 0.2s',
+                               self.session._run,
+                               self.session.aquery(['status:open'],
+                                                   timeout=0.2))
+        self.assertLess(time.time() - started, 5)
+
+    def testStreamTimeout(self):
+        os.environ['FAKE_SSH_DELAY'] = '10'
+        self.config['ssh-timeout'] = 0.2
+        started = time.time()
+        self.assertRaisesRegex(Exception, 'timed out',
+                               list, self.session.query_stream(['x']))
+        self.assertLess(time.time() - started, 5)
+
+    def testRunAllConcurrent(self):
+        os.environ['FAKE_SSH_DELAY'] = '0.5'
+        self.session.query(['warm up'])
+
+        started = time.time()
+        results = list(self.session.run_all(
+            [self.session.aquery(['q%d' % i]) for i in range(4)], 4))
+        self.assertLess(time.time() - started, 1.5)
+        self.assertEqual([26] * 4, [len(r[0].splitlines()) for r in results])
+        self.assertEqual(5, len(self._commands()))
+
+    def testRunAllOrdered(self):
+        results = list(self.session.run_all(
+            [asyncio.sleep(0.05, 'a'),
+             asyncio.wait_for(asyncio.sleep(1), 0),
+             asyncio.sleep(0, 'c')], 2))
+        self.assertEqual('a', results[0])
+        self.assertTrue(isinstance(results[1], Exception))
+        self.assertEqual('c', results[2])
+
+    def testRunAllSerial(self):
+        started = time.time()
+        self.assertEqual(list(range(4)), list(self.session.run_all(
+            [asyncio.sleep(0.05, i) for i in range(4)], 1)))
+        self.assertTrue(time.time() - started >= 0.2)
+
+    def testRunAllClosed(self):
+        # those still running, or not yet started, when the caller stops
+        # are cancelled
+        results = self.session.run_all(
+            [asyncio.sleep(0, 'first'), asyncio.sleep(60),
+             asyncio.sleep(60)], 1)
+        started = time.time()
+        self.assertEqual('first', next(results))
+        results.close()
+        self.assertLess(time.time() - started, 5)
+        self.assertEqual(set(), asyncio.all_tasks(self.session.loop))
+
+    def testReview(self):
+        os.environ['FAKE_SSH_REVIEW_FAIL'] = 'c2'
+        results = self.session.review(['c1', 'c2', 'c3'], ['recheck'],
+                                      None, None)
+
+        self.assertEqual([0, 1, 0], [r[0] for r in results])
+        self.assertEqual('error: no such change c2', results[1][2])
+
+    def testRetried(self):
+        os.environ['FAKE_SSH_PAGE_SIZE'] = '10'
+        os.environ['FAKE_SSH_FAIL'] = os.path.join(self.tmpdir, 'fail')
+        with open(os.environ['FAKE_SSH_FAIL'], 'w') as f:
+            f.write('2')
+
+        self.assertEqual(26, len(self._collect(
+            self.session.aquery_stream(['status:open']))))
+        self.assertEqual(5, len(self._commands()))
+
+        with open(os.environ['FAKE_SSH_FAIL'], 'w') as f:
+            f.write('1')
+        self.assertEqual(("", ""), self.session.review(['c1'], ['recheck'],
+                                                       None, None)[0][1:])
+        self.assertEqual(7, len(self._commands()))
+
+    def testQueryError(self):
+        os.environ['FAKE_SSH_QUERY_ERROR'] = 'bad query'
+        self.assertRaisesRegex(Exception, 'gerrit query failed: bad query',
+                               self.session.query, ['x'])
+
+    def testDryRun(self):
+        self.config['dry-run'] = True
+        self.assertEqual(("", ""), self.session.query(['status:open']))
+        self.assertFalse(os.path.exists(self.log))
+
+    def testOpenSession(self):
+        self.config['transport'] = 'ssh-async'
+        session = gerrit_ssh.open_session(self.config)
+        self.assertEqual('AsyncGerritSSH', type(session).__name__)
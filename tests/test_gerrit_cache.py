@@ -0,0 +1,178 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from gerrit_cli import gerrit_cache
+from gerrit_cli import gerrit_query as gq
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+
+class FakeSession(object):
+    # a stand-in for GerritSSH serving a set of changes. Changes in
+    # 'updated' are the ones a -age: query returns, and a change only
+    # matches the query while its status is NEW.
+    def __init__(self, changes):
+        self.changes = changes
+        self.updated = set()
+        self.queries = []
+
+    def query_stream(self, query, **kwargs):
+        self.queries.append(query)
+
+        if [q for q in query if q.startswith('(change:')]:
+            out = [c for c in self.changes if c['number'] in self.updated]
+        else:
+            out = [c for c in self.changes if c['status'] == 'NEW']
+            if [q for q in query if q.startswith('-age:')]:
+                out = [c for c in out if c['number'] in self.updated]
+
+        for c in out:
+            yield json.dumps(c) + '\n'
+        yield json.dumps({'type': 'stats', 'rowCount': len(out)}) + '\n'
+
+
+class testQueryCache(unittest.TestCase):
+    def setUp(self):
+        super(testQueryCache, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = {'host': 'review.example.com', 'port': 29418,
+                       'cache-dir': self.tmpdir, 'cache-ttl': 60}
+        self.session = FakeSession(
+            [{'number': str(i), 'status': 'NEW', 'lastUpdated': 100 - i}
+             for i in range(1, 6)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(testQueryCache, self).tearDown()
+
+    def _query(self, cache, query=['status:open'], **kwargs):
+        lines = cache.query_stream(self.session, query, **kwargs)
+        return [r.get('number') for r in gq.iter_results(lines)]
+
+    def _age(self, cache, seconds):
+        for name in os.listdir(self.tmpdir):
+            path = os.path.join(self.tmpdir, name)
+            with open(path) as f:
+                lines = f.readlines()
+            header = json.loads(lines[0])
+            header['created'] -= seconds
+            lines[0] = json.dumps(header) + '\n'
+            with open(path, 'w') as f:
+                f.writelines(lines)
+
+    def testMissThenHit(self):
+        cache = gerrit_cache.QueryCache(self.config)
+        self.assertEqual(['1', '2', '3', '4', '5'], self._query(cache))
+        self.assertEqual(['1', '2', '3', '4', '5'], self._query(cache))
+        self.assertEqual(1, len(self.session.queries))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def testKey(self):
+        cache = gerrit_cache.QueryCache(self.config)
+        self.assertEqual(cache.key(['a  b', 'c'], {'prefetch': True}),
+                         cache.key(['a', 'b c'], {}))
+        self.assertNotEqual(cache.key(['a'], {}),
+                            cache.key(['a'], {'current_patch_set': True}))
+
+        other = gerrit_cache.QueryCache(dict(self.config, port=1))
+        self.assertNotEqual(cache.key(['a'], {}), other.key(['a'], {}))
+
+    def testRefresh(self):
+        cache = gerrit_cache.QueryCache(self.config)
+        self._query(cache)
+        self._query(cache, refresh=True)
+        self.assertEqual(2, len(self.session.queries))
+
+    def testIncremental(self):
+        cache = gerrit_cache.QueryCache(self.config)
+        self._query(cache)
+        self._age(cache, 120)
+
+        # 2 was updated, 4 was merged and 6 is new
+        self.session.changes[1]['lastUpdated'] = 200
+        self.session.changes[3]['status'] = 'MERGED'
+        self.session.changes.append({'number': '6', 'status': 'NEW',
+                                     'lastUpdated': 150})
+        self.session.updated = set(['2', '4', '6'])
+
+        self.assertEqual(['2', '6', '1', '3', '5'], self._query(cache))
+        self.assertEqual(1, cache.refreshes)
+        self.assertTrue('-age:180s' in self.session.queries[1])
+
+        # and the refreshed entry is fresh again
+        self.assertEqual(['2', '6', '1', '3', '5'], self._query(cache))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(3, len(self.session.queries))
+
+    def testNotIncremental(self):
+        self.config['cache-incremental'] = False
+        cache = gerrit_cache.QueryCache(self.config)
+        self._query(cache)
+        self._age(cache, 120)
+        self._query(cache)
+        self.assertEqual([['status:open'], ['status:open']],
+                         self.session.queries)
+
+    def testRelativeNotIncremental(self):
+        # changes age into, and out of, these without being updated
+        for query in [['status:open', 'age:2w'], ['(-age:1d OR x)'],
+                      ['before:2020-01-01'], ['since:1w']]:
+            self.session.queries = []
+            cache = gerrit_cache.QueryCache(self.config)
+            self._query(cache, query)
+            self._age(cache, 120)
+            self._query(cache, query)
+            self.assertEqual([query, query], self.session.queries)
+            self.assertEqual(0, cache.refreshes)
+
+    def testMismatchNotCached(self):
+        def query_stream(query, **kwargs):
+            yield '{"number": "1"}\n'
+            yield '{"type": "stats", "rowCount": 2}\n'
+
+        self.session.query_stream = query_stream
+        cache = gerrit_cache.QueryCache(self.config)
+        self.assertRaises(Exception, self._query, cache)
+        self.assertEqual([], os.listdir(self.tmpdir))
+
+    def testEviction(self):
+        self.config['cache-size'] = 1000
+        cache = gerrit_cache.QueryCache(self.config)
+        for i in range(10):
+            self._query(cache, ['project:%d' % i])
+            time.sleep(0.01)
+
+        names = os.listdir(self.tmpdir)
+        self.assertTrue(sum(os.path.getsize(os.path.join(self.tmpdir, n))
+                            for n in names) <= 1000)
+        self.assertTrue(cache.key(['project:9'], {}) in names)
+        self.assertFalse(cache.key(['project:0'], {}) in names)
+
+    def testRows(self):
+        cache = gerrit_cache.QueryCache(self.config)
+        self.assertIsNone(cache.rows(['status:open']))
+
+        self._query(cache)
+        self.assertEqual(5, cache.rows(['status:open']))
+        self.assertIsNone(cache.rows(['status:open'],
+                                     current_patch_set=True))
+
+        # however old
+        self._age(cache, 3600)
+        self.assertEqual(5, cache.rows(['status:open']))
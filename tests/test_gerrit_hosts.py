@@ -0,0 +1,100 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from gerrit_cli import gerrit_hosts as gh
+from mock import patch
+import six
+import time
+import unittest
+
+
+class testHostConfigs(unittest.TestCase):
+    def testNone(self):
+        self.assertIsNone(gh.host_configs({'host': 'h'}))
+        self.assertIsNone(gh.host_configs({'hosts': {}}))
+
+    def testHosts(self):
+        config = {'host': 'h', 'port': 1, 'hosts': {
+            'a': {'host': 'a'}, 'b': {'host': 'b', 'port': 2}}}
+        self.assertEqual([('a', {'host': 'a', 'port': 1}),
+                          ('b', {'host': 'b', 'port': 2})],
+                         sorted(gh.host_configs(config)))
+        self.assertIn('hosts', config)
+
+    def testHostGiven(self):
+        self.assertIsNone(gh.host_configs({'hosts': {'a': {'host': 'a'}}},
+                                          'h'))
+
+
+class testFanOut(unittest.TestCase):
+    def _fan_out(self, hosts, fetch):
+        with patch('sys.stderr', new_callable=six.StringIO) as err:
+            items = list(gh.fan_out(hosts, fetch))
+
+        return items, err.getvalue()
+
+    def testItems(self):
+        items, err = self._fan_out(
+            [('a', {'n': 2}), ('b', {'n': 3})],
+            lambda config: range(config['n']))
+        self.assertEqual([('a', 0), ('a', 1), ('b', 0), ('b', 1), ('b', 2)],
+                         sorted(items))
+        self.assertIn('a: 2 in ', err)
+        self.assertIn('b: 3 in ', err)
+
+    def testConcurrent(self):
+        # the hosts are waited on at the same time, not one after another
+        def fetch(config):
+            time.sleep(0.2)
+            return [config]
+
+        start = time.time()
+        items, err = self._fan_out([(str(i), i) for i in range(5)], fetch)
+        self.assertLess(time.time() - start, 0.6)
+        self.assertEqual(5, len(items))
+
+    def testFailed(self):
+        def fetch(config):
+            yield 1
+            if config == 'bad':
+                raise Exception("connection refused")
+            yield 2
+
+        items, err = self._fan_out([('a', 'good'), ('b', 'bad')], fetch)
+        self.assertEqual([('a', 1), ('a', 2), ('b', 1)], sorted(items))
+        self.assertIn('b: failed after', err)
+        self.assertIn('connection refused', err)
+
+    def testStopped(self):
+        # a caller stopping early doesn't leave the hosts blocked on a
+        # full queue
+        closed = []
+
+        def fetch(config):
+            try:
+                for i in range(10):
+                    yield i
+            finally:
+                closed.append(config)
+
+        with patch.object(gh, '_QUEUE_SIZE', 1):
+            items = gh.fan_out([('a', 'a'), ('b', 'b')], fetch, False)
+            next(items)
+            items.close()
+
+        deadline = time.time() + 5
+        while len(closed) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(['a', 'b'], sorted(closed))
@@ -0,0 +1,113 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from gerrit_cli import gerrit_query as gq
+from mock import patch
+import unittest
+
+# the module gerrit_query decodes with
+gj = gq.gerrit_json
+
+
+class testBackend(unittest.TestCase):
+    def setUp(self):
+        super(testBackend, self).setUp()
+
+    def tearDown(self):
+        gj.use('auto')
+        super(testBackend, self).tearDown()
+
+    def testAvailable(self):
+        self.assertEqual('json', gj.available()[-1])
+        self.assertEqual(gj.available()[0], gj.name)
+
+    def testBackends(self):
+        line = '{"number": "1", "owner": {"name": "abc"}, "x": [1, 2.5]}'
+        for name in gj.available():
+            self.assertEqual({'number': '1', 'owner': {'name': 'abc'},
+                              'x': [1, 2.5]}, gj.backend(name)(line))
+
+    def testUse(self):
+        gj.use('json')
+        self.assertEqual('json', gj.name)
+        self.assertEqual([{'number': '1'}],
+                         gq.process_results('{"number": "1"}\n'
+                                            '{"rowCount": 1}'))
+
+    def testFirstImported(self):
+        # those after the first that imports aren't imported at all
+        imported = []
+
+        def _import(name):
+            imported.append(name)
+            return __import__('json') if name == 'ujson' else None
+
+        with patch.object(gj, '_import', side_effect=_import):
+            gj.use('auto')
+        self.assertEqual('ujson', gj.name)
+        self.assertEqual(['orjson', 'ujson'], sorted(set(imported)))
+
+    def testUnknown(self):
+        self.assertRaises(Exception, gj.backend, 'yaml')
+
+    def testFallback(self):
+        with patch.object(gj, '_import',
+                          side_effect=lambda n: None if n != 'json'
+                          else __import__('json')):
+            self.assertEqual(['json'], gj.available())
+            self.assertRaises(Exception, gj.backend, 'orjson')
+            gj.use('auto')
+            self.assertEqual('json', gj.name)
+
+
+class testLazy(unittest.TestCase):
+    def setUp(self):
+        super(testLazy, self).setUp()
+
+    def tearDown(self):
+        super(testLazy, self).tearDown()
+
+    def testLazyReview(self):
+        review = gj.LazyReview('{"number": "1", "subject": "abc"}')
+        self.assertFalse(review.decoded())
+        self.assertEqual('abc', review.get('subject'))
+        self.assertTrue(review.decoded())
+        self.assertEqual('1', review['number'])
+        self.assertIsNone(review.get('owner'))
+        self.assertTrue('subject' in review)
+
+    def testIterResults(self):
+        reviews = list(gq.iter_results(['{"number": "1"}\n',
+                                        '{"number": "2"}\n',
+                                        '{"type": "stats", "rowCount": 2}\n'],
+                                       lazy=True))
+
+        self.assertEqual(2, len(reviews))
+        self.assertFalse(reviews[0].decoded())
+        self.assertEqual(['1', '2'], [r.get('number') for r in reviews])
+
+    def testIterResultsMismatch(self):
+        reviews = gq.iter_results(['{"number": "1"}\n',
+                                   '{"type": "stats", "rowCount": 2}\n'],
+                                  lazy=True)
+        next(reviews)
+        self.assertRaises(Exception, next, reviews)
+
+    def testRowCountInChange(self):
+        # a change that mentions rowCount is decoded, not taken for stats
+        reviews = list(gq.iter_results(
+            ['{"number": "1", "subject": "fix \\"rowCount\\""}\n',
+             '{"type": "stats", "rowCount": 1}\n'], lazy=True))
+        self.assertEqual('fix "rowCount"', reviews[0].get('subject'))
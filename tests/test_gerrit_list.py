@@ -0,0 +1,146 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+from gerrit_cli import gerrit_list as gl
+import json
+from mock import Mock
+from mock import patch
+import six
+import unittest
+
+
+class testGerritList(unittest.TestCase):
+    def setUp(self):
+        self.lines = [
+            '{"number": "1", "subject": "subject \\"1\\""}\n',
+            '{"number": "2", "subject": "subject2"}\n',
+            '{"type": "stats", "rowCount": 2}\n']
+        self.host_lines = {}
+        super(testGerritList, self).setUp()
+
+    def tearDown(self):
+        super(testGerritList, self).tearDown()
+
+    def _list(self, output_format, config=None, **kwargs):
+        args = argparse.Namespace(query=['abc'], show=['number', 'subject'],
+                                  output_format=output_format,
+                                  max_results=None, prefetch=False,
+                                  no_cache=True, refresh=False, host=None,
+                                  any=False, output=None, sort=None,
+                                  reverse=False, limit=None)
+        for k in kwargs:
+            setattr(args, k, kwargs[k])
+
+        def session(config):
+            # each host answers with lines of its own
+            s = Mock()
+            s.query_stream.return_value = iter(
+                self.host_lines.get(config.get('host'), self.lines))
+            self.sessions.append(s)
+            return s
+
+        self.sessions = []
+        with patch.object(gl, 'open_session', side_effect=session):
+            with patch('sys.stdout', new_callable=six.StringIO) as out:
+                with patch('sys.stderr', new_callable=six.StringIO):
+                    gl.gerrit_list(args, config or {})
+
+        return out.getvalue()
+
+    def testCSV(self):
+        self.assertEqual('Number,Subject\n'
+                         '"1","subject ""1"""\n'
+                         '"2","subject2"\n',
+                         self._list('CSV'))
+
+    def testJSON(self):
+        self.assertEqual([{'number': 1, 'subject': 'subject "1"'},
+                          {'number': 2, 'subject': 'subject2'}],
+                         json.loads(self._list('JSON')))
+
+    def testJSONEmpty(self):
+        self.lines = ['{"type": "stats", "rowCount": 0}\n']
+        self.assertEqual([], json.loads(self._list('JSON')))
+
+    def testHosts(self):
+        self.host_lines = {'b.example.com': [
+            '{"number": "1", "subject": "subject b"}\n',
+            '{"type": "stats", "rowCount": 1}\n']}
+
+        rows = json.loads(self._list('JSON', {'hosts': {
+            'a': {'host': 'a.example.com'}, 'b': {'host': 'b.example.com'}}}))
+        self.assertEqual([{'number': 1, 'subject': 'subject "1"',
+                           'host': 'a'},
+                          {'number': 2, 'subject': 'subject2', 'host': 'a'},
+                          {'number': 1, 'subject': 'subject b', 'host': 'b'}],
+                         sorted(rows, key=lambda r: (r['host'], r['number'])))
+
+    def testHostsCSV(self):
+        self.assertEqual('Number,Subject,Host\n'
+                         '"1","subject ""1""","a"\n'
+                         '"2","subject2","a"\n',
+                         self._list('CSV', {'hosts': {'a': {'host': 'a'}}}))
+
+    def testNDJSON(self):
+        self.assertEqual([{'number': 1, 'subject': 'subject "1"'},
+                          {'number': 2, 'subject': 'subject2'}],
+                         [json.loads(line) for line in
+                          self._list('NDJSON').splitlines()])
+
+    def _max_results(self):
+        return self.sessions[0].query_stream.call_args[1]['max_results']
+
+    def testSort(self):
+        rows = json.loads(self._list('JSON', sort='-number'))
+        self.assertEqual([2, 1], [r['number'] for r in rows])
+        self.assertIsNone(self._max_results())
+
+    def testSortReverse(self):
+        rows = json.loads(self._list('JSON', sort='number', reverse=True))
+        self.assertEqual([2, 1], [r['number'] for r in rows])
+
+        table = self._list('TABLE', reverse=True)
+        self.assertLess(table.index(' 2 |'), table.index(' 1 |'))
+
+    def testSortLimit(self):
+        # every change is needed to find the first by subject
+        self.lines[1:1] = ['{"number": "3", "subject": "a subject"}\n']
+        self.lines[-1] = '{"type": "stats", "rowCount": 3}\n'
+        rows = json.loads(self._list('JSON', sort='subject', limit=1))
+        self.assertEqual([{'number': 3, 'subject': 'a subject'}], rows)
+        self.assertIsNone(self._max_results())
+
+    def testLimitPushedDown(self):
+        # in the order gerrit returns them, only limit changes are needed
+        rows = json.loads(self._list('JSON', limit=1, max_results=5))
+        self.assertEqual([1], [r['number'] for r in rows])
+        self.assertEqual(1, self._max_results())
+
+    def testSortAgePushedDown(self):
+        # a table in the order gerrit returns the changes, not sorted by
+        # its first column
+        self.lines = ['{"number": "2", "subject": "b"}\n',
+                      '{"number": "1", "subject": "a"}\n',
+                      '{"type": "stats", "rowCount": 2}\n']
+        table = self._list('TABLE', sort='age', limit=2,
+                           show=['subject', 'number'])
+        self.assertLess(table.index(' b |'), table.index(' a |'))
+        self.assertEqual(2, self._max_results())
+
+    def testSortUnknown(self):
+        with self.assertRaises(Exception) as e:
+            self._list('JSON', sort='owner')
+        self.assertIn('cannot sort by owner', str(e.exception))
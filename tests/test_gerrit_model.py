@@ -0,0 +1,81 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from gerrit_cli import gerrit_query as gq
+import unittest
+
+# the model gerrit_query formats from
+Change = gq.Change
+
+
+class testChange(unittest.TestCase):
+    def setUp(self):
+        self.review = {
+            'number': '12', 'subject': 'a\tb', 'project': 'abc',
+            'lastUpdated': 100,
+            'owner': {'username': 'pqr', 'email': 'abc@pqr'},
+            'patchSets': [{'number': '1', 'revision': '11'},
+                          {'number': '2', 'revision': '12'}],
+            'currentPatchSet': {
+                'number': '2', 'revision': '12',
+                'approvals': [{'type': 'Code-Review', 'value': '2',
+                               'by': {'username': 'alice'}},
+                              {'type': 'Verified', 'value': '-1',
+                               'by': {'name': 'Bob'}}]}}
+        super(testChange, self).setUp()
+
+    def tearDown(self):
+        super(testChange, self).tearDown()
+
+    def testFields(self):
+        change = Change(self.review, ['number', 'subject', 'owner', 'age',
+                                      'patchset', 'commitid', 'project'])
+        self.assertEqual(12, change.number)
+        self.assertEqual('a   b', change.subject)
+        self.assertEqual('pqr', change.owner)
+        self.assertEqual(100, change.last_updated)
+        self.assertEqual(('2', '12'),
+                         (change.latest.number, change.latest.revision))
+        self.assertEqual({'project': 'abc'}, change.fields)
+        self.assertIsNone(change.votes)
+
+    def testOnlyWhatIsShown(self):
+        change = Change(self.review, ['number'])
+        self.assertIsNone(change.subject)
+        self.assertIsNone(change.latest)
+        self.assertIsNone(change.fields)
+        self.assertRaises(AttributeError, setattr, change, 'extra', 1)
+
+    def testVotes(self):
+        change = Change(self.review, ['state'])
+        self.assertEqual([('Code-Review', '2'), ('Verified', '-1')],
+                         [(a['type'], a['value']) for a in change.votes])
+        self.assertEqual('R:[0,0,0,0,1] W:[0,0,0] V:[0,1,0,0,0]',
+                         gq._format_column(0, {'name': 'state', 'length': 0},
+                                           change))
+
+    def testNoApprovals(self):
+        del self.review['currentPatchSet']['approvals']
+        self.assertEqual('None',
+                         gq._format_column(0, {'name': 'state', 'length': 0},
+                                           self.review))
+
+    def testIterChanges(self):
+        show = gq.construct_show(['number', 'owner'], None)
+        changes = list(gq.iter_changes(['{"number": "1", "owner": '
+                                        '{"name": "abc"}}',
+                                        '{"rowCount": 1}'], show))
+        self.assertEqual([(1, 'abc')],
+                         [(c.number, c.owner) for c in changes])
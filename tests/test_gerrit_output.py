@@ -0,0 +1,183 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from gerrit_cli import gerrit_output as go
+from gerrit_cli import gerrit_serve
+import io
+import json
+from mock import patch
+import os
+import shutil
+import six
+import socket
+import tempfile
+import threading
+import unittest
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+SHOW = [{'name': 'number', 'colname': 'Number', 'align': 'r'},
+        {'name': 'subject', 'colname': 'Subject', 'align': 'l'}]
+
+ROWS = [[1, 'a "quoted", subject'], [2, 'line\nbreak'], [3, None]]
+
+
+class testWriters(unittest.TestCase):
+    def setUp(self):
+        super(testWriters, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(testWriters, self).tearDown()
+
+    def _write(self, output_format, rows=ROWS):
+        with patch('sys.stdout', new_callable=six.StringIO) as out:
+            go.write_output(output_format, SHOW, iter(rows))
+        return out.getvalue()
+
+    def testCSV(self):
+        self.assertEqual('Number,Subject\n'
+                         '"1","a ""quoted"", subject"\n'
+                         '"2","line\nbreak"\n'
+                         '"3",""\n', self._write('CSV'))
+
+    def testJSON(self):
+        self.assertEqual([{'number': 1, 'subject': 'a "quoted", subject'},
+                          {'number': 2, 'subject': 'line\nbreak'},
+                          {'number': 3, 'subject': None}],
+                         json.loads(self._write('JSON')))
+        self.assertEqual([], json.loads(self._write('JSON', [])))
+
+    def testNDJSON(self):
+        lines = self._write('NDJSON').splitlines()
+        self.assertEqual(3, len(lines))
+        self.assertEqual({'number': 2, 'subject': 'line\nbreak'},
+                         json.loads(lines[1]))
+        self.assertEqual('', self._write('NDJSON', []))
+
+    def testTable(self):
+        table = self._write('TABLE')
+        self.assertIn('| Number |', table)
+        self.assertIn('a "quoted", subject', table)
+
+    def testStreamed(self):
+        # rows are written as they are produced, not once they are all in
+        def rows(out):
+            yield [1, 'one']
+            self.assertIn('"1","one"', out.getvalue())
+            yield [2, 'two']
+
+        with patch.object(go, '_BUFFER_SIZE', 1):
+            with patch('sys.stdout', new_callable=six.StringIO) as out:
+                go.write_output('CSV', SHOW, rows(out))
+
+    def testBuffered(self):
+        with patch('sys.stdout', new_callable=six.StringIO) as out:
+            buffered = go._Buffered(out)
+            buffered.write('abc')
+            self.assertEqual('', out.getvalue())
+            buffered.flush()
+            self.assertEqual('abc', out.getvalue())
+
+    def testOutputFile(self):
+        path = os.path.join(self.tmpdir, 'out.ndjson')
+        with patch('sys.stdout', new_callable=six.StringIO) as out:
+            go.write_output('NDJSON', SHOW, iter(ROWS), path)
+
+        self.assertEqual('', out.getvalue())
+        with open(path) as f:
+            self.assertEqual(3, len(f.readlines()))
+
+    def testOutputFileFormats(self):
+        # the writers write str, which on Python 2 isn't text
+        for output_format in ['TABLE', 'CSV', 'JSON']:
+            path = os.path.join(self.tmpdir, 'out')
+            go.write_output(output_format, SHOW,
+                            iter(ROWS + [[4, u'caf\xe9']]), path)
+            with io.open(path, encoding='utf-8') as f:
+                written = f.read()
+            if output_format == 'JSON':
+                written = json.loads(written)[-1]['subject']
+            self.assertIn(u'caf\xe9', written)
+
+    def testNoPyarrow(self):
+        with patch.dict('sys.modules', {'pyarrow': None}):
+            with self.assertRaises(Exception) as e:
+                go.write_output('PARQUET', SHOW, iter(ROWS),
+                                os.path.join(self.tmpdir, 'out.parquet'))
+        self.assertIn('needs pyarrow', str(e.exception))
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def testArrow(self):
+        import pyarrow.ipc
+
+        path = os.path.join(self.tmpdir, 'out.arrow')
+        with patch.object(go, '_BATCH_ROWS', 2):
+            go.write_output('ARROW', SHOW, iter(ROWS), path)
+
+        with pyarrow.ipc.open_file(path) as f:
+            self.assertEqual(2, f.num_record_batches)
+            table = f.read_all()
+        self.assertEqual([1, 2, 3], table.column('number').to_pylist())
+        self.assertEqual([r[1] for r in ROWS],
+                         table.column('subject').to_pylist())
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def testParquet(self):
+        import pyarrow.parquet
+
+        path = os.path.join(self.tmpdir, 'out.parquet')
+        with patch.object(go, '_BATCH_ROWS', 2):
+            # the first batch decides a column's type, even all nulls
+            go.write_output('PARQUET', SHOW,
+                            iter([[1, None], [2, None], [3, 'three']]), path)
+
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(['number', 'subject'], table.column_names)
+        self.assertEqual([None, None, 'three'],
+                         table.column('subject').to_pylist())
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def testEmptyParquet(self):
+        path = os.path.join(self.tmpdir, 'out.parquet')
+        go.write_output('PARQUET', SHOW, iter([]), path)
+
+        import pyarrow.parquet
+        self.assertEqual(0, pyarrow.parquet.read_table(path).num_rows)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def testParquetServed(self):
+        # stdout is a _Channel when the command is run by serve
+        import pyarrow.parquet
+
+        sock, peer = socket.socketpair()
+        try:
+            channel = gerrit_serve._Channel(sock, b'o', threading.Lock())
+            with patch('sys.stdout', channel):
+                go.write_output('PARQUET', SHOW, iter(ROWS))
+
+            kind, data = gerrit_serve._receive(peer.makefile('rb'))
+        finally:
+            sock.close()
+            peer.close()
+
+        self.assertEqual(b'o', kind)
+        table = pyarrow.parquet.read_table(pyarrow.BufferReader(data))
+        self.assertEqual([1, 2, 3], table.column('number').to_pylist())
@@ -15,6 +15,7 @@
 
 from gerrit_cli import gerrit_query as gq
 from mock import patch
+import time
 import unittest
 
 
@@ -80,6 +81,59 @@ class testExpandList(unittest.TestCase):
                                           "default": ['p']},
                                          self.default))
 
+    def testExpandNested(self):
+        config = {"a": ['b', 'x'], "b": ['c', 'y'], "c": ['z'],
+                  "s": ['s']}
+        table = {}
+        self.assertEqual(['z', 'y', 'x', 's'],
+                         gq._expand_list(['a', 's'], config, self.default,
+                                         table))
+        self.assertEqual(['z', 'y'], table['b'])
+
+        # expansions come from the table once they are there
+        table['c'] = ['w']
+        self.assertEqual(['w', 'q'],
+                         gq._expand_list(['c', 'q'], {}, self.default, table))
+
+    def testExpandCycle(self):
+        config = {"a": ['b'], "b": ['x', 'c'], "c": ['a'],
+                  "d": ['d', 'x']}
+        try:
+            gq._expand_list(['x', 'a'], config, self.default)
+            self.fail("cycle not detected")
+        except Exception as e:
+            self.assertTrue('a -> b -> c -> a' in str(e))
+        self.assertRaises(Exception, gq._expand_list, ['d'], config,
+                          self.default)
+
+    def testAliasTables(self):
+        config = {'queries': {'a': ['b', 'c'], 'b': ['x'],
+                              'loop': ['loop', 'x']},
+                  'results': {'default': ['number', 'b'], 'b': ['age']}}
+        tables = gq.alias_tables(config)
+        self.assertEqual({'a': ['x', 'c'], 'b': ['x'], 'c': ['c'],
+                          'x': ['x']}, tables['queries'])
+        self.assertEqual(['number', 'age'], tables['results']['default'])
+
+        config['aliases'] = {'queries': {'a': ['cached']}}
+        self.assertEqual(['cached', 'x'],
+                         gq.construct_query(['a', 'b'], config))
+
+    def testConstructQueries(self):
+        config = {'queries': {'mine': ['owner:self', 'status:open'],
+                              'stale': ['status:open', 'age:2w']}}
+        self.assertEqual([['owner:self', 'status:open'],
+                          ['status:open', 'age:2w'], ['is:starred']],
+                         gq.construct_queries(['mine', 'stale',
+                                               'is:starred'], config))
+        self.assertEqual([['owner:self', 'status:open']],
+                         gq.construct_queries([], None))
+
+    def testOrQuery(self):
+        self.assertEqual(['a', 'b'], gq.or_query([['a', 'b']]))
+        self.assertEqual(['((a b) OR (c))'],
+                         gq.or_query([['a', 'b'], ['c']]))
+
     def testConstrucQuery1(self):
         self.assertEqual(['owner:self', 'status:open'],
                          gq.construct_query(None, None))
@@ -148,6 +202,36 @@ class testExpandList(unittest.TestCase):
                               {'default': ['pqr:l:80', 'stu:r:9']}}))
 
 
+class testQueryFlags(unittest.TestCase):
+    def setUp(self):
+        super(testQueryFlags, self).setUp()
+
+    def tearDown(self):
+        super(testQueryFlags, self).tearDown()
+
+    def testDefault(self):
+        self.assertEqual({'current_patch_set': False,
+                          'all_patch_sets': False,
+                          'all_approvals': False},
+                         gq.query_flags(gq.construct_show(None, None)))
+
+    def testCurrentPatchSet(self):
+        for column in ['state', 'commitid', 'patchset']:
+            self.assertEqual({'current_patch_set': True,
+                              'all_patch_sets': False,
+                              'all_approvals': False},
+                             gq.query_flags(gq.construct_show(
+                                 ['number', column], None)))
+
+    def testOther(self):
+        self.assertEqual({'current_patch_set': False,
+                          'all_patch_sets': True,
+                          'all_approvals': False,
+                          'show_commit_message': True},
+                         gq.query_flags(gq.construct_show(
+                             ['patchSets', 'commitMessage:l:40'], None)))
+
+
 class testFormatAge(unittest.TestCase):
     def setUp(self):
         super(testFormatAge, self).setUp()
@@ -155,6 +239,16 @@ class testFormatAge(unittest.TestCase):
     def tearDown(self):
         super(testFormatAge, self).tearDown()
 
+    def testSortKey(self):
+        # ages sort by the time they stand for, not as strings
+        key = gq.sort_key({'name': 'age'})
+        ages = [gq._format_age(s) for s in [0, 59, 61, 86399, 604801]]
+        self.assertEqual(ages, sorted(reversed(ages), key=key))
+        self.assertEqual((1, 61), key('1m 1s'))
+
+        key = gq.sort_key({'name': 'subject'})
+        self.assertEqual([None, 'a', 'b'], sorted(['b', None, 'a'], key=key))
+
     def testFormatting(self):
         self.assertEqual('?', gq._format_age(0))
         self.assertEqual('?', gq._format_age(-2))
@@ -273,6 +367,13 @@ class testFormatColumn(unittest.TestCase):
                                                {'number': '11'},
                                                {'number': '12'}]}))
 
+    def testFormat11a(self):
+        self.assertEqual('13',
+                         gq._format_column(101, {'name': 'patchset',
+                                                 'length': 0},
+                                           {'currentPatchSet': {
+                                               'number': '13'}}))
+
     def testFormat12(self):
         self.assertEqual('abc',
                          gq._format_column(101, {'name': 'foo',
@@ -283,6 +384,53 @@ class testFormatColumn(unittest.TestCase):
                                                 {'number': '12'}]}))
 
 
+class testColumns(unittest.TestCase):
+    def setUp(self):
+        self.review = {
+            'number': '7', 'branch': 'master', 'lastUpdated': 100,
+            'currentPatchSet': {'sizeInsertions': 12, 'sizeDeletions': -3},
+            'allReviewers': [{'name': 'abc'}, {'username': 'pqr'}]}
+        super(testColumns, self).setUp()
+
+    def tearDown(self):
+        gq._COLUMN_FLAGS.pop('twice', None)
+        gq.EXTRACTORS.pop('twice', None)
+        super(testColumns, self).tearDown()
+
+    def _row(self, columns):
+        show = gq.construct_show(columns, None)
+        change = gq.Change(self.review, [c.get('name') for c in show])
+        return [cell(101, change) for cell in gq.compile_show(show)]
+
+    def testPlan(self):
+        self.assertEqual([7, '1s', 'ma...'],
+                         self._row(['number', 'age', 'branch:l:5']))
+
+    def testNewColumns(self):
+        with patch('time.localtime', return_value=time.gmtime(100)):
+            self.assertEqual(['', '1970-01-01 00:01', 12, 3, 'abc, pqr'],
+                             self._row(['topic', 'updated', 'insertions',
+                                        'deletions', 'reviewers']))
+
+        self.assertEqual({'current_patch_set': True,
+                          'all_patch_sets': False,
+                          'all_approvals': False,
+                          'show_all_reviewers': True},
+                         gq.query_flags(gq.construct_show(
+                             ['insertions', 'reviewers'], None)))
+
+    def testNotTruncated(self):
+        # only strings are truncated
+        self.assertEqual([12], self._row(['insertions:r:1']))
+
+    def testRegister(self):
+        gq.register_column('twice', lambda r: 2 * int(r.get('number')),
+                           ['all_patch_sets'])
+        self.assertEqual([14], self._row(['twice']))
+        self.assertTrue(gq.query_flags(gq.construct_show(
+            ['twice'], None)).get('all_patch_sets'))
+
+
 class testProcessResults(unittest.TestCase):
     def setUp(self):
         super(testProcessResults, self).setUp()
@@ -310,6 +458,29 @@ class testProcessResults(unittest.TestCase):
                              '{"rowCount": "3"}'])
         self.assertRaises(Exception, gq.process_results, results)
 
+    def testIterResults1(self):
+        def lines():
+            yield '{"number": "1"}\n'
+            yield '{"number": "2"}\n'
+            # nothing past this point has been read yet
+            self.assertEqual(['1', '2'], [r.get('number') for r in seen])
+            yield '{"type": "stats", "rowCount": 2}\n'
+
+        seen = []
+        for review in gq.iter_results(lines()):
+            seen.append(review)
+
+        self.assertEqual(2, len(seen))
+
+    def testIterResults2(self):
+        reviews = gq.iter_results(['{"number": "1"}\n',
+                                   '{"type": "stats", "rowCount": 2}\n'])
+        self.assertEqual({'number': '1'}, next(reviews))
+        self.assertRaises(Exception, next, reviews)
+
+    def testIterResults3(self):
+        self.assertEqual([], list(gq.iter_results([])))
+
 
 class testGenerateOutput(unittest.TestCase):
     def setUp(self):
@@ -358,3 +529,11 @@ class testGenerateOutput(unittest.TestCase):
                                      "colname": "Age",
                                      "length": 0,
                                      "name": "age"}]))
+
+    def testIterOutput1(self):
+        with patch('time.time', return_value=200):
+            self.assertEqual(
+                [[1, '1s'], [2, '1s'], [3, '2s']],
+                list(gq.iter_output(iter(self.output.split('\n')),
+                                    [{"name": "number", "length": 0},
+                                     {"name": "age", "length": 0}])))
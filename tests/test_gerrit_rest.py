@@ -0,0 +1,256 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from fake_gerrit_http import change
+from fake_gerrit_http import FakeGerrit
+from gerrit_cli import gerrit_rest
+from gerrit_cli import gerrit_ssh
+import json
+from mock import patch
+import six
+import unittest
+
+
+class testToSSH(unittest.TestCase):
+    def testChange(self):
+        review = gerrit_rest.to_ssh(change(7, revisions=2),
+                                    'https://review.example.com')
+        self.assertEqual(7, review['number'])
+        self.assertEqual('change 7', review['subject'])
+        self.assertEqual('https://review.example.com/7', review['url'])
+        self.assertEqual({'name': 'Owner', 'username': 'owner'},
+                         review['owner'])
+        self.assertEqual(1451703845, review['lastUpdated'])
+        self.assertTrue(review['open'])
+
+        cps = review['currentPatchSet']
+        self.assertEqual(2, cps['number'])
+        self.assertEqual(10, cps['sizeInsertions'])
+        self.assertEqual(-2, cps['sizeDeletions'])
+        self.assertEqual([{'type': 'Code-Review', 'description': 'Code-Review',
+                           'value': '2', 'grantedOn': 1451692800,
+                           'by': {'name': 'Core', 'username': 'core'}}],
+                         cps['approvals'])
+
+        self.assertEqual([1, 2], [ps['number'] for ps in review['patchSets']])
+        self.assertEqual([{'name': 'Core', 'username': 'core'}],
+                         review['allReviewers'])
+
+    def testFilesAndMessages(self):
+        c = change(7, messages=[{'date': '2016-01-01 00:00:00.000000000',
+                                 'author': {'name': 'Core'},
+                                 'message': 'Looks good'}])
+        c['revisions'][c['current_revision']]['files'] = {
+            'a.py': {'lines_inserted': 3, 'lines_deleted': 1},
+            'b.py': {'status': 'A', 'lines_inserted': 5}}
+        c['revisions'][c['current_revision']]['commit'] = {
+            'message': 'change 7\n\nChange-Id: I7\n'}
+
+        review = gerrit_rest.to_ssh(c, 'https://review.example.com')
+        self.assertEqual([{'file': 'a.py', 'type': 'MODIFIED',
+                           'insertions': 3, 'deletions': -1},
+                          {'file': 'b.py', 'type': 'A',
+                           'insertions': 5, 'deletions': 0}],
+                         review['currentPatchSet']['files'])
+        self.assertEqual('change 7\n\nChange-Id: I7\n',
+                         review['commitMessage'])
+        self.assertEqual([{'timestamp': 1451606400,
+                           'reviewer': {'name': 'Core'},
+                           'message': 'Looks good'}], review['comments'])
+
+
+class _RESTTest(unittest.TestCase):
+    changes = [change(n) for n in range(1, 6)]
+    page_size = 500
+
+    def setUp(self):
+        super(_RESTTest, self).setUp()
+        self.fake = FakeGerrit(self.changes, page_size=self.page_size)
+        self.url = self.fake.start()
+        self.config = {'transport': 'rest', 'rest-url': self.url,
+                       'rest-timeout': 5}
+
+    def tearDown(self):
+        gerrit_rest._pools.pop(('http', self.url[len('http://'):]),
+                               gerrit_rest.HTTPPool('http', '')).close()
+        self.fake.stop()
+        super(_RESTTest, self).tearDown()
+
+    def _query(self, query=['status:open'], **kwargs):
+        session = gerrit_rest.GerritREST(self.config)
+        lines = list(session.query_stream(query, **kwargs))
+        return [json.loads(line) for line in lines]
+
+
+class testQuery(_RESTTest):
+    page_size = 2
+
+    def testPages(self):
+        reviews = self._query()
+        self.assertEqual([1, 2, 3, 4, 5],
+                         [r['number'] for r in reviews[:-1]])
+        self.assertEqual({'type': 'stats', 'rowCount': 5,
+                          'moreChanges': False}, reviews[-1])
+
+        starts = [r[2].get('S', ['0'])[0] for r in self.fake.requests]
+        self.assertEqual(['0', '2', '4'], starts)
+        self.assertEqual(['status:open'], self.fake.requests[0][2]['q'])
+
+    def testMaxResults(self):
+        reviews = self._query(max_results=3)
+        self.assertEqual([1, 2, 3], [r['number'] for r in reviews[:-1]])
+        self.assertEqual(3, reviews[-1]['rowCount'])
+        self.assertEqual(['3', '1'],
+                         [r[2]['n'][0] for r in self.fake.requests])
+
+    def testLimitOperator(self):
+        # a query with its own limit: is the server's to answer, as over
+        # ssh, and isn't paginated.
+        reviews = self._query(['status:open', 'limit:2'])
+        self.assertEqual(2, reviews[-1]['rowCount'])
+        self.assertTrue(reviews[-1]['moreChanges'])
+        self.assertEqual(1, len(self.fake.requests))
+
+    def testOptions(self):
+        self._query(current_patch_set=True, show_files=True)
+        options = self.fake.requests[0][2]['o']
+        for o in ['DETAILED_ACCOUNTS', 'CURRENT_REVISION', 'CURRENT_FILES',
+                  'ALL_REVISIONS', 'DETAILED_LABELS']:
+            self.assertIn(o, options)
+        self.assertNotIn('MESSAGES', options)
+
+    def testQuery(self):
+        session = gerrit_rest.GerritREST(self.config)
+        out, err = session.query(['status:open'])
+        self.assertEqual(6, len(out.splitlines()))
+        self.assertEqual("", err)
+
+    def testPrefetch(self):
+        reviews = self._query(prefetch=True)
+        self.assertEqual(6, len(reviews))
+
+    def testDryRun(self):
+        self.config['dry-run'] = True
+        with patch('sys.stdout', new_callable=six.StringIO) as out:
+            self.assertEqual([], self._query())
+        self.assertTrue(out.getvalue().startswith(
+            'GET %s/changes/?q=status%%3Aopen' % self.url))
+        self.assertEqual([], self.fake.requests)
+
+
+class testConnections(_RESTTest):
+    def testKeepAlive(self):
+        # every request, from every session, goes over one connection
+        for i in range(3):
+            self._query()
+        gerrit_rest.GerritREST(self.config).update(
+            '1,1', ['a comment'], None, None)
+
+        self.assertEqual(4, len(self.fake.requests))
+        self.assertEqual(1, self.fake.connections)
+
+    def testGzip(self):
+        self.assertEqual(6, len(self._query()))
+        self.assertEqual(1, self.fake.gzipped)
+
+    def testDropped(self):
+        # a kept connection the server has since closed is replaced
+        self.fake.drop = True
+        for i in range(3):
+            self.assertEqual(6, len(self._query()))
+        self.assertEqual(3, self.fake.connections)
+
+    def testAuthenticated(self):
+        self.fake.username = 'user'
+        self.fake.password = 'secret'
+        self.config['http-username'] = 'user'
+        self.config['http-password'] = 'secret'
+        self.assertEqual(6, len(self._query()))
+        self.assertEqual('/a/changes/', self.fake.requests[0][1])
+
+        self.config['http-password'] = 'wrong'
+        with self.assertRaises(gerrit_rest.RESTError) as e:
+            self._query()
+        self.assertEqual(401, e.exception.status)
+
+
+class testReview(_RESTTest):
+    def testReview(self):
+        session = gerrit_rest.GerritREST(self.config)
+        results = session.review(['%040x' % 201, '3,1'], ['LGTM'], '+2', '1')
+        self.assertEqual([(0, "", "")] * 2, results)
+
+        self.assertEqual(
+            [('/changes/2/revisions/%040x/review' % 201,
+              {'message': 'LGTM',
+               'labels': {'Code-Review': 2, 'Workflow': 1}}),
+             ('/changes/3/revisions/1/review',
+              {'message': 'LGTM',
+               'labels': {'Code-Review': 2, 'Workflow': 1}})],
+            self.fake.posts)
+
+        # the commit is looked up with a single query
+        gets = [r for r in self.fake.requests if r[0] == 'GET']
+        self.assertEqual(1, len(gets))
+        self.assertEqual(['(commit:%040x)' % 201], gets[0][2]['q'])
+
+    def testAbandon(self):
+        session = gerrit_rest.GerritREST(self.config)
+        self.assertEqual((0, "", ""),
+                         session.abandon('4,1', ['gone'], None, None))
+        self.assertEqual((0, "", ""),
+                         session.restore('4,1', ['back'], '-1', None))
+        self.assertEqual(
+            [('/changes/4/abandon', {'message': 'gone'}),
+             ('/changes/4/revisions/1/review',
+              {'labels': {'Code-Review': -1}}),
+             ('/changes/4/restore', {'message': 'back'})],
+            self.fake.posts)
+
+    def testFailures(self):
+        self.fake.fail.add('2')
+        session = gerrit_rest.GerritREST(self.config)
+        results = session.review(['1,1', '2,1', 'abcdef'], ['LGTM'], None,
+                                 None)
+
+        self.assertEqual((0, "", ""), results[0])
+        self.assertEqual(1, results[1][0])
+        self.assertIn('409', results[1][2])
+        self.assertIn('change is closed', results[1][2])
+        self.assertEqual((1, "", "no change with commit abcdef"), results[2])
+        self.assertEqual(['/changes/1/revisions/1/review'],
+                         [p[0] for p in self.fake.posts])
+
+    def testDryRun(self):
+        self.config['dry-run'] = True
+        session = gerrit_rest.GerritREST(self.config)
+        results = session.review(['1,1'], ['LGTM'], '+1', None)
+        self.assertEqual(0, results[0][0])
+        self.assertIn('1,1 LGTM', results[0][1])
+        self.assertEqual([], self.fake.requests)
+
+
+class testOpenSession(unittest.TestCase):
+    def testTransport(self):
+        self.assertIsInstance(gerrit_ssh.open_session({'host': 'h'}),
+                              gerrit_ssh.GerritSSH)
+        session = gerrit_ssh.open_session({'transport': 'rest',
+                                           'host': 'review.example.com'})
+        self.assertEqual('GerritREST', type(session).__name__)
+        self.assertEqual('https://review.example.com', session.url)
+
+        with self.assertRaises(Exception) as e:
+            gerrit_ssh.open_session({'transport': 'telnet'})
+        self.assertIn('unknown transport telnet', str(e.exception))
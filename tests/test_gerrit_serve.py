@@ -0,0 +1,135 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from gerrit_cli import gerrit_serve
+import io
+from mock import patch
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+
+class testServe(unittest.TestCase):
+    def setUp(self):
+        super(testServe, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'serve.sock')
+        self.requests = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(testServe, self).tearDown()
+
+    def _execute(self, argv, cwd):
+        self.requests.append((argv, cwd))
+        if argv[0] == 'exit':
+            sys.exit(int(argv[1]) if argv[1].isdigit() else argv[1])
+        if argv[0] == 'fail':
+            raise Exception("failed " + argv[1])
+
+        for arg in argv:
+            print(arg)
+        sys.stderr.write('done\n')
+
+    def _forward(self, *requests):
+        # forward each request to a server answering just those, and
+        # return (status, stdout, stderr) for each.
+        server = gerrit_serve.Server(self._execute, self.path)
+        server.listen()
+
+        def serve():
+            for request in requests:
+                conn, _addr = server.sock.accept()
+                try:
+                    server.handle(conn)
+                finally:
+                    conn.close()
+
+        t = threading.Thread(target=serve)
+        t.start()
+
+        results = []
+        try:
+            for request in requests:
+                stdout, stderr = io.BytesIO(), io.BytesIO()
+                with patch.object(sys, 'stdout', stdout):
+                    with patch.object(sys, 'stderr', stderr):
+                        status = gerrit_serve.forward(request, '/work',
+                                                      self.path)
+                results.append((status, stdout.getvalue().decode('utf-8'),
+                                stderr.getvalue().decode('utf-8')))
+        finally:
+            t.join()
+            server.close()
+
+        return results
+
+    def testForward(self):
+        self.assertEqual([(0, 'ls\nstatus:open\n', 'done\n')],
+                         self._forward(['ls', 'status:open']))
+        self.assertEqual([(['ls', 'status:open'], '/work')], self.requests)
+
+    def testLargeOutput(self):
+        argv = ['x' * 1000] * 100
+        self.assertEqual([(0, '\n'.join(argv) + '\n', 'done\n')],
+                         self._forward(argv))
+
+    def testExitStatus(self):
+        results = self._forward(['exit', '3'], ['exit', '0'],
+                                ['exit', 'stopped'])
+        self.assertEqual([(3, '', ''), (0, '', ''), (1, '', 'stopped\n')],
+                         results)
+
+    def testException(self):
+        [(status, stdout, stderr)] = self._forward(['fail', 'badly'])
+        self.assertEqual(1, status)
+        self.assertIn('failed badly', stderr)
+
+    def testRestoresOutput(self):
+        stdout, stderr = sys.stdout, sys.stderr
+        self._forward(['ls'])
+        self.assertIs(stdout, sys.stdout)
+        self.assertIs(stderr, sys.stderr)
+
+    def testNoServer(self):
+        self.assertIsNone(gerrit_serve.forward(['ls'], '/work', self.path))
+
+        # a socket left behind by a server that has gone away
+        with open(self.path, 'w') as f:
+            f.write('')
+        self.assertIsNone(gerrit_serve.forward(['ls'], '/work', self.path))
+
+    def testStale(self):
+        with open(self.path, 'w') as f:
+            f.write('')
+
+        self.assertEqual([(0, 'ls\n', 'done\n')], self._forward(['ls']))
+        self.assertFalse(os.path.exists(self.path))
+
+    def testAlreadyListening(self):
+        server = gerrit_serve.Server(self._execute, self.path)
+        server.listen()
+        try:
+            self.assertRaises(Exception, gerrit_serve.Server(
+                self._execute, self.path).listen)
+        finally:
+            server.close()
+
+    def testSocketPath(self):
+        with patch.dict(os.environ, {'GERRIT_CLI_SOCKET': self.path}):
+            self.assertEqual(self.path, gerrit_serve.socket_path())
@@ -0,0 +1,457 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from gerrit_cli import gerrit_ssh
+import json
+from mock import patch
+import os
+import shutil
+import six
+import tempfile
+import time
+import unittest
+
+
+FAKE_SSH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'fake_ssh.py')
+
+
+class testControlMaster(unittest.TestCase):
+    def setUp(self):
+        super(testControlMaster, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmpdir, 'log')
+        self.environ = dict(os.environ)
+        os.environ['FAKE_SSH_LOG'] = self.log
+        os.environ['FAKE_SSH_HANDSHAKE'] = '0'
+        self.config = {'host': 'review.example.com',
+                       'port': 29418,
+                       'ssh-command': FAKE_SSH,
+                       'ssh-control-dir': self.tmpdir}
+
+    def tearDown(self):
+        gerrit_ssh._close_masters()
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tmpdir)
+        super(testControlMaster, self).tearDown()
+
+    def _log(self, entry):
+        if not os.path.exists(self.log):
+            return 0
+
+        with open(self.log) as f:
+            return len([e for e in f if e.startswith(entry)])
+
+    def testMultiplexed(self):
+        session = gerrit_ssh.GerritSSH(self.config)
+        for i in range(3):
+            session.query(['status:open'])
+        session.update('abc', ['a comment'], None, None)
+
+        self.assertEqual(1, self._log('handshake'))
+        self.assertEqual(4, self._log('command'))
+
+    def testSharedBetweenSessions(self):
+        gerrit_ssh.GerritSSH(self.config).query(['status:open'])
+        gerrit_ssh.GerritSSH(self.config).abandon('abc', ['x'], None, None)
+
+        self.assertEqual(1, self._log('handshake'))
+
+    def testNotMultiplexed(self):
+        self.config['ssh-multiplex'] = False
+        session = gerrit_ssh.GerritSSH(self.config)
+        for i in range(3):
+            session.query(['status:open'])
+
+        self.assertEqual(3, self._log('handshake'))
+
+    def testReopen(self):
+        session = gerrit_ssh.GerritSSH(self.config)
+        session.query(['status:open'])
+
+        master = gerrit_ssh._get_master(self.config)
+        os.unlink(master.path)
+        master.checked = 0
+
+        session.query(['status:open'])
+        self.assertEqual(2, self._log('handshake'))
+
+    def testOpenFailed(self):
+        # a master that will not open isn't tried for every command
+        os.environ['FAKE_SSH_MASTER_FAIL'] = '1'
+        session = gerrit_ssh.GerritSSH(self.config)
+        for i in range(3):
+            session.query(['status:open'])
+        self.assertEqual(4, self._log('handshake'))
+
+        # but is once a while has passed
+        del os.environ['FAKE_SSH_MASTER_FAIL']
+        gerrit_ssh._get_master(self.config).failed = 0
+        session.query(['status:open'])
+        session.query(['status:open'])
+        self.assertEqual(5, self._log('handshake'))
+
+    def testClose(self):
+        gerrit_ssh.GerritSSH(self.config).query(['status:open'])
+
+        master = gerrit_ssh._get_master(self.config)
+        self.assertTrue(os.path.exists(master.path))
+
+        gerrit_ssh._close_masters()
+        self.assertFalse(os.path.exists(master.path))
+        # not exit, which would cut off other processes' commands
+        self.assertEqual(1, self._log('stop'))
+        self.assertEqual(0, self._log('exit'))
+
+    def testDryRun(self):
+        self.config['dry-run'] = True
+        self.assertEqual(("", ""), gerrit_ssh.GerritSSH(self.config).query(
+            ['status:open']))
+        self.assertEqual(0, self._log('handshake'))
+
+    def testReviewBatch(self):
+        os.environ['FAKE_SSH_REVIEW_FAIL'] = 'c2'
+        session = gerrit_ssh.GerritSSH(self.config)
+        results = session.review(['c1', 'c2', 'c3'], ['recheck'], None, None)
+
+        self.assertEqual([0, 1, 0], [r[0] for r in results])
+        self.assertEqual('error: no such change c2', results[1][2])
+        self.assertEqual(1, self._log('command gerrit review'))
+
+    def testQueryStream(self):
+        output = os.path.join(self.tmpdir, 'output')
+        with open(output, 'w') as f:
+            f.write('{"number": "1"}\n{"number": "2"}\n'
+                    '{"type": "stats", "rowCount": 2}\n')
+        os.environ['FAKE_SSH_OUTPUT'] = output
+
+        session = gerrit_ssh.GerritSSH(self.config)
+        lines = list(session.query_stream(['status:open']))
+        self.assertEqual(['{"number": "1"}\n', '{"number": "2"}\n'],
+                         lines[:2])
+        self.assertEqual({'type': 'stats', 'rowCount': 2,
+                          'moreChanges': False}, json.loads(lines[2]))
+
+    def testQueryStreamClosed(self):
+        output = os.path.join(self.tmpdir, 'output')
+        with open(output, 'w') as f:
+            f.write('{"number": "1"}\n' * 1000)
+        os.environ['FAKE_SSH_OUTPUT'] = output
+
+        lines = gerrit_ssh.GerritSSH(self.config).query_stream(['x'])
+        self.assertEqual('{"number": "1"}\n', next(lines))
+        lines.close()
+
+
+class testPagination(unittest.TestCase):
+    def setUp(self):
+        super(testPagination, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmpdir, 'log')
+        output = os.path.join(self.tmpdir, 'output')
+        with open(output, 'w') as f:
+            for i in range(1, 26):
+                f.write('{"number": "%d", "sortKey": "k%d"}\n' % (i, i))
+            f.write('{"type": "stats", "rowCount": 25}\n')
+
+        self.environ = dict(os.environ)
+        os.environ['FAKE_SSH_LOG'] = self.log
+        os.environ['FAKE_SSH_HANDSHAKE'] = '0'
+        os.environ['FAKE_SSH_OUTPUT'] = output
+        os.environ['FAKE_SSH_PAGE_SIZE'] = '10'
+        self.config = {'host': 'review.example.com',
+                       'port': 29418,
+                       'ssh-command': FAKE_SSH,
+                       'ssh-control-dir': self.tmpdir}
+
+    def tearDown(self):
+        gerrit_ssh._close_masters()
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tmpdir)
+        super(testPagination, self).tearDown()
+
+    def _query(self, query, **kwargs):
+        session = gerrit_ssh.GerritSSH(self.config)
+        lines = list(session.query_stream(query, **kwargs))
+
+        with open(self.log) as f:
+            commands = [e for e in f if e.startswith('command')]
+
+        return ([json.loads(e) for e in lines], commands)
+
+    def testAllPages(self):
+        results, commands = self._query(['status:open'])
+        self.assertEqual([str(i) for i in range(1, 26)],
+                         [r.get('number') for r in results[:-1]])
+        self.assertEqual(25, results[-1].get('rowCount'))
+        self.assertEqual(3, len(commands))
+        self.assertTrue('--start 20' in commands[2])
+
+    def testQuery(self):
+        # query() follows the pages too
+        stdout, stderr = gerrit_ssh.GerritSSH(self.config).query(
+            ['status:open'])
+        lines = stdout.splitlines()
+        self.assertEqual(26, len(lines))
+        self.assertEqual(25, json.loads(lines[-1]).get('rowCount'))
+
+        with open(self.log) as f:
+            self.assertEqual(3, len([e for e in f
+                                     if e.startswith('command')]))
+
+    def testMaxResults(self):
+        results, commands = self._query(['status:open'], max_results=15)
+        self.assertEqual(16, len(results))
+        self.assertEqual(15, results[-1].get('rowCount'))
+        self.assertEqual(2, len(commands))
+        self.assertTrue('limit:5' in commands[1])
+
+    def testQueryLimit(self):
+        results, commands = self._query(['status:open', 'limit:5'])
+        self.assertEqual(6, len(results))
+        self.assertEqual(1, len(commands))
+
+    def testPrefetch(self):
+        results, commands = self._query(['status:open'], prefetch=True)
+        self.assertEqual(26, len(results))
+        self.assertEqual(3, len(commands))
+
+    def testSortKey(self):
+        self.config['query-pagination'] = 'sortkey'
+        results, commands = self._query(['status:open'])
+        self.assertTrue('resume_sortkey:k10' in commands[1])
+
+
+class testAttribute(unittest.TestCase):
+    def setUp(self):
+        super(testAttribute, self).setUp()
+
+    def tearDown(self):
+        super(testAttribute, self).tearDown()
+
+    def testSuccess(self):
+        self.assertEqual([(0, "", ""), (0, "", "")],
+                         gerrit_ssh._attribute(['a', 'b'], [['a'], ['b']],
+                                               0, "", ""))
+
+    def testKeys(self):
+        results = gerrit_ssh._attribute(
+            ['abc', 'def'], [['abc', 12, '12,3'], ['def', 123, '123,1']], 1,
+            "", "error: change 123 is closed\n"
+            "fatal: internal server error while reviewing 12,3\n"
+            "fatal: one or more reviews failed; review output above\n")
+
+        self.assertEqual((1, "", "fatal: internal server error while "
+                          "reviewing 12,3"), results[0])
+        self.assertEqual((1, "", "error: change 123 is closed"), results[1])
+
+    def testNumberKeys(self):
+        # 12 is the patch set of 123 here, not change 12
+        results = gerrit_ssh._attribute(
+            ['abc', 'def'], [['abc', 12], ['def', 123]], 1, "",
+            "error: 123,12: change is closed\n"
+            "fatal: one or more reviews failed; review output above\n")
+        self.assertEqual([0, 1], [r[0] for r in results])
+
+        self.assertTrue(gerrit_ssh._mentions('error: change 12 is closed',
+                                             12))
+        self.assertFalse(gerrit_ssh._mentions('error: 12 files', 12))
+
+    def testUnknown(self):
+        results = gerrit_ssh._attribute(['a', 'b'], [['a'], ['b']], 255, "",
+                                        "ssh: connect to host: refused\n")
+        self.assertEqual([1, 1], [r[0] for r in results])
+        self.assertTrue(results[0][2].startswith('outcome unknown'))
+
+
+class testFailures(unittest.TestCase):
+    def setUp(self):
+        super(testFailures, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmpdir, 'log')
+        self.turned_away = os.path.join(self.tmpdir, 'fail')
+        output = os.path.join(self.tmpdir, 'output')
+        with open(output, 'w') as f:
+            for i in range(1, 26):
+                f.write('{"number": "%d"}\n' % i)
+            f.write('{"type": "stats", "rowCount": 25}\n')
+
+        self.environ = dict(os.environ)
+        os.environ['FAKE_SSH_LOG'] = self.log
+        os.environ['FAKE_SSH_HANDSHAKE'] = '0'
+        os.environ['FAKE_SSH_OUTPUT'] = output
+        os.environ['FAKE_SSH_FAIL'] = self.turned_away
+        self.config = {'host': 'review.example.com',
+                       'port': 29418,
+                       'ssh-command': FAKE_SSH,
+                       'ssh-control-dir': self.tmpdir,
+                       'ssh-backoff': 0.01}
+
+    def tearDown(self):
+        gerrit_ssh._close_masters()
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tmpdir)
+        super(testFailures, self).tearDown()
+
+    def _failing(self, count, error=None):
+        with open(self.turned_away, 'w') as f:
+            f.write(str(count))
+        if error is not None:
+            os.environ['FAKE_SSH_FAIL_ERROR'] = error
+        else:
+            os.environ.pop('FAKE_SSH_FAIL_ERROR', None)
+
+    def _commands(self):
+        with open(self.log) as f:
+            return len([e for e in f if e.startswith('command')])
+
+    def testRetried(self):
+        self._failing(2)
+        stdout, stderr = gerrit_ssh.GerritSSH(self.config).query(['x'])
+        self.assertEqual(26, len(stdout.splitlines()))
+        self.assertEqual(3, self._commands())
+
+    def testRetriesExhausted(self):
+        self._failing(10)
+        self.config['ssh-retries'] = 2
+        try:
+            gerrit_ssh.GerritSSH(self.config).query(['x'])
+            self.fail("expected SSHError")
+        except gerrit_ssh.SSHError as e:
+            self.assertEqual('unavailable', e.kind)
+            self.assertEqual(255, e.returncode)
+            self.assertTrue('Too many concurrent connections' in e.stderr)
+        self.assertEqual(3, self._commands())
+
+    def testInterrupted(self):
+        # a review that may have gone through isn't sent again, a query is
+        self._failing(1, 'Connection reset by 127.0.0.1 port 29418')
+        session = gerrit_ssh.GerritSSH(self.config)
+        try:
+            session.review(['c1', 'c2'], ['recheck'], None, None)
+            self.fail("expected SSHError")
+        except gerrit_ssh.SSHError as e:
+            self.assertEqual('interrupted', e.kind)
+        self.assertEqual(1, self._commands())
+
+        self._failing(1)
+        self.assertEqual([0, 0], [r[0] for r in session.review(
+            ['c1', 'c2'], ['recheck'], None, None)])
+        self.assertEqual(3, self._commands())
+
+    def testQueryStreamRetried(self):
+        os.environ['FAKE_SSH_PAGE_SIZE'] = '10'
+        self._failing(1)
+        lines = list(gerrit_ssh.GerritSSH(self.config).query_stream(['x']))
+        self.assertEqual(26, len(lines))
+        self.assertEqual(4, self._commands())
+
+    def testQueryError(self):
+        os.environ['FAKE_SSH_QUERY_ERROR'] = 'line 1:0 no viable alternative'
+        session = gerrit_ssh.GerritSSH(self.config)
+        six.assertRaisesRegex(self, gerrit_ssh.SSHError,
+                              'gerrit query failed: line 1:0',
+                              session.query, ['x'])
+        six.assertRaisesRegex(self, gerrit_ssh.SSHError,
+                              'gerrit query failed: line 1:0',
+                              list, session.query_stream(['x']))
+        self.assertEqual(2, self._commands())
+
+    def testTimeout(self):
+        os.environ['FAKE_SSH_DELAY'] = '10'
+        self.config['ssh-timeout'] = 0.2
+        self.config['ssh-retries'] = 1
+        session = gerrit_ssh.GerritSSH(self.config)
+
+        started = time.time()
+        self.assertRaises(gerrit_ssh.SSHTimeout, session.query, ['x'])
+        self.assertRaises(gerrit_ssh.SSHTimeout, list,
+                          session.query_stream(['x']))
+        self.assertLess(time.time() - started, 5)
+        self.assertEqual(4, self._commands())
+
+    def testCircuitOpen(self):
+        self._failing(10)
+        self.config['ssh-retries'] = 1
+        self.config['ssh-breaker-threshold'] = 3
+        session = gerrit_ssh.GerritSSH(self.config)
+
+        self.assertRaises(gerrit_ssh.SSHError, session.query, ['x'])
+        try:
+            session.query(['x'])
+            self.fail("expected SSHError")
+        except gerrit_ssh.SSHError as e:
+            self.assertEqual('circuit-open', e.kind)
+        self.assertEqual(3, self._commands())
+
+
+class testBackoff(unittest.TestCase):
+    def testDelays(self):
+        backoff = gerrit_ssh._Backoff({'ssh-retries': 4, 'ssh-backoff': 1,
+                                       'ssh-backoff-max': 5})
+        error = gerrit_ssh.SSHError(['ssh'], 255, "", 'unavailable')
+
+        with patch('random.uniform', side_effect=lambda a, b: b):
+            self.assertEqual([1, 2, 4, 5],
+                             [backoff.delay(error, False) for i in range(4)])
+            self.assertRaises(gerrit_ssh.SSHError, backoff.delay, error,
+                              False)
+
+    def testNotRetriable(self):
+        backoff = gerrit_ssh._Backoff({})
+        for kind in [None, 'circuit-open']:
+            self.assertRaises(gerrit_ssh.SSHError, backoff.delay,
+                              gerrit_ssh.SSHError(['ssh'], 1, "", kind), True)
+        self.assertRaises(gerrit_ssh.SSHError, backoff.delay,
+                          gerrit_ssh.SSHTimeout(['ssh'], 1), False)
+        self.assertTrue(backoff.delay(gerrit_ssh.SSHTimeout(['ssh'], 1),
+                                      True) >= 0)
+
+    def testClassify(self):
+        self.assertEqual(None, gerrit_ssh._classify(0, ""))
+        self.assertEqual(None, gerrit_ssh._classify(
+            1, "fatal: one or more reviews failed"))
+        self.assertEqual('unavailable', gerrit_ssh._classify(
+            255, "ssh: connect to host x port 29418: Connection refused"))
+        self.assertEqual('interrupted', gerrit_ssh._classify(255, ""))
+        self.assertEqual(None, gerrit_ssh._classify(
+            255, "Permission denied (publickey)."))
+
+
+class testCircuitBreaker(unittest.TestCase):
+    def testTrial(self):
+        breaker = gerrit_ssh.CircuitBreaker(2, 30)
+        breaker.failure()
+        breaker.check(['ssh'])
+        breaker.failure()
+        self.assertRaises(gerrit_ssh.SSHError, breaker.check, ['ssh'])
+
+        # once reset has passed, one command is let through
+        breaker.opened -= 30
+        breaker.check(['ssh'])
+        self.assertRaises(gerrit_ssh.SSHError, breaker.check, ['ssh'])
+
+        breaker.success()
+        breaker.check(['ssh'])
+        breaker.check(['ssh'])
+
+    def testDisabled(self):
+        breaker = gerrit_ssh.CircuitBreaker(0, 30)
+        for i in range(10):
+            breaker.failure()
+        breaker.check(['ssh'])
@@ -0,0 +1,158 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from gerrit_cli import gerrit_query as gq
+from gerrit_cli import gerrit_store as gst
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+
+def _change(number, project, owner, status='NEW', age=0, votes=()):
+    return {'number': str(number), 'project': project, 'branch': 'master',
+            'topic': 'topic%d' % (number % 2), 'status': status,
+            'owner': {'username': owner, 'email': '%s@example.com' % owner,
+                      'name': owner.capitalize()},
+            'lastUpdated': int(time.time()) - age,
+            'currentPatchSet': {
+                'number': '1',
+                'approvals': [{'type': t, 'value': v, 'by': {'username': u}}
+                              for t, v, u in votes]}}
+
+
+class testTranslate(unittest.TestCase):
+    def setUp(self):
+        super(testTranslate, self).setUp()
+
+    def tearDown(self):
+        super(testTranslate, self).tearDown()
+
+    def testSupported(self):
+        for q in [['project:a'], ['owner:bob', 'status:open'],
+                  ['(project:a OR project:b)', 'branch:master'],
+                  ['NOT label:Code-Review>=-2,self'], ['-age:1d'],
+                  ['topic:"x y"'], ['12345'], ['label:Verified+1'],
+                  ['is:open', 'AND', 'label:Code-Review-1']]:
+            self.assertIsNotNone(gst.translate(q, 'bob'), q)
+
+    def testUnsupported(self):
+        for q in [['file:x'], ['owner:self'], ['(project:a'],
+                  ['age:2fortnights'], ['status:reviewed'],
+                  ['label:Code-Review'], ['project:a', 'OR']]:
+            self.assertIsNone(gst.translate(q), q)
+
+
+class testChangeStore(unittest.TestCase):
+    def setUp(self):
+        super(testChangeStore, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = {'host': 'review.example.com', 'port': 29418,
+                       'username': 'bob',
+                       'store': os.path.join(self.tmpdir, 'changes.db')}
+        self.scope = ['status:open']
+        self.store = gst.ChangeStore(self.config)
+        self.store.update(self.scope, [
+            _change(1, 'a', 'bob', age=10,
+                    votes=[('Code-Review', '2', 'carol')]),
+            _change(2, 'a', 'carol', age=20,
+                    votes=[('Code-Review', '-1', 'bob'),
+                           ('Verified', '1', 'ci')]),
+            _change(3, 'b', 'bob', age=3 * 86400),
+            _change(4, 'b', 'dave', age=40)], replace=True)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmpdir)
+        super(testChangeStore, self).tearDown()
+
+    def _select(self, *terms):
+        reviews = self.store.select(self.scope + list(terms), self.scope)
+        if reviews is None:
+            return None
+        return [json.loads(r)['number'] for r in reviews]
+
+    def testOperators(self):
+        self.assertEqual(['1', '2', '4', '3'], self._select())
+        self.assertEqual(['1', '2'], self._select('project:a'))
+        self.assertEqual(['1', '3'], self._select('owner:self'))
+        self.assertEqual(['2'], self._select('owner:Carol'))
+        self.assertEqual(['1', '3'], self._select('topic:topic1'))
+        self.assertEqual(['3'], self._select('age:1d'))
+        self.assertEqual(['1', '2', '4'], self._select('-age:1d'))
+        self.assertEqual(['2', '3'],
+                         self._select('(project:b OR owner:carol)',
+                                      '-owner:dave'))
+        self.assertEqual(['4'], self._select('4'))
+
+    def testLabels(self):
+        self.assertEqual(['1'], self._select('label:Code-Review=2'))
+        self.assertEqual(['1'], self._select('label:Code-Review+2'))
+        self.assertEqual(['2'], self._select('label:Code-Review<=-1'))
+        self.assertEqual(['2'], self._select('label:Verified+1,ci'))
+        # no votes at all counts as a 0 vote, whoever it is asked for
+        self.assertEqual(['4', '3'], self._select('label:Code-Review=0'))
+        self.assertEqual(['1'],
+                         self._select('NOT label:Code-Review>=-2,self'))
+
+    def testUnsupported(self):
+        self.assertIsNone(self._select('file:README'))
+
+    def testMembership(self):
+        self.store.update(self.scope, [], removed=['2'])
+        self.assertEqual(['1', '4', '3'], self._select())
+
+        self.store.update(self.scope, [_change(5, 'c', 'erin')],
+                          replace=True)
+        self.assertEqual(['5'], self._select())
+
+    def testStoreLines(self):
+        self.store.close()
+        lines = gst.store_lines(self.config, ['project:a', 'status:open'])
+        self.assertEqual(['1', '2'],
+                         [r['number'] for r in gq.iter_results(lines)])
+
+        # not covered by a mirrored scope
+        self.assertIsNone(gst.store_lines(self.config, ['project:a']))
+        self.assertIsNone(gst.store_lines(self.config,
+                                          ['status:open', 'file:x']))
+
+        # not the scope ANDed with other terms
+        self.store = gst.ChangeStore(self.config)
+        self.store.update(['project:a'], [_change(1, 'a', 'bob')],
+                          replace=True)
+        self.store.close()
+        self.assertIsNone(gst.store_lines(self.config,
+                                          ['NOT', 'project:a',
+                                           'status:open']))
+        self.assertIsNone(gst.store_lines(self.config,
+                                          ['(project:a', 'OR',
+                                           'project:b)']))
+        self.assertIsNone(gst.store_lines(self.config,
+                                          ['project:a',
+                                           'owner:bob OR owner:carol']))
+        self.assertIsNone(gst.store_lines(self.config,
+                                          ['owner:bob NOT', 'project:a']))
+        self.assertIsNotNone(gst.store_lines(self.config,
+                                             ['project:a', 'owner:self']))
+        self.assertIsNotNone(gst.store_lines(self.config,
+                                             ['project:a',
+                                              '(owner:bob OR owner:carol)']))
+
+        # too stale
+        self.config['mirror-staleness'] = -1
+        self.assertIsNone(gst.store_lines(self.config, ['status:open']))
@@ -0,0 +1,218 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+from gerrit_cli import gerrit_query as gq
+from gerrit_cli import gerrit_ssh
+from gerrit_cli import gerrit_sync as gs
+import json
+import os
+import shutil
+from six.moves import queue
+import tempfile
+import threading
+import time
+import unittest
+
+
+FAKE_SSH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'fake_ssh.py')
+
+
+def _change(number, updated=100):
+    ps = {'number': '1', 'revision': 'r%d' % number,
+          'approvals': [{'type': 'Code-Review', 'value': '1',
+                         'by': {'username': 'alice'}}]}
+    return {'number': str(number), 'status': 'NEW', 'open': True,
+            'subject': 's%d' % number, 'lastUpdated': updated,
+            'patchSets': [dict(ps)], 'currentPatchSet': dict(ps)}
+
+
+class testChangeMirror(unittest.TestCase):
+    def setUp(self):
+        super(testChangeMirror, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = {'host': 'review.example.com', 'port': 29418,
+                       'mirror-dir': self.tmpdir,
+                       'store': os.path.join(self.tmpdir, 'changes.db')}
+        self.mirror = gs.ChangeMirror(self.config, ['status:open'])
+        self.mirror.changes = {'1': _change(1), '2': _change(2, 200)}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(testChangeMirror, self).tearDown()
+
+    def testPatchsetCreated(self):
+        self.assertIsNone(self.mirror.apply(
+            {'type': 'patchset-created', 'eventCreatedOn': 300,
+             'change': {'number': 1},
+             'patchSet': {'number': 2, 'revision': 'x'}}))
+
+        change = self.mirror.changes['1']
+        self.assertEqual('x', change['currentPatchSet']['revision'])
+        self.assertEqual(2, len(change['patchSets']))
+        self.assertEqual(300, change['lastUpdated'])
+
+    def testCommentAdded(self):
+        self.mirror.apply(
+            {'type': 'comment-added', 'eventCreatedOn': 300,
+             'change': {'number': 1}, 'patchSet': {'number': '1'},
+             'author': {'username': 'alice'},
+             'approvals': [{'type': 'Code-Review', 'value': '2'},
+                           {'type': 'Verified', 'value': '1'}]})
+
+        approvals = self.mirror.changes['1']['currentPatchSet']['approvals']
+        self.assertEqual([('Code-Review', '2'), ('Verified', '1')],
+                         [(a['type'], a['value']) for a in approvals])
+        self.assertEqual('R:[0,0,0,0,1] W:[0,0,0] V:[0,0,0,1,0]',
+                         gq._format_state(
+                             self.mirror.changes['1']['currentPatchSet']))
+
+        # a zero vote removes it
+        self.mirror.apply(
+            {'type': 'comment-added', 'change': {'number': 1},
+             'patchSet': {'number': '1'}, 'author': {'username': 'alice'},
+             'approvals': [{'type': 'Code-Review', 'value': '0'}]})
+        approvals = self.mirror.changes['1']['currentPatchSet']['approvals']
+        self.assertEqual(['Verified'], [a['type'] for a in approvals])
+
+    def testCommentAddedLabels(self):
+        # votes change which changes match a query on labels
+        event = {'type': 'comment-added', 'change': {'number': 1},
+                 'patchSet': {'number': '1'}, 'author': {'username': 'bob'},
+                 'approvals': [{'type': 'Code-Review', 'value': '1'}]}
+        self.assertIsNone(self.mirror.apply(dict(event)))
+
+        mirror = gs.ChangeMirror(self.config,
+                                 ['status:open',
+                                  'NOT label:Code-Review>=-2,self'])
+        mirror.changes = {'1': _change(1)}
+        self.assertEqual('1', mirror.apply(dict(event)))
+        self.assertEqual('3', mirror.apply(dict(event, change={'number': 3})))
+        self.assertIsNone(mirror.apply(dict(event, approvals=[])))
+
+    def testStatus(self):
+        self.assertEqual('2', self.mirror.apply(
+            {'type': 'change-abandoned', 'change': {'number': 2}}))
+        self.assertEqual('ABANDONED', self.mirror.changes['2']['status'])
+        self.assertFalse(self.mirror.changes['2']['open'])
+
+    def testStatusNew(self):
+        # a change not mirrored may have come to match, say, status:merged
+        for etype in ['change-merged', 'change-abandoned']:
+            self.assertEqual('3', self.mirror.apply(
+                {'type': etype, 'change': {'number': 3}}))
+        self.assertFalse('3' in self.mirror.changes)
+
+    def testUnknown(self):
+        self.assertEqual('3', self.mirror.apply(
+            {'type': 'patchset-created', 'change': {'number': 3},
+             'patchSet': {'number': 1}}))
+        self.assertIsNone(self.mirror.apply(
+            {'type': 'comment-added', 'change': {'number': 3}}))
+        self.assertIsNone(self.mirror.apply({'type': 'ref-updated'}))
+
+    def testLines(self):
+        self.assertEqual(['2', '1'],
+                         [r.get('number') for r in
+                          gq.iter_results(self.mirror.lines())])
+
+    def testMirrorLines(self):
+        self.assertIsNone(gs.mirror_lines(self.config, ['status:open']))
+
+        self.mirror.save()
+        lines = gs.mirror_lines(self.config, ['status:open'])
+        self.assertEqual(2, len(list(gq.iter_results(lines))))
+
+        # too stale to use
+        old = time.time() - 600
+        os.utime(self.mirror.path, (old, old))
+        self.assertIsNone(gs.mirror_lines(self.config, ['status:open']))
+
+
+class testSync(unittest.TestCase):
+    def setUp(self):
+        super(testSync, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        output = os.path.join(self.tmpdir, 'output')
+        with open(output, 'w') as f:
+            f.write(json.dumps(_change(1)) + '\n')
+            f.write(json.dumps(_change(2)) + '\n')
+            f.write('{"type": "stats", "rowCount": 2}\n')
+
+        events = os.path.join(self.tmpdir, 'events')
+        with open(events, 'w') as f:
+            f.write(json.dumps({'type': 'patchset-created',
+                                'eventCreatedOn': 300,
+                                'change': {'number': 2},
+                                'patchSet': {'number': '2',
+                                             'revision': 'new'}}) + '\n')
+            f.write(json.dumps({'type': 'change-merged',
+                                'eventCreatedOn': 250,
+                                'change': {'number': 1}}) + '\n')
+
+        self.environ = dict(os.environ)
+        os.environ['FAKE_SSH_HANDSHAKE'] = '0'
+        os.environ['FAKE_SSH_OUTPUT'] = output
+        os.environ['FAKE_SSH_EVENTS'] = events
+        self.config = {'host': 'review.example.com', 'port': 29418,
+                       'ssh-command': FAKE_SSH,
+                       'ssh-control-dir': self.tmpdir,
+                       'mirror-dir': os.path.join(self.tmpdir, 'mirror'),
+                       'store': os.path.join(self.tmpdir, 'changes.db'),
+                       'mirror-reconcile': False}
+
+    def tearDown(self):
+        gerrit_ssh._close_masters()
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tmpdir)
+        super(testSync, self).tearDown()
+
+    def testSubscribedBeforeSeed(self):
+        # a change merged while the mirror is seeded isn't missed
+        subscribed = threading.Event()
+
+        class Session(object):
+            def __init__(self):
+                self.events = queue.Queue()
+
+            def stream_events(self):
+                subscribed.set()
+                for event in iter(self.events.get, None):
+                    yield json.dumps(event) + '\n'
+
+            def query_stream(self, query, **kwargs):
+                # sent, as a server would, only to those subscribed by now
+                if subscribed.wait(5):
+                    self.events.put({'type': 'change-merged',
+                                     'change': {'number': 1}})
+                self.events.put(None)
+                yield json.dumps(_change(1)) + '\n'
+                yield '{"type": "stats", "rowCount": 1}\n'
+
+        mirror = gs.ChangeMirror(self.config, ['status:open'])
+        gs._sync(mirror, Session(), self.config)
+        self.assertEqual('MERGED', mirror.changes['1']['status'])
+
+    def testSyncOnce(self):
+        gs.gerrit_sync(argparse.Namespace(query=['status:open'], once=True),
+                       self.config)
+
+        lines = gs.mirror_lines(self.config, ['status:open'])
+        reviews = list(gq.iter_results(lines))
+        self.assertEqual(['2', '1'], [r['number'] for r in reviews])
+        self.assertEqual('new', reviews[0]['currentPatchSet']['revision'])
+        self.assertEqual('MERGED', reviews[1]['status'])
@@ -0,0 +1,145 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from gerrit_cli import gerrit_table as gt
+from mock import patch
+import random
+import six
+import unittest
+
+
+SHOW = [{'name': 'number', 'colname': 'Number', 'align': 'r', 'length': 0},
+        {'name': 'subject', 'colname': 'Subject', 'align': 'l',
+         'length': 12},
+        {'name': 'state', 'colname': 'State', 'align': 'c', 'length': 0}]
+
+
+class testExternalSort(unittest.TestCase):
+    def testInMemory(self):
+        items = [random.randint(0, 100) for i in range(50)]
+        self.assertEqual(sorted(items), list(gt.external_sort(iter(items))))
+
+    def testRuns(self):
+        items = [(random.randint(0, 1000), ['x%d' % i]) for i in range(1000)]
+        with patch('tempfile.TemporaryFile',
+                   wraps=gt.tempfile.TemporaryFile) as spilled:
+            self.assertEqual(sorted(items),
+                             list(gt.external_sort(iter(items), 64)))
+        self.assertEqual(1000 // 64, spilled.call_count)
+
+    def testEmpty(self):
+        self.assertEqual([], list(gt.external_sort(iter([]))))
+
+    def testReversedRuns(self):
+        items = [random.randint(0, 1000) for i in range(1000)]
+        self.assertEqual(sorted(items, reverse=True),
+                         list(gt.external_sort(iter(items), 64, True)))
+
+
+class testSortRows(unittest.TestCase):
+    rows = [[3, 'a'], [1, 'b'], [None, 'c'], [3, 'd'], [2, 'e']]
+
+    def testSorted(self):
+        # stable, and rows without a value first
+        self.assertEqual(['c', 'b', 'e', 'a', 'd'],
+                         [r[1] for r in gt.sort_rows(iter(self.rows), 0)])
+        with patch.object(gt, '_RUN_ROWS', 2):
+            self.assertEqual(['a', 'd', 'e', 'b', 'c'],
+                             [r[1] for r in gt.sort_rows(iter(self.rows), 0,
+                                                         reverse=True)])
+
+    def testLimit(self):
+        self.assertEqual(['c', 'b'],
+                         [r[1] for r in gt.sort_rows(iter(self.rows), 0,
+                                                     limit=2)])
+        self.assertEqual(['a', 'd'],
+                         [r[1] for r in gt.sort_rows(iter(self.rows), 0,
+                                                     reverse=True, limit=2)])
+
+    def testKey(self):
+        self.assertEqual(['e', 'd', 'c', 'b', 'a'],
+                         [r[1] for r in gt.sort_rows(
+                             iter(self.rows), 1, key=lambda v: -ord(v))])
+
+
+class testRenderTable(unittest.TestCase):
+    def _render(self, rows, sortby=0, **kwargs):
+        out = six.StringIO()
+        gt.render_table(out, SHOW, iter(rows), sortby, **kwargs)
+        return out.getvalue()
+
+    def testSorted(self):
+        self.assertEqual('+--------+-----------+-------+\n'
+                         '| Number | Subject   | State |\n'
+                         '+--------+-----------+-------+\n'
+                         '|      2 | two       |   yy  |\n'
+                         '|     10 | ten lines |   x   |\n'
+                         '+--------+-----------+-------+\n',
+                         self._render([[10, 'ten\nlines', 'x'],
+                                       [2, 'two', 'yy']]))
+
+    def testEmpty(self):
+        self.assertEqual('+--------+---------+-------+\n'
+                         '| Number | Subject | State |\n'
+                         '+--------+---------+-------+\n'
+                         '+--------+---------+-------+\n',
+                         self._render([]))
+
+    def testSortedNone(self):
+        table = self._render([[2, 'two', 'a'], [None, 'none', 'b']])
+        self.assertLess(table.index('none'), table.index('two'))
+
+    def testSortedRuns(self):
+        # the same table whether or not the sort spills to disk
+        rows = [[random.randint(0, 500), 's' * random.randint(0, 12), 'x']
+                for i in range(300)]
+        table = self._render(rows)
+        with patch.object(gt, '_RUN_ROWS', 16):
+            self.assertEqual(table, self._render(rows))
+
+    def testStreamed(self):
+        # unsorted rows are drawn before the last of them is produced
+        out = six.StringIO()
+
+        def rows():
+            yield [1, 'one', 'x']
+            self.assertIn('| one ', out.getvalue())
+            yield [2, 'two', 'x']
+
+        with patch.object(gt, '_SAMPLE_ROWS', 1):
+            gt.render_table(out, SHOW, rows())
+        self.assertEqual(6, len(out.getvalue().splitlines()))
+
+    def testLimit(self):
+        # the columns are as wide as the rows drawn need
+        lines = self._render([[3, 'three', 'x'],
+                              [1, 'a much longer subject', 'x'],
+                              [2, 'two', 'x']],
+                             sortby=0, reverse=True, limit=2).splitlines()
+        self.assertEqual(['|      3 | three   |   x   |',
+                          '|      2 | two     |   x   |'], lines[3:5])
+        self.assertEqual(6, len(lines))
+
+    def testSampledWidths(self):
+        # with more rows than are sampled, a column is as wide as its
+        # length, and wider values later on are truncated.
+        with patch.object(gt, '_SAMPLE_ROWS', 1):
+            lines = self._render([[1, 'one', 'x'],
+                                  [22222222, 'two', 'yyyyy']],
+                                 sortby=None).splitlines()
+
+        self.assertEqual('| Number | Subject      | State |', lines[1])
+        self.assertEqual('|      1 | one          |   x   |', lines[3])
+        self.assertEqual('| 222... | two          | yyyyy |', lines[4])
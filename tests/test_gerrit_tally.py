@@ -0,0 +1,116 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from gerrit_cli import gerrit_query as gq
+from gerrit_cli import gerrit_tally as gt
+from mock import patch
+import unittest
+
+
+def _votes(*votes):
+    return [{'type': t, 'value': v} for t, v in votes]
+
+
+class testTally(unittest.TestCase):
+    def setUp(self):
+        self.votes = [_votes(('Code-Review', '2'), ('Code-Review', '-1'),
+                             ('Verified', '1'), ('Workflow', '1')),
+                      None,
+                      [],
+                      _votes(('Code-Review', '1'), ('Rollcall-Vote', '1'),
+                             ('Backport-Candidate', '1'),
+                             ('Backport-Candidate', '-1'),
+                             ('Alpha', '0'))]
+        self.states = ['R:[0,1,0,0,1] W:[0,0,1] V:[0,0,0,1,0]',
+                       'None',
+                       'R:[0,0,0,0,0] W:[0,0,0] V:[0,0,0,0,0]',
+                       'R:[0,0,0,1,0] W:[0,0,0] V:[0,0,0,0,0] '
+                       'Alpha:[0,0,1,0,0] Backport-Candidate:[0,1,0,1,0]']
+        super(testTally, self).setUp()
+
+    def tearDown(self):
+        super(testTally, self).tearDown()
+
+    def testFormatStates(self):
+        # without numpy both are the array path
+        for use_numpy in [True, False]:
+            self.assertEqual(self.states,
+                             gt.format_states(self.votes, use_numpy))
+
+    def testWithoutNumpy(self):
+        with patch.object(gt, '_load_numpy', return_value=None):
+            self.assertEqual(self.states, gt.format_states(self.votes))
+
+    def testCount(self):
+        for use_numpy in [True, False]:
+            tallies = gt.tally(self.votes, use_numpy)
+            self.assertEqual([0, 1, 0, 0, 1],
+                             tallies.count(0, 'Code-Review'))
+            self.assertEqual([0, 1, 0, 1, 0],
+                             tallies.count(3, 'Backport-Candidate'))
+            self.assertEqual([0, 0, 0, 0, 0], tallies.count(0, 'Alpha'))
+            self.assertIsNone(tallies.count(0, 'Rollcall-Vote'))
+
+    def testOutOfRange(self):
+        # a vote outside the usual range widens the label for the batch
+        for use_numpy in [True, False]:
+            self.assertEqual(['R:[0,0,0,0,0,1] W:[0,0,0] V:[0,0,0,0,0]',
+                              'R:[0,0,0,1,0,0] W:[0,0,0] V:[0,0,0,0,0]'],
+                             gt.format_states([_votes(('Code-Review', '3')),
+                                               _votes(('Code-Review', '1'))],
+                                              use_numpy))
+
+    def testOtherLabels(self):
+        # the same vote reads the same whatever else is in the batch
+        for use_numpy in [True, False]:
+            states = gt.format_states([_votes(('Backport', '1')),
+                                       _votes(('Backport', '2')),
+                                       _votes(('Backport', '-2'))],
+                                      use_numpy)
+            self.assertEqual(['Backport:[0,0,0,1,0]',
+                              'Backport:[0,0,0,0,1]',
+                              'Backport:[1,0,0,0,0]'],
+                             [st.split(' ')[-1] for st in states])
+            self.assertEqual('Backport:[0,0,0,1,0]', gt.format_states(
+                [_votes(('Backport', '1'))], use_numpy)[0].split(' ')[-1])
+
+    @unittest.skipIf(gt._load_numpy() is None, "numpy is not installed")
+    def testDistinct(self):
+        # rows too wide to compare as a single integer
+        rows = gt.numpy.array([[2 ** 40, 1], [0, 2 ** 40], [2 ** 40, 1]])
+        distinct, index = gt._distinct(rows)
+        self.assertEqual([distinct[i] for i in index], rows.tolist())
+        self.assertEqual(2, len(distinct))
+
+    def testEmpty(self):
+        self.assertEqual([], gt.format_states([]))
+
+    def testFormatState(self):
+        self.assertEqual('R:[0,0,0,0,1] W:[0,0,0] V:[0,0,0,0,0] '
+                         'Other:[0,0,0,1,0]',
+                         gq._format_state({'approvals': [
+                             {'type': 'Code-Review', 'value': '2'},
+                             {'type': 'Other', 'value': '1'}]}))
+
+    def testIterOutput(self):
+        lines = ['{"number": "%d", "currentPatchSet": {"approvals": '
+                 '[{"type": "Verified", "value": "%d"}]}}' % (i, i % 2)
+                 for i in range(5)] + ['{"rowCount": 5}']
+        show = gq.construct_show(['number', 'state'], None)
+
+        self.assertEqual([[i, 'R:[0,0,0,0,0] W:[0,0,0] V:[0,0,%s]' %
+                           ('0,1,0' if i % 2 else '1,0,0')]
+                          for i in range(5)],
+                         list(gq.iter_output(lines, show, batch=2)))
@@ -0,0 +1,106 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from gerrit_cli import gerrit_query as gq
+from gerrit_cli import gerrit_union as gu
+import json
+from mock import patch
+import unittest
+
+
+def _lines(numbers):
+    return [json.dumps({'number': str(n)}) + '\n' for n in numbers] + [
+        json.dumps({'type': 'stats', 'rowCount': len(numbers)}) + '\n']
+
+
+def _tagged(name, numbers):
+    return [(name, line) for line in _lines(numbers)]
+
+
+class testPlan(unittest.TestCase):
+    def testPlan(self):
+        self.assertEqual('or', gu.plan([None]))
+        self.assertEqual('or', gu.plan([10, 20]))
+        self.assertEqual('merge', gu.plan([10, None]))
+        self.assertEqual('merge', gu.plan([400, 200]))
+        self.assertEqual('or', gu.plan([400, 200], limit=1000))
+
+
+class testMergeLines(unittest.TestCase):
+    def _merge(self, tagged, names=('a', 'b'), limit=None):
+        return [r.get('number') for r in gq.iter_results(
+            gu.merge_lines(tagged, list(names), limit))]
+
+    def testMerge(self):
+        tagged = _tagged('a', [1, 2, 3]) + _tagged('b', [3, 4])
+        self.assertEqual(['1', '2', '3', '4'], self._merge(tagged))
+
+    def testInterleaved(self):
+        a = _tagged('a', [1, 2])
+        b = _tagged('b', [2, 1, 5])
+        tagged = [a[0], b[0], b[1], a[1], b[2], a[2], b[3]]
+        self.assertEqual(['1', '2', '5'], self._merge(tagged))
+
+    def testLimit(self):
+        tagged = _tagged('a', [1, 2, 3]) + _tagged('b', [3, 4])
+        self.assertEqual(['1', '2'], self._merge(tagged, limit=2))
+
+    def testMismatch(self):
+        tagged = _tagged('a', [1, 2])
+        del tagged[0]
+        self.assertRaises(Exception, self._merge, tagged, ['a'])
+
+    def testMissing(self):
+        # b failed, and never reported how many rows it had
+        tagged = _tagged('a', [1, 2])
+        self.assertRaises(Exception, self._merge, tagged)
+
+
+class testUnionLines(unittest.TestCase):
+    def setUp(self):
+        super(testUnionLines, self).setUp()
+        self.results = {'a': [1, 2], 'b': [2, 3]}
+        self.queries = []
+
+    def _lines(self, config, query):
+        self.queries.append(query)
+        if query[0].startswith('('):
+            return _lines([1, 2, 3])
+        return _lines(self.results[query[0]])
+
+    def _union(self, config, rows=None):
+        with patch.object(gu.QueryCache, 'rows', side_effect=rows):
+            lines = gu.union_lines(config, [['a'], ['b'], ['a']], {},
+                                   self._lines)
+            return [r.get('number') for r in gq.iter_results(lines)]
+
+    def testOr(self):
+        self.assertEqual(['1', '2', '3'], self._union({}, [2, 2]))
+        self.assertEqual([['((a) OR (b))']], self.queries)
+
+    def testMerge(self):
+        self.assertEqual(['1', '2', '3'],
+                         sorted(self._union({}, [None, 2])))
+        self.assertEqual([['a'], ['b']], sorted(self.queries))
+
+    def testForced(self):
+        self.assertEqual(['1', '2', '3'],
+                         sorted(self._union({'union-plan': 'merge'})))
+        self.assertEqual(2, len(self.queries))
+
+        self._union({'union-plan': 'or'})
+        self.assertEqual(['((a) OR (b))'], self.queries[-1])
+
+        self.assertRaises(Exception, self._union, {'union-plan': 'xyz'})
@@ -0,0 +1,159 @@
+# Copyright 2016 Amrith Kumar
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+from gerrit_cli import gerrit_ssh
+from gerrit_cli import gerrit_update as gu
+from mock import patch
+import threading
+import time
+import unittest
+
+
+class testRunParallel(unittest.TestCase):
+    def setUp(self):
+        super(testRunParallel, self).setUp()
+
+    def tearDown(self):
+        super(testRunParallel, self).tearDown()
+
+    def testOrdered(self):
+        # later items finish first, results still come back in order
+        def fn(i):
+            time.sleep(0.01 * (5 - i))
+            return i * i
+
+        self.assertEqual([(i, i * i) for i in range(5)],
+                         list(gu._run_parallel(fn, range(5), 5)))
+
+    def testBounded(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+
+        def fn(i):
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+            return i
+
+        self.assertEqual(list(range(20)),
+                         [r for i, r in gu._run_parallel(fn, range(20), 3)])
+        self.assertTrue(state['peak'] <= 3)
+
+    def testException(self):
+        def fn(i):
+            if i == 1:
+                raise Exception("bad")
+            return i
+
+        results = list(gu._run_parallel(fn, range(3), 2))
+        self.assertEqual(0, results[0][1])
+        self.assertTrue(isinstance(results[1][1], Exception))
+        self.assertEqual(2, results[2][1])
+
+    def testEmpty(self):
+        self.assertEqual([], list(gu._run_parallel(lambda i: i, [], 4)))
+
+
+class testDoChange(unittest.TestCase):
+    def setUp(self):
+        self.output = '\n'.join(
+            ['{"number": "%d", "subject": "s%d", "patchSets": '
+             '[{"number": "1", "revision": "c%d"}]}' % (i, i, i)
+             for i in range(1, 4)] + ['{"rowCount": "3"}'])
+        super(testDoChange, self).setUp()
+
+    def tearDown(self):
+        super(testDoChange, self).tearDown()
+
+    def _args(self, parallel, chunk_size=None):
+        return argparse.Namespace(query=['abc'], comment=['pqr'],
+                                  review=None, workflow=None,
+                                  parallel=parallel, chunk_size=chunk_size)
+
+    def _review(self, targets, message, review, workflow, extra=None,
+                keys=None):
+        return [(1, "", "no") if t == 'c2' else (0, "", "")
+                for t in targets]
+
+    def testAbandon(self):
+        with patch.object(gu, 'open_session') as ssh:
+            session = ssh.return_value
+            session.query.return_value = (self.output, "")
+            session.review.side_effect = self._review
+
+            self.assertEqual(['2,1'], gu._do_change(self._args(4), {},
+                                                    'abandon'))
+            session.review.assert_called_once_with(
+                ['c1', 'c2', 'c3'], ['pqr'], None, None, '--abandon',
+                keys=[['c1', 1, '1,1'], ['c2', 2, '2,1'], ['c3', 3, '3,1']])
+
+    def testChunks(self):
+        with patch.object(gu, 'open_session') as ssh:
+            session = ssh.return_value
+            session.query.return_value = (self.output, "")
+            session.review.side_effect = self._review
+
+            self.assertEqual(['2,1'], gu._do_change(self._args(2, 2), {},
+                                                    'restore'))
+            self.assertEqual([['c1', 'c2'], ['c3']],
+                             [c[0][0] for c in
+                              session.review.call_args_list])
+
+    def testRecheck(self):
+        with patch.object(gu, 'open_session') as ssh:
+            session = ssh.return_value
+            session.query.return_value = (self.output, "")
+            session.review.side_effect = self._review
+
+            gu._do_change(self._args(1, 1), {'review-chunk-size': 5},
+                          'recheck')
+            self.assertEqual(3, session.review.call_count)
+            self.assertEqual((['c3'], ['recheck'], None, None, None),
+                             session.review.call_args[0])
+
+    def testCircuitOpen(self):
+        # once the server has turned away enough chunks, the rest aren't
+        # sent, and fail
+        session = gerrit_ssh.GerritSSH({'host': 'review.example.com',
+                                        'port': 29418, 'ssh-retries': 0,
+                                        'ssh-breaker-threshold': 1})
+        with patch.object(gu, 'open_session', return_value=session), \
+                patch.object(session, 'query',
+                             return_value=(self.output, "")), \
+                patch.object(session, '_execute',
+                             return_value=(255, "", "Connection refused")
+                             ) as execute:
+            self.assertEqual(['1,1', '2,1', '3,1'],
+                             gu._do_change(self._args(1, 1), {}, 'abandon'))
+        self.assertEqual(1, execute.call_count)
+
+    def testExitStatus(self):
+        # any change failing fails the command
+        with patch.object(gu, '_do_change', return_value=['2,1']):
+            for fn in [gu.gerrit_update, gu.gerrit_recheck,
+                       gu.gerrit_abandon, gu.gerrit_restore]:
+                with self.assertRaises(SystemExit) as e:
+                    fn(self._args(1), {})
+                self.assertEqual(1, e.exception.code)
+
+        with patch.object(gu, '_do_change', return_value=[]):
+            gu.gerrit_abandon(self._args(1), {})
+
+    def testUnknown(self):
+        self.assertRaises(Exception, gu._do_change, self._args(1), {}, 'xyz')